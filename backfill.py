@@ -0,0 +1,272 @@
+"""历史回填：用 arXiv 元数据快照（JSON lines 格式）筛选过去一段时间的论文
+
+逐行流式读取快照文件，在进程池中解析并按分类和日期过滤，
+再按批送入与每日筛选相同的预筛选、推理缓存和 BatchInference 流程，
+结果按提交日期写入结果库，并导出对应日期的 arxiv_updates/<日期>.json。
+每处理完一批就记录快照文件的读取位置，中断后可用 --resume 从上次的位置继续。
+推理失败的论文在同一批内重试，仍然失败的保存在检查点中，和下一批（或下次 --resume）一起重新筛选。
+
+示例:
+    python backfill.py arxiv-metadata-oai-snapshot.json --start-date 2025-01-01 --end-date 2025-03-31
+"""
+import argparse
+import gzip
+import json
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+from logger import setup_logger
+
+logger = setup_logger(__name__)
+
+ARXIV_UPDATES_DIR = "arxiv_updates"
+CHECKPOINT_FILE = os.path.join(ARXIV_UPDATES_DIR, "backfill_checkpoint.json")
+CHUNK_LINES = 2000  # 每个解析任务包含的行数
+FAILED_RETRY_ROUNDS = 2  # 每批中推理失败的论文在写入检查点前的重试轮数
+VERSION_TIME_FORMAT = "%a, %d %b %Y %H:%M:%S %Z"  # 快照中 versions[].created 的格式
+RSS_TIME_FORMAT = "%a, %d %b %Y %H:%M:%S +0000"
+
+def feed_categories(rss_url: str) -> List[str]:
+    """从 arXiv RSS 地址（如 https://rss.arxiv.org/rss/cs.SD+eess.AS）中取出分类"""
+    return rss_url.rstrip("/").rsplit("/", 1)[-1].split("+")
+
+def parse_record(record: dict) -> Optional[dict]:
+    """将快照中的一条记录转换为与RSS条目相同的格式，缺少必要字段时返回 None"""
+    versions = record.get("versions") or []
+    if not versions or not record.get("abstract"):
+        return None
+    try:
+        submitted = datetime.strptime(versions[0]["created"], VERSION_TIME_FORMAT)
+    except (KeyError, ValueError):
+        return None
+    arxiv_id = record["id"]
+    version = versions[-1].get("version", "v1")
+    abstract = " ".join(record["abstract"].split())
+    return {
+        "id": f"oai:arXiv.org:{arxiv_id}{version}",
+        "title": " ".join(record.get("title", "").split()),
+        "link": f"https://arxiv.org/abs/{arxiv_id}",
+        "author": " ".join(record.get("authors", "").split()),
+        "published": submitted.strftime(RSS_TIME_FORMAT),
+        "summary": f"arXiv:{arxiv_id}{version} Announce Type: new \nAbstract: {abstract}",
+        "announce_type": "new",
+        "version": int(version.lstrip("v") or 1),
+        "categories": record.get("categories", "").split(),
+        "date": submitted.strftime("%Y-%m-%d")
+    }
+
+def parse_chunk(lines: List[bytes], categories: frozenset, start_date: str, end_date: str) -> List[dict]:
+    """在子进程中解析一批行，只返回分类和日期都符合条件的条目"""
+    entries = []
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        # 先用原始字段粗筛，避免为不相关的记录构造条目
+        if not categories.intersection(record.get("categories", "").split()):
+            continue
+        entry = parse_record(record)
+        if entry is not None and start_date <= entry["date"] <= end_date:
+            entries.append(entry)
+    return entries
+
+def open_dump(path: str) -> BinaryIO:
+    """以二进制方式打开快照文件，支持 gzip 压缩"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+def read_chunks(f: BinaryIO, chunk_lines: int) -> Iterator[Tuple[List[bytes], int]]:
+    """按行数切分文件，同时返回每块结束时的读取位置"""
+    lines = []
+    while True:
+        line = f.readline()
+        if not line:
+            break
+        lines.append(line)
+        if len(lines) >= chunk_lines:
+            yield lines, f.tell()
+            lines = []
+    if lines:
+        yield lines, f.tell()
+
+def iter_batches(
+    path: str,
+    offset: int,
+    categories: frozenset,
+    start_date: str,
+    end_date: str,
+    workers: int,
+    batch_size: int
+) -> Iterator[Tuple[List[dict], int]]:
+    """流式解析快照文件，按批返回 (符合条件的条目, 该批结束时的读取位置)
+
+    同时在进程池中解析的块数不超过 2 * workers，内存占用与快照大小无关。
+    """
+    with open_dump(path) as f, ProcessPoolExecutor(max_workers=workers) as executor:
+        f.seek(offset)
+        in_flight = deque()
+        batch: List[dict] = []
+        chunks = read_chunks(f, CHUNK_LINES)
+        exhausted = False
+        while True:
+            while not exhausted and len(in_flight) < 2 * workers:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                    break
+                lines, end_offset = chunk
+                in_flight.append((executor.submit(parse_chunk, lines, categories, start_date, end_date), end_offset))
+            if not in_flight:
+                break
+            # 按提交顺序取回结果，保证记录的读取位置单调递增
+            future, end_offset = in_flight.popleft()
+            batch.extend(future.result())
+            if len(batch) >= batch_size:
+                yield batch, end_offset
+                batch = []
+            elif exhausted and not in_flight:
+                yield batch, end_offset
+                batch = []
+
+def load_checkpoint(params: dict) -> Tuple[int, int, List[dict]]:
+    """读取上次回填的 (读取位置, 已处理论文数, 推理失败的条目)，参数不一致时从头开始"""
+    if not os.path.exists(CHECKPOINT_FILE):
+        return 0, 0, []
+    with open(CHECKPOINT_FILE, 'r', encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    if checkpoint.get("params") != params:
+        logger.warning("检查点的参数与本次回填不一致，从头开始")
+        return 0, 0, []
+    failed = checkpoint.get("failed", [])
+    logger.info(f"从检查点继续: 已处理 {checkpoint['processed']} 篇论文，其中 {len(failed)} 篇推理失败待重试")
+    return checkpoint["offset"], checkpoint["processed"], failed
+
+def save_checkpoint(params: dict, offset: int, processed: int, failed: List[dict]) -> None:
+    temp_file = CHECKPOINT_FILE + ".tmp"
+    with open(temp_file, 'w', encoding='utf-8') as f:
+        json.dump({"params": params, "offset": offset, "processed": processed, "failed": failed}, f)
+    os.replace(temp_file, CHECKPOINT_FILE)
+
+async def run_backfill(args: argparse.Namespace) -> None:
+    """执行回填，模型相关的模块在这里才导入"""
+    from config import check_api_config
+    from inference_cache import InferenceCache
+    from result_store import ResultStore
+    from run_filter import stream_results
+    from response_parser import is_related
+    from subscriptions import SubscriptionRegistry
+    from utils import extract_arxiv_id
+
+    check_api_config()
+    os.makedirs(ARXIV_UPDATES_DIR, exist_ok=True)
+    interest_items = SubscriptionRegistry.load().interest_items()
+    if args.feed:
+        interest_items = [item for item in interest_items if item["rss_url"] in args.feed]
+    if not interest_items:
+        logger.error("没有需要回填的订阅")
+        return
+
+    categories_by_feed = {item["rss_url"]: set(feed_categories(item["rss_url"])) for item in interest_items}
+    if args.categories:
+        categories_by_feed = {feed_url: categories & set(args.categories) for feed_url, categories in categories_by_feed.items()}
+    all_categories = frozenset().union(*categories_by_feed.values())
+    params = {
+        "dump": os.path.abspath(args.dump),
+        "start_date": args.start_date,
+        "end_date": args.end_date,
+        "categories": sorted(all_categories),
+        "interests": sorted(f"{item['rss_url']}|{item['area_interest']}" for item in interest_items)
+    }
+    offset, processed, failed = load_checkpoint(params) if args.resume else (0, 0, [])
+
+    inference_cache = InferenceCache()
+    inference_cache.load()
+    result_store = ResultStore()
+
+    async def classify(entries: List[dict]) -> Tuple[List[Tuple[str, str, dict]], List[dict]]:
+        """筛选一批条目，推理失败的论文最多重试 FAILED_RETRY_ROUNDS 轮
+
+        Returns:
+            (要写入结果库的结果, 重试后仍然失败的条目)
+        """
+        results: Dict[Tuple[str, str, str], Tuple[str, str, dict]] = {}
+        for round_index in range(FAILED_RETRY_ROUNDS + 1):
+            # 按 feed 的分类分发条目，交叉列表的论文会同时出现在多个 feed 中
+            batch_cache: Dict[str, dict] = {}
+            for entry in entries:
+                for feed_url, categories in categories_by_feed.items():
+                    if categories.intersection(entry["categories"]):
+                        batch_cache.setdefault(feed_url, {"entries": []})["entries"].append(entry)
+
+            # 重试时同一 feed 下已成功的研究兴趣直接命中推理缓存，结果按 (feed, 研究兴趣, 论文) 覆盖
+            failed_ids = set()
+            async for rss_url, user_interest, res in stream_results(batch_cache, interest_items, inference_cache, None, False):
+                arxiv_id = extract_arxiv_id(res["id"])
+                if res.get("failed") or res.get("success") is not True:
+                    failed_ids.add(arxiv_id)
+                if not res.get("failed"):
+                    results[(rss_url, user_interest, arxiv_id)] = (rss_url, user_interest, res)
+            entries = [entry for entry in entries if extract_arxiv_id(entry["id"]) in failed_ids]
+            if not entries:
+                break
+            if round_index < FAILED_RETRY_ROUNDS:
+                logger.warning(f"回填: {len(entries)} 篇论文推理失败，第 {round_index + 1} 次重试")
+        return list(results.values()), entries
+
+    async def process(entries: List[dict], end_offset: int, new_entries: int) -> List[dict]:
+        """筛选并写入一批条目，再记录检查点，返回仍然失败、留给下一批的条目"""
+        nonlocal processed
+        rows, still_failed = await classify(entries)
+
+        # 按提交日期分组，每批每个日期在一个事务中写入结果库
+        results: Dict[str, List[Tuple[str, str, dict]]] = {}
+        for row in rows:
+            results.setdefault(row[2]["date"], []).append(row)
+        # 先写结果和缓存，再记录检查点，中断时最多重做一批
+        for date, date_rows in results.items():
+            result_store.write_results(date, date_rows)
+            result_store.export_json(date)
+        inference_cache.save()
+        processed += new_entries
+        save_checkpoint(params, end_offset, processed, still_failed)
+        related_count = sum(is_related(res) for _, _, res in rows)
+        logger.info(f"回填进度: 本批 {len(entries)} 篇，相关 {related_count} 篇，仍失败 {len(still_failed)} 篇，累计 {processed} 篇")
+        return still_failed
+
+    try:
+        # 检查点中推理失败的论文先重新筛选，仍然失败的和之后的每一批一起重试
+        if failed:
+            failed = await process(failed, offset, 0)
+        batches = iter_batches(args.dump, offset, all_categories, args.start_date, args.end_date, args.workers, args.batch_size)
+        for entries, end_offset in batches:
+            failed = await process(failed + entries, end_offset, len(entries))
+    finally:
+        result_store.close()
+
+    if failed:
+        logger.warning(f"{len(failed)} 篇论文多次推理失败，已保存在检查点中，可用 --resume 重试")
+    logger.info(f"回填完成，共处理 {processed} 篇论文")
+
+def add_backfill_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("dump", help="arXiv 元数据快照文件（JSON lines，可以是 .gz）")
+    parser.add_argument("--start-date", required=True, help="起始提交日期（含），格式 YYYY-MM-DD")
+    parser.add_argument("--end-date", default=datetime.now().strftime("%Y-%m-%d"), help="结束提交日期（含），默认今天")
+    parser.add_argument("--categories", nargs="+", help="只回填这些分类，默认使用订阅 feed 的全部分类")
+    parser.add_argument("--feed", action="append", help="只回填这些 feed 的订阅，可重复")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="解析快照的进程数")
+    parser.add_argument("--batch-size", type=int, default=5000, help="每批送入筛选的论文数，每批完成后记录一次检查点")
+    parser.add_argument("--resume", action="store_true", help="从上次回填的检查点继续")
+
+def main(argv=None) -> None:
+    import asyncio
+
+    parser = argparse.ArgumentParser(description="用 arXiv 元数据快照回填历史筛选结果")
+    add_backfill_arguments(parser)
+    asyncio.run(run_backfill(parser.parse_args(argv)))
+
+if __name__ == "__main__":
+    main()
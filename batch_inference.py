@@ -1,26 +1,329 @@
 import asyncio
 import sys
 import json
+import time
 from datetime import datetime
 import uvloop
 from volcenginesdkarkruntime import AsyncArk
-from typing import List, Optional
-from config import API_KEY, BASE_URL, MODEL_NAME
+from typing import Awaitable, AsyncIterable, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple, Type, Union
+from pydantic import BaseModel
+from config import (
+    API_KEY, BASE_URL, MODEL_NAME, MAX_CONCURRENCY, INITIAL_CONCURRENCY,
+    REQUESTS_PER_SECOND, TOKENS_PER_MINUTE, LATENCY_THRESHOLD, MICRO_BATCH_SIZE, MICRO_BATCH_MAX_TOKENS,
+    PACKED_PROMPT_SUFFIX, GATE_MODEL_NAME, GATE_MAX_TOKENS, GATE_MAX_CONCURRENCY, SUMMARY_MAX_CONCURRENCY,
+    PROMPT_TOKEN_PRICE, COMPLETION_TOKEN_PRICE, CACHED_PROMPT_TOKEN_PRICE,
+    HEDGE_ENABLED, HEDGE_QUANTILE, HEDGE_MIN_SAMPLES, HEDGE_MAX_RATIO, PARSE_RETRY_LIMIT, REASK_PROMPT_SUFFIX, check_api_config
+)
 from logger import setup_logger
-from utils import save_results
+from inference_cache import hash_text
+from journal import InferenceJournal
+from metrics import CallMetrics
+from prefix_cache import PrefixCache, prefix_contexts
+from response_parser import (
+    GateDecision, PaperSummary, ResponseFormats, ResponseParseError,
+    extract_json, is_related, parse_response, response_formats, validate_response
+)
+from tracing import tracer
+from scheduler import Deadline, RequestScheduler, estimate_tokens, is_transient_error, backoff_delay
+from utils import replace_placeholder_in_prompt
 # 配置日志
 logger = setup_logger(__name__)
 
+def create_ark_client() -> AsyncArk:
+    """创建方舟 API 客户端"""
+    check_api_config()
+    return AsyncArk(
+        api_key=API_KEY,
+        base_url=BASE_URL
+    )
+
+async def as_async_iterable(items: Union[Iterable, AsyncIterable]) -> AsyncIterator:
+    """将普通可迭代对象统一包装为异步迭代器"""
+    if hasattr(items, "__aiter__"):
+        async for item in items:
+            yield item
+    else:
+        for item in items:
+            yield item
+
+# 创建模型客户端的工厂函数，基准测试时替换为本地模拟客户端（见 mock_ark.py）
+client_factory = create_ark_client
+
+def parse_packed_response(result: str, paper_ids: List[str], response_model: Optional[Type[BaseModel]] = None) -> Tuple[dict, bool]:
+    """解析打包请求的回复
+
+    Returns:
+        ({论文编号: 校验后的结果字典}, 是否经过提取或修复)。无法解析时为空字典，格式不符的论文不包含在内
+    """
+    try:
+        parsed, repaired = extract_json(result)
+    except ResponseParseError as e:
+        logger.error(f"Failed to parse packed response: {e}")
+        return {}, False
+    if isinstance(parsed, dict):
+        parsed = [{**value, "paperId": key} for key, value in parsed.items() if isinstance(value, dict)]
+    if not isinstance(parsed, list):
+        return {}, repaired
+    results = {}
+    for element in parsed:
+        if isinstance(element, dict) and element.get("paperId") in paper_ids:
+            paper_id = element.pop("paperId")
+            try:
+                results[paper_id] = validate_response(element, response_model)
+            except ResponseParseError as e:
+                logger.warning(f"Packed response for {paper_id} is invalid: {e}")
+    return results, repaired
+
+async def queue_items(queue: asyncio.Queue, deadline: Deadline) -> AsyncIterator:
+    """依次取出队列中的元素，直到取到结束标记 None
+
+    到达截止时间后不再等待，只取出已经在队列中的元素。
+    """
+    while True:
+        try:
+            item = await asyncio.wait_for(queue.get(), deadline.remaining())
+        except asyncio.TimeoutError:
+            break
+        if item is None:
+            return
+        yield item
+    while not queue.empty():
+        item = queue.get_nowait()
+        if item is None:
+            return
+        yield item
+
+def cached_prompt_tokens(usage) -> int:
+    """返回回复用量中命中前缀缓存的输入 token 数"""
+    details = getattr(usage, "prompt_tokens_details", None)
+    return getattr(details, "cached_tokens", None) or 0
+
+def create_scheduler(max_concurrency: int = MAX_CONCURRENCY) -> RequestScheduler:
+    """按配置创建请求调度器，多个推理任务可以共用同一个调度器"""
+    return RequestScheduler(
+        max_concurrency=max_concurrency,
+        initial_concurrency=min(INITIAL_CONCURRENCY, max_concurrency),
+        requests_per_second=REQUESTS_PER_SECOND,
+        tokens_per_minute=TOKENS_PER_MINUTE,
+        latency_threshold=LATENCY_THRESHOLD,
+        hedge_quantile=HEDGE_QUANTILE if HEDGE_ENABLED else None,
+        hedge_min_samples=HEDGE_MIN_SAMPLES,
+        hedge_max_ratio=HEDGE_MAX_RATIO
+    )
+
 class BatchInference:
     """批量推理处理类"""
     
-    def __init__(self):
-        """初始化 OpenAI 客户端"""
-        self.client = AsyncArk(
-            api_key=API_KEY,
-            base_url=BASE_URL
+    def __init__(
+        self,
+        journal: Optional[InferenceJournal] = None,
+        model_name: str = MODEL_NAME,
+        temperature: float = 0.8,
+        max_tokens: Optional[int] = None,
+        max_concurrency: int = MAX_CONCURRENCY,
+        stage_name: str = "main",
+        labels: Optional[Dict[str, str]] = None,
+        scheduler: Optional[RequestScheduler] = None,
+        prefix_cache: Optional[PrefixCache] = None,
+        deadline: Optional[Deadline] = None,
+        response_model: Optional[Type[BaseModel]] = None,
+        response_format_support: Optional[ResponseFormats] = None
+    ):
+        """初始化 OpenAI 客户端
+
+        Args:
+            journal: 推理日志，传入时每完成一个任务立即写入，并跳过日志中已完成的任务
+            model_name: 使用的模型
+            temperature: 采样温度
+            max_tokens: 单次输出的 token 上限，None 表示使用服务端默认值
+            max_concurrency: 并发请求上限
+            stage_name: 推理阶段名称，用于日志和统计
+            labels: 附加的指标标签，如 feed 和研究兴趣，同时作为共用调度器时的公平调度分组
+            scheduler: 共用的请求调度器，None 时单独创建
+            prefix_cache: 服务端前缀缓存，None 时使用全局的 prefix_contexts
+            deadline: 运行截止时间，到时 stream_tasks 停止发送请求，不再产出未完成的任务
+            response_model: 校验单篇论文回复的 pydantic 模型，None 时只要求回复是 JSON 对象
+            response_format_support: 各模型是否支持 response_format，None 时使用全局的 response_formats
+        """
+        self.client = client_factory()
+        self.model_name = model_name
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.stage_name = stage_name
+        self.max_concurrency = max_concurrency
+        self.queue_size = 2 * max_concurrency  # 待处理队列长度上限
+        self.max_completion_tokens = max_tokens or 512  # 预估单次输出的 token 数，用于 TPM 限流预扣
+        self.max_retries = 5  # 临时错误的最大重试次数
+        self.parse_retries = PARSE_RETRY_LIMIT  # 回复无法使用时重新请求的次数
+        self.batch_size = MICRO_BATCH_SIZE  # 每个请求打包的论文数，1 表示不打包
+        self.batch_max_tokens = MICRO_BATCH_MAX_TOKENS  # 打包请求的输入 token 上限
+        self.journal = journal
+        self.scheduler = scheduler or create_scheduler(max_concurrency)
+        self.prefix_cache = prefix_cache or prefix_contexts
+        self.deadline = deadline or Deadline()
+        self.response_model = response_model
+        self.response_formats = response_format_support or response_formats
+        self.group = "|".join(f"{key}={value}" for key, value in sorted((labels or {}).items())) or stage_name
+        # 本阶段的请求指标
+        self.stats = CallMetrics(
+            {"stage": stage_name, "model": model_name, **(labels or {})},
+            prompt_price=PROMPT_TOKEN_PRICE,
+            completion_price=COMPLETION_TOKEN_PRICE,
+            cached_prompt_price=CACHED_PROMPT_TOKEN_PRICE
         )
-        self.task_num = 50  # 每个 worker 处理的任务数
+
+    async def request_completion(
+        self,
+        system_prompt: str,
+        user_text: str,
+        worker_id: int,
+        task_index: int,
+        expected_items: int = 1
+    ) -> str:
+        """调用模型并返回回复内容，临时错误按指数退避加抖动重试
+
+        前缀缓存可用时只发送用户消息，系统提示词由缓存上下文提供。使用上下文的请求出现非临时错误时
+        立即改用普通请求重试，若普通请求成功则说明上下文本身不可用，本次运行不再使用它。
+        携带 response_format 的请求出现非临时错误时同样先去掉 response_format 重试，成功则本次运行不再对该模型使用。
+
+        Args:
+            system_prompt: 系统提示词
+            user_text: 用户消息
+            worker_id: worker ID
+            task_index: 任务索引
+            expected_items: 本次请求包含的论文数，用于预估输出 token
+
+        Returns:
+            模型回复的文本
+        """
+        estimated_tokens = estimate_tokens(system_prompt + user_text) + self.max_completion_tokens * expected_items
+        attempt = 0
+        use_context = True
+        use_format = True
+        failed_context_id = None
+        format_error = None
+        while True:
+            extra_params = {"max_tokens": self.max_tokens * expected_items} if self.max_tokens else {}
+            if use_format:
+                extra_params.update(self.response_formats.params(self.model_name, self.response_model, expected_items))
+            context_id = None
+            if use_context:
+                context_id = await self.prefix_cache.context_id(self.client, self.model_name, system_prompt, self.stats)
+            try:
+                async with self.scheduler.request(estimated_tokens, self.group) as record:
+                    lane = f"{self.stage_name} worker {worker_id}"
+                    called_at = time.monotonic()
+                    tracer.complete("scheduler_wait", "queue", called_at - record.wait, called_at, lane, task=task_index)
+                    with tracer.span("llm_call", "llm", lane, stage=self.stage_name, model=self.model_name, task=task_index, papers=expected_items, attempt=attempt, cached=context_id is not None) as span:
+                        completion = await self.hedged_call(
+                            lambda: self.call_model(context_id, system_prompt, user_text, extra_params),
+                            estimated_tokens, lane, task_index
+                        )
+                        usage = getattr(completion, "usage", None)
+                        cached_tokens = cached_prompt_tokens(usage)
+                        if usage is not None:
+                            record.used_tokens = usage.total_tokens
+                            span.set(prompt_tokens=usage.prompt_tokens, completion_tokens=usage.completion_tokens, cached_tokens=cached_tokens)
+                self.stats.record_call(
+                    record.latency,
+                    record.wait,
+                    usage.prompt_tokens if usage is not None else 0,
+                    usage.completion_tokens if usage is not None else 0,
+                    cached_tokens
+                )
+                if failed_context_id is not None:
+                    self.prefix_cache.invalidate(self.model_name, system_prompt, failed_context_id)
+                elif format_error is not None:
+                    self.response_formats.disable(self.model_name, format_error)
+                return completion.choices[0].message.content
+            except Exception as e:
+                if "response_format" in extra_params and not is_transient_error(e):
+                    # 可能是模型不支持 response_format，不计入重试次数，立即去掉后重试
+                    self.stats.record_failure(True)
+                    use_format = False
+                    format_error = e
+                    logger.warning(f"Worker {worker_id} task {task_index} request with response_format failed: {e}, retrying without it", extra=self.log_fields(worker_id, task_index))
+                    continue
+                if context_id is not None and not is_transient_error(e):
+                    # 可能是上下文失效，不计入重试次数，立即改用普通请求
+                    self.stats.record_failure(True)
+                    use_context = False
+                    failed_context_id = context_id
+                    logger.warning(f"Worker {worker_id} task {task_index} cached request failed: {e}, retrying without prefix cache", extra=self.log_fields(worker_id, task_index))
+                    continue
+                will_retry = attempt < self.max_retries and is_transient_error(e)
+                self.stats.record_failure(will_retry)
+                if not will_retry:
+                    raise
+                delay = backoff_delay(attempt)
+                attempt += 1
+                logger.warning(f"Worker {worker_id} task {task_index} attempt {attempt} failed: {e}, retrying in {delay:.1f}s", extra=self.log_fields(worker_id, task_index))
+                await asyncio.sleep(delay)
+
+    def call_model(self, context_id: Optional[str], system_prompt: str, user_text: str, extra_params: dict) -> Awaitable:
+        """发送一次模型请求，context_id 不为 None 时使用前缀缓存上下文，只发送用户消息"""
+        if context_id is not None:
+            return self.client.context.completions.create(
+                context_id=context_id,
+                model=self.model_name,
+                messages=[{"role": "user", "content": user_text}],
+                temperature=self.temperature,
+                **extra_params
+            )
+        return self.client.batch_chat.completions.create(
+            model=self.model_name,
+            messages=[
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": user_text},
+            ],
+            temperature=self.temperature,
+            **extra_params
+        )
+
+    async def hedged_call(self, call: Callable[[], Awaitable], estimated_tokens: int, lane: str, task_index: int):
+        """发送请求，耗时超过调度器给出的对冲阈值时再发送一个相同的请求，先成功的结果胜出，另一个请求被取消
+
+        Args:
+            call: 发送一次请求的函数
+            estimated_tokens: 预估的 token 数，对冲请求同样经过调度器限流
+            lane: trace 时间线名称
+            task_index: 任务索引
+        """
+        primary = asyncio.ensure_future(call())
+        hedge = None
+        try:
+            delay = self.scheduler.hedge_delay()
+            if delay is None:
+                return await primary
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+            if done:
+                return primary.result()
+            self.scheduler.hedges += 1
+            hedge = asyncio.create_task(self.hedge_request(call, estimated_tokens, lane, task_index, delay))
+            pending = {primary, hedge}
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.stats.record_hedge("won" if task is hedge else "lost")
+                        return task.result()
+            # 两个请求都失败时按原请求的异常处理
+            self.stats.record_hedge("failed")
+            return primary.result()
+        finally:
+            primary.cancel()
+            if hedge is not None:
+                hedge.cancel()
+
+    async def hedge_request(self, call: Callable[[], Awaitable], estimated_tokens: int, lane: str, task_index: int, delay: float):
+        """经过调度器发送对冲请求"""
+        async with self.scheduler.request(estimated_tokens, self.group) as record:
+            with tracer.span("hedge_call", "llm", lane, task=task_index, delay=round(delay, 3)):
+                completion = await call()
+            usage = getattr(completion, "usage", None)
+            if usage is not None:
+                record.used_tokens = usage.total_tokens
+        return completion
 
     async def process_single_task(
         self,
@@ -41,119 +344,425 @@ class BatchInference:
             处理结果或 None（如果失败）
         """
         if not user_content:
-            logger.info(f"Worker {worker_id} task {task_index} skipped (None input)")
+            logger.info(f"Worker {worker_id} task {task_index} skipped (None input)", extra=self.log_fields(worker_id, task_index))
             return None
             
-        logger.info(f"Worker {worker_id} task {task_index} is running.")
+        logger.info(f"Worker {worker_id} task {task_index} is running.", extra=self.log_fields(worker_id, task_index))
         try:
-            completion = await self.client.batch_chat.completions.create(
-                model=MODEL_NAME,
-                messages=[
-                    {"role": "system", "content": system_prompt},
-                    {"role": "user", "content": user_content["content"]},
-                ],
-                temperature=0.8
-            )
-            result = completion.choices[0].message.content
-            logger.info(f"Worker {worker_id} task {task_index} is completed.")
-            try:
-                # 将字符串结果解析为字典对象
-                result_dict = json.loads(result)
+            user_text = user_content["content"]
+            for reask in range(self.parse_retries + 1):
+                result = await self.request_completion(system_prompt, user_text, worker_id, task_index)
+                logger.info(f"Worker {worker_id} task {task_index} is completed.", extra=self.log_fields(worker_id, task_index))
+                try:
+                    # 提取、修复并校验回复中的 JSON
+                    with tracer.span("json_parse", "parse", f"{self.stage_name} worker {worker_id}", task=task_index):
+                        result_dict, repaired = parse_response(result, self.response_model)
+                except ResponseParseError as e:
+                    error = e
+                    if reask:
+                        self.stats.record_reask("failed")
+                    logger.warning(f"Worker {worker_id} task {task_index} returned an unusable response: {e}", extra=self.log_fields(worker_id, task_index))
+                    # 只针对这篇论文重新请求，并告诉模型上次的回复为什么不能使用
+                    user_text = user_content["content"] + replace_placeholder_in_prompt(REASK_PROMPT_SUFFIX, "error", str(e)[:300])
+                    continue
+                if repaired:
+                    self.stats.record_repair()
+                if reask:
+                    self.stats.record_reask("recovered")
                 result_dict.update(user_content)
                 result_dict["success"] = True
                 return result_dict
-            except json.JSONDecodeError as e:
-                logger.error(f"Worker {worker_id} task {task_index} failed to parse JSON: {e}")
-                logger.error(f"Raw response content: {result}")
-                # 创建一个包含原始内容的字典，并设置isRelated为false
-                error_result = {
-                    "success": False,
-                    "isRelated": True, # 解析失败，看看LLM返回了什么东西
-                    "raw_response": result,
-                    "chineseSummary": "解析失败，请查看原始内容",
-                    "error": str(e)
-                }
-                error_result.update(user_content)
-                return error_result
+
+            self.stats.record_parse_failure()
+            logger.error(f"Worker {worker_id} task {task_index} failed to parse response: {error}", extra=self.log_fields(worker_id, task_index))
+            logger.error(f"Raw response content: {result}", extra=self.log_fields(worker_id, task_index))
+            # 创建一个包含原始内容的字典，并设置isRelated为false
+            error_result = {
+                "success": False,
+                "isRelated": True, # 解析失败，看看LLM返回了什么东西
+                "raw_response": result,
+                "chineseSummary": "解析失败，请查看原始内容",
+                "error": str(error)
+            }
+            error_result.update(user_content)
+            return error_result
         except Exception as e:
-            logger.error(f"Worker {worker_id} task {task_index} failed with error: {e}")
+            logger.error(f"Worker {worker_id} task {task_index} failed with error: {e}", extra=self.log_fields(worker_id, task_index))
             return None
 
-    async def worker(
+    async def process_packed_task(
         self,
         worker_id: int,
-        task_num: int,
+        task_indices: List[int],
         system_prompt: str,
-        user_content: List[dict]
-    ) -> List[dict]:
-        """单个 worker 处理多个任务
-        
+        user_contents: List[dict]
+    ) -> List[Optional[dict]]:
+        """将多篇论文打包到一个请求中处理
+
+        模型需要返回以论文编号为键的 JSON 数组。回复无法解析、缺少部分论文或部分论文的结果格式不符时，
+        将这些论文对半拆分后分别重试，直到退化为单篇请求。
+
         Args:
             worker_id: worker ID
-            task_num: 任务数量
+            task_indices: 任务索引列表
             system_prompt: 系统提示词
-            user_content: 用户内容列表
-            
+            user_contents: 用户内容列表
+
         Returns:
-            处理结果列表
+            与输入一一对应的处理结果列表
         """
-        logger.info(f"Worker {worker_id} is starting.")
-        tasks = [self.process_single_task(worker_id, i, system_prompt, content) for i, content in enumerate(user_content)]
-        results = await asyncio.gather(*tasks)
-        logger.info(f"Worker {worker_id} is completed.")
+        if len(user_contents) == 1:
+            return [await self.process_single_task(worker_id, task_indices[0], system_prompt, user_contents[0])]
+
+        paper_ids = [f"P{i}" for i in range(1, len(user_contents) + 1)]
+        user_text = "\n\n".join(
+            f"## Paper {paper_id}\n{content['content']}" for paper_id, content in zip(paper_ids, user_contents)
+        )
+        task_range = f"{task_indices[0]}-{task_indices[-1]}"
+        logger.info(f"Worker {worker_id} packed tasks {task_range} ({len(user_contents)} papers) is running.", extra=self.log_fields(worker_id, task_range))
+        try:
+            result = await self.request_completion(
+                system_prompt + PACKED_PROMPT_SUFFIX, user_text, worker_id, task_indices[0], len(user_contents)
+            )
+        except Exception as e:
+            logger.error(f"Worker {worker_id} packed tasks {task_range} failed with error: {e}", extra=self.log_fields(worker_id, task_range))
+            return [None] * len(user_contents)
+        logger.info(f"Worker {worker_id} packed tasks {task_range} is completed.", extra=self.log_fields(worker_id, task_range))
+
+        with tracer.span("json_parse", "parse", f"{self.stage_name} worker {worker_id}", tasks=task_range) as span:
+            parsed, repaired = parse_packed_response(result, paper_ids, self.response_model)
+            span.set(parsed=len(parsed))
+        if repaired and parsed:
+            self.stats.record_repair(len(parsed))
+        results: List[Optional[dict]] = [None] * len(user_contents)
+        missing = []
+        for i, (paper_id, content) in enumerate(zip(paper_ids, user_contents)):
+            result_dict = parsed.get(paper_id)
+            if result_dict is None:
+                missing.append(i)
+                continue
+            result_dict.update(content)
+            result_dict["success"] = True
+            results[i] = result_dict
+
+        if missing:
+            self.stats.record_parse_failure(len(missing))
+            logger.warning(f"Worker {worker_id} packed tasks {task_range} missing {len(missing)} results, splitting and retrying", extra=self.log_fields(worker_id, task_range))
+            half = (len(missing) + 1) // 2
+            for part in (missing[:half], missing[half:]):
+                if not part:
+                    continue
+                part_results = await self.process_packed_task(
+                    worker_id, [task_indices[i] for i in part], system_prompt, [user_contents[i] for i in part]
+                )
+                for i, part_result in zip(part, part_results):
+                    results[i] = part_result
         return results
 
-    async def create_tasks(
+    def log_fields(self, worker_id: int, task: Union[int, str]) -> dict:
+        """单篇论文日志的结构化字段，写入 JSON 日志并用于日志限速"""
+        return {"stage": self.stage_name, "model": self.model_name, "worker": worker_id, "task": task}
+
+    def journal_key(self, system_prompt: str, user_content: dict) -> str:
+        """推理日志中任务的键，由模型、系统提示词和用户内容共同决定"""
+        return hash_text("|||".join([self.model_name, system_prompt, user_content["content"]]))
+
+    async def worker(
         self,
+        worker_id: int,
+        work_queue: asyncio.Queue,
         system_prompt: str,
-        user_content: List[dict]
-    ) -> List[dict]:
-        """创建并执行批量任务
-        
+        result_queue: asyncio.Queue
+    ) -> None:
+        """单个 worker 从队列中依次取出任务处理，直到取到结束标记
+
         Args:
+            worker_id: worker ID
+            work_queue: 待处理任务队列，元素为 (任务索引列表, 用户内容列表, 入队时间)，None 为结束标记
             system_prompt: 系统提示词
-            user_content: 用户内容列表
-            
-        Returns:
-            处理结果列表
+            result_queue: 结果队列，每完成一个任务放入 (任务索引, 用户内容, 处理结果)
+        """
+        while True:
+            item = await work_queue.get()
+            try:
+                if item is None:
+                    return
+                task_indices, contents, enqueued_at = item
+                dequeued_at = time.monotonic()
+                self.stats.record_queue_wait(dequeued_at - enqueued_at)
+                tracer.complete("queue_wait", "queue", enqueued_at, dequeued_at, f"{self.stage_name} worker {worker_id}", tasks=task_indices)
+                pack_results = await self.process_packed_task(worker_id, task_indices, system_prompt, contents)
+                for task_index, content, result in zip(task_indices, contents, pack_results):
+                    if self.journal is not None and result is not None and result["success"] is True:
+                        self.journal.append(self.journal_key(system_prompt, content), result)
+                    await result_queue.put((task_index, content, result))
+            finally:
+                work_queue.task_done()
+
+    def log_stats(self) -> None:
+        """输出本阶段的请求数、平均延迟和 token 用量"""
+        logger.info(f"[{self.stage_name}] model={self.model_name} {self.stats.summary()}")
+
+    async def pack_tasks(self, system_prompt: str, tasks: AsyncIterator[tuple]) -> AsyncIterator[List[tuple]]:
+        """按论文数和输入 token 上限将陆续到达的任务打包，未开启打包时每个任务单独一组"""
+        base_tokens = estimate_tokens(system_prompt + PACKED_PROMPT_SUFFIX)
+        current = []
+        current_tokens = base_tokens
+        async for task in tasks:
+            task_tokens = estimate_tokens(task[1]["content"])
+            if current and (len(current) >= self.batch_size or current_tokens + task_tokens > self.batch_max_tokens):
+                yield current
+                current = []
+                current_tokens = base_tokens
+            current.append(task)
+            current_tokens += task_tokens
+        if current:
+            yield current
+
+    async def stream_tasks(
+        self,
+        system_prompt: str,
+        user_content: Union[Iterable[dict], AsyncIterable[dict]]
+    ) -> AsyncIterator[Tuple[int, dict, Optional[dict]]]:
+        """流式执行批量任务，按完成顺序逐个产出结果
+
+        输入可以是列表或异步生成器。输入、待处理队列和结果队列之间都是有界队列，
+        内存占用与输入规模无关；实际并发数和请求速率由调度器控制。
+        到达截止时间后停止读取输入，取消进行中的请求，未完成的任务不再产出，由调用方推迟到下次运行。
+
+        Args:
+            system_prompt: 系统提示词
+            user_content: 用户内容，可以陆续产生
+
+        Yields:
+            (任务索引, 用户内容, 处理结果)，任务索引为该内容在输入中的位置，失败的任务结果为 None
         """
         start_time = datetime.now()
-        total_items = len(user_content)
-        
-        # 计算 worker 数量
-        max_concurrent_tasks = max(1, (total_items + self.task_num - 1) // self.task_num)
-        
-        logger.info(f"Processing {total_items} items with {max_concurrent_tasks} workers")
-
-        # 填充数据以确保任务数量一致
-        padding_size = (max_concurrent_tasks * self.task_num) - total_items
-        if padding_size > 0:
-            user_content.extend([None] * padding_size)
-            logger.info(f"Padded content with {padding_size} empty items")
-
-        # 创建并执行任务
-        tasks = [
-            self.worker(i, self.task_num, system_prompt, user_content[i * self.task_num:(i + 1) * self.task_num])
-            for i in range(max_concurrent_tasks)
+        deadline = self.deadline
+        work_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        result_queue: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        workers = [
+            asyncio.create_task(self.worker(i, work_queue, system_prompt, result_queue))
+            for i in range(self.max_concurrency)
         ]
-        all_results = await asyncio.gather(*tasks)
-        
-        # 处理结果
-        actual_results = [result for worker_results in all_results for result in worker_results][:total_items]
-        total_success = sum(1 for result in actual_results if result is not None)
-        success_rate = (total_success / total_items) * 100
-        
+        counts = {"total": 0, "resumed": 0}
+
+        async def pending_tasks() -> AsyncIterator[tuple]:
+            async for content in as_async_iterable(user_content):
+                task_index = counts["total"]
+                counts["total"] += 1
+                # 日志中已有成功记录的任务直接复用，不再请求模型
+                if self.journal is not None:
+                    journaled = self.journal.get(self.journal_key(system_prompt, content))
+                    if journaled is not None:
+                        counts["resumed"] += 1
+                        await result_queue.put((task_index, content, {**journaled, **content}))
+                        continue
+                yield (task_index, content)
+
+        async def produce() -> None:
+            try:
+                async for pack in self.pack_tasks(system_prompt, pending_tasks()):
+                    if deadline.expired():
+                        break
+                    await work_queue.put(([task_index for task_index, _ in pack], [content for _, content in pack], time.monotonic()))
+                for _ in workers:
+                    await work_queue.put(None)
+                await asyncio.gather(*workers)
+            except Exception:
+                # 出错时同样放入结束标记，唤醒等待结果的调用方
+                await result_queue.put(None)
+                raise
+            await result_queue.put(None)
+
+        producer = asyncio.create_task(produce())
+        total_success = 0
+        yielded = 0
+        try:
+            async for item in queue_items(result_queue, deadline):
+                yielded += 1
+                if item[2] is not None:
+                    total_success += 1
+                yield item
+            if not deadline.expired():
+                # 输入或 worker 抛出的异常在这里传给调用方
+                await producer
+        finally:
+            producer.cancel()
+            for worker in workers:
+                worker.cancel()
+
+        total_items = counts["total"]
+        success_rate = (total_success / total_items) * 100 if total_items else 100.0
+
         # 记录统计信息
         end_time = datetime.now()
         logger.info(f"Completed in {end_time - start_time}")
         logger.info(f"Total items processed: {total_items}")
         logger.info(f"Successful items: {total_success}")
+        if counts["resumed"]:
+            logger.info(f"Resumed from journal: {counts['resumed']}")
         logger.info(f"Success rate: {success_rate:.2f}%")
+        logger.info(f"Final concurrency limit: {self.scheduler.limiter.limit:.1f}")
+        if deadline.expired() and yielded < total_items:
+            logger.warning(f"Deadline reached with {total_items - yielded} tasks unfinished")
+        self.log_stats()
+
+    async def create_tasks(
+        self,
+        system_prompt: str,
+        user_content: List[dict]
+    ) -> List[dict]:
+        """创建并执行批量任务，等待全部完成后一次性返回
+
+        Args:
+            system_prompt: 系统提示词
+            user_content: 用户内容列表
+
+        Returns:
+            处理结果列表，与输入一一对应（失败的任务为 None）
+        """
+        results: List[Optional[dict]] = [None] * len(user_content)
+        async for task_index, _, result in self.stream_tasks(system_prompt, user_content):
+            results[task_index] = result
+        return results
+
+class CascadeInference:
+    """两阶段级联推理
+
+    第一阶段用小模型、低温度和很短的输出上限只判断是否相关，
+    第二阶段只对相关的论文用主模型生成中文简介。两个阶段各自有独立的并发限制和统计。
+    """
+
+    def __init__(
+        self,
+        journal: Optional[InferenceJournal] = None,
+        labels: Optional[Dict[str, str]] = None,
+        schedulers: Optional[Dict[str, RequestScheduler]] = None,
+        deadline: Optional[Deadline] = None
+    ):
+        """
+        Args:
+            journal: 推理日志
+            labels: 附加的指标标签
+            schedulers: 按阶段名（gate / summary）共用的请求调度器
+            deadline: 运行截止时间，到时两个阶段都停止，未完成的论文不再产出
+        """
+        schedulers = schedulers or {}
+        self.gate = BatchInference(
+            journal=journal,
+            model_name=GATE_MODEL_NAME,
+            temperature=0.0,
+            max_tokens=GATE_MAX_TOKENS,
+            max_concurrency=GATE_MAX_CONCURRENCY,
+            stage_name="gate",
+            labels=labels,
+            scheduler=schedulers.get("gate"),
+            deadline=deadline,
+            response_model=GateDecision
+        )
+        self.summarizer = BatchInference(
+            journal=journal,
+            max_concurrency=SUMMARY_MAX_CONCURRENCY,
+            stage_name="summary",
+            labels=labels,
+            scheduler=schedulers.get("summary"),
+            deadline=deadline,
+            response_model=PaperSummary
+        )
+
+    async def stream_tasks(
+        self,
+        gate_prompt: str,
+        summary_prompt: str,
+        user_content: Union[Iterable[dict], AsyncIterable[dict]]
+    ) -> AsyncIterator[Tuple[int, dict, Optional[dict]]]:
+        """先判断相关性，再为相关的论文生成简介，两个阶段同时运行，按完成顺序产出结果
+
+        不相关的论文在第一阶段完成后立即产出，相关的论文经有界队列送入第二阶段。
+        到达截止时间后两个阶段都停止，未完成的论文不再产出。
+
+        Args:
+            gate_prompt: 第一阶段（相关性判断）的系统提示词
+            summary_prompt: 第二阶段（生成简介）的系统提示词
+            user_content: 用户内容，可以陆续产生
 
-        # 返回之前，保存结果到文件，以免后续运行时重复推理
-        save_results(actual_results, f"temp_{datetime.now().strftime('%H-%M-%S')}")
+        Yields:
+            (任务索引, 用户内容, 处理结果)，结果格式与单阶段推理相同（失败的任务为 None）
+        """
+        related_queue: asyncio.Queue = asyncio.Queue(maxsize=self.summarizer.queue_size)
+        output_queue: asyncio.Queue = asyncio.Queue(maxsize=self.gate.queue_size)
+        related_indices: List[int] = []  # 第二阶段的任务索引 -> 输入中的任务索引
+
+        async def related_contents() -> AsyncIterator[dict]:
+            while True:
+                content = await related_queue.get()
+                if content is None:
+                    return
+                yield content
+
+        async def run_gate() -> None:
+            items = 0
+            async for task_index, content, result in self.gate.stream_tasks(gate_prompt, user_content):
+                items += 1
+                if result is not None and is_related(result):
+                    related_indices.append(task_index)
+                    await related_queue.put(content)
+                    continue
+                if result is not None and result["success"] is True:
+                    result["chineseSummary"] = "Unrelated"
+                await output_queue.put((task_index, content, result))
+            logger.info(f"Gate stage marked {len(related_indices)}/{items} items as related")
+            await related_queue.put(None)
+
+        async def run_summary() -> None:
+            async for summary_index, content, result in self.summarizer.stream_tasks(summary_prompt, related_contents()):
+                if result is not None and result["success"] is True:
+                    result = {**result, "isRelated": True}
+                await output_queue.put((related_indices[summary_index], content, result))
+
+        async def run_stages() -> None:
+            stages = [asyncio.create_task(run_gate()), asyncio.create_task(run_summary())]
+            try:
+                await asyncio.gather(*stages)
+            except Exception:
+                await output_queue.put(None)
+                raise
+            finally:
+                for stage in stages:
+                    stage.cancel()
+            await output_queue.put(None)
+
+        runner = asyncio.create_task(run_stages())
+        try:
+            # 到达截止时间后不再等待两个阶段结束，取消时一并取消进行中的请求
+            async for item in queue_items(output_queue, self.gate.deadline):
+                yield item
+            if not self.gate.deadline.expired():
+                await runner
+        finally:
+            runner.cancel()
+
+    async def create_tasks(
+        self,
+        gate_prompt: str,
+        summary_prompt: str,
+        user_content: List[dict]
+    ) -> List[Optional[dict]]:
+        """先判断相关性，再为相关的论文生成简介，等待全部完成后一次性返回
 
-        return actual_results
+        Args:
+            gate_prompt: 第一阶段（相关性判断）的系统提示词
+            summary_prompt: 第二阶段（生成简介）的系统提示词
+            user_content: 用户内容列表
+
+        Returns:
+            与输入一一对应的处理结果列表，格式与单阶段推理相同（失败的任务为 None）
+        """
+        results: List[Optional[dict]] = [None] * len(user_content)
+        async for task_index, _, result in self.stream_tasks(gate_prompt, summary_prompt, user_content):
+            results[task_index] = result
+        return results
 
 def main():
     """主函数"""
@@ -191,10 +800,10 @@ def main():
     """
 
     test_user_content = [
-        """Title: GraphMaster: Automated Graph Synthesis via LLM Agents in Data-Limited Environments
-        Abstract: The era of foundation models has revolutionized AI research, yet Graph Foundation Models (GFMs) remain constrained by the scarcity of large-scale graph corpora. Traditional graph data synthesis techniques primarily focus on simplistic structural operations, lacking the capacity to generate semantically rich nodes with meaningful textual attributes: a critical limitation for real-world applications. While large language models (LLMs) demonstrate exceptional text generation capabilities, their direct application to graph synthesis is impeded by context window limitations, hallucination phenomena, and structural consistency challenges. To address these issues, we introduce GraphMaster, the first multi-agent framework specifically designed for graph data synthesis in data-limited environments. GraphMaster orchestrates four specialized LLM agents (Manager, Perception, Enhancement, and Evaluation) that collaboratively optimize the synthesis process through iterative refinement, ensuring both semantic coherence and structural integrity. To rigorously evaluate our approach, we create new data-limited "Sub" variants of six standard graph benchmarks, specifically designed to test synthesis capabilities under realistic constraints. Additionally, we develop a novel interpretability assessment framework that combines human evaluation with a principled Grassmannian manifold-based analysis, providing both qualitative and quantitative measures of semantic coherence. Experimental results demonstrate that GraphMaster significantly outperforms traditional synthesis methods across multiple datasets, establishing a strong foundation for advancing GFMs in data-scarce environments.""",
-        """Title: Federated Learning for Cross-Domain Data Privacy: A Distributed Approach to Secure Collaboration
-        Abstract: This paper proposes a data privacy protection framework based on federated learning, which aims to realize effective cross-domain data collaboration under the premise of ensuring data privacy through distributed learning. Federated learning greatly reduces the risk of privacy breaches by training the model locally on each client and sharing only model parameters rather than raw data. The experiment verifies the high efficiency and privacy protection ability of federated learning under different data sources through the simulation of medical, financial, and user data. The results show that federated learning can not only maintain high model performance in a multi-domain data environment but also ensure effective protection of data privacy. The research in this paper provides a new technical path for cross-domain data collaboration and promotes the application of large-scale data analysis and machine learning while protecting privacy."""
+        {"content": """Title: GraphMaster: Automated Graph Synthesis via LLM Agents in Data-Limited Environments
+        Abstract: The era of foundation models has revolutionized AI research, yet Graph Foundation Models (GFMs) remain constrained by the scarcity of large-scale graph corpora. Traditional graph data synthesis techniques primarily focus on simplistic structural operations, lacking the capacity to generate semantically rich nodes with meaningful textual attributes: a critical limitation for real-world applications. While large language models (LLMs) demonstrate exceptional text generation capabilities, their direct application to graph synthesis is impeded by context window limitations, hallucination phenomena, and structural consistency challenges. To address these issues, we introduce GraphMaster, the first multi-agent framework specifically designed for graph data synthesis in data-limited environments. GraphMaster orchestrates four specialized LLM agents (Manager, Perception, Enhancement, and Evaluation) that collaboratively optimize the synthesis process through iterative refinement, ensuring both semantic coherence and structural integrity. To rigorously evaluate our approach, we create new data-limited "Sub" variants of six standard graph benchmarks, specifically designed to test synthesis capabilities under realistic constraints. Additionally, we develop a novel interpretability assessment framework that combines human evaluation with a principled Grassmannian manifold-based analysis, providing both qualitative and quantitative measures of semantic coherence. Experimental results demonstrate that GraphMaster significantly outperforms traditional synthesis methods across multiple datasets, establishing a strong foundation for advancing GFMs in data-scarce environments."""},
+        {"content": """Title: Federated Learning for Cross-Domain Data Privacy: A Distributed Approach to Secure Collaboration
+        Abstract: This paper proposes a data privacy protection framework based on federated learning, which aims to realize effective cross-domain data collaboration under the premise of ensuring data privacy through distributed learning. Federated learning greatly reduces the risk of privacy breaches by training the model locally on each client and sharing only model parameters rather than raw data. The experiment verifies the high efficiency and privacy protection ability of federated learning under different data sources through the simulation of medical, financial, and user data. The results show that federated learning can not only maintain high model performance in a multi-domain data environment but also ensure effective protection of data privacy. The research in this paper provides a new technical path for cross-domain data collaboration and promotes the application of large-scale data analysis and machine learning while protecting privacy."""}
     ]
 
     # 创建批处理实例并运行
@@ -0,0 +1,287 @@
+"""BatchInference 吞吐基准测试
+
+使用 mock_ark.py 中的本地模拟服务端，在临时目录中对合成的 feed 运行完整的 run_filter 流程，
+输出吞吐、首条结果延迟、延迟分位数、峰值内存和成功率（JSON 格式），用于离线比较不同的并发策略。
+延迟在客户端测量：单次请求从等待并发名额和限流令牌开始到请求结束，单篇论文从进入待处理队列到产出结果，
+因此包含排队、限流、429 退避和重试的时间，而不只是模拟服务端的响应时间。
+
+示例:
+    python benchmark.py --sizes 100 1000 20000 --latency-median 0.2 --throttle-rate 0.01 \\
+        --env MAX_CONCURRENCY=128 --env MICRO_BATCH_SIZE=4 --output bench.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterable, Dict, Iterable, List, Set, Union
+
+WORDS = (
+    "model data learning graph audio sound image video text language training neural network diffusion "
+    "transformer vision robot policy reinforcement benchmark evaluation retrieval reasoning alignment "
+    "generation detection segmentation multimodal structured sequence token attention representation"
+).split()
+
+# 基准测试时使用的默认环境变量，可以通过 --env 覆盖
+DEFAULT_ENV = {
+    "API_KEY": "mock",
+    "MODEL_NAME": "mock-model",
+    "BASE_URL": "http://127.0.0.1/mock",
+    "REQUESTS_PER_SECOND": "1000",
+    "TOKENS_PER_MINUTE": "1000000000",
+}
+
+def percentile(values: List[float], q: float) -> float:
+    """计算分位数（最近秩法）"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def timed_input(user_content: Union[Iterable[dict], AsyncIterable[dict]], enqueued: List[float]):
+    """包装推理输入，记录每条内容被读入待处理队列的时间，列表和异步生成器都保持原来的类型"""
+    if hasattr(user_content, "__aiter__"):
+        async def timed_async():
+            async for content in user_content:
+                enqueued.append(time.monotonic())
+                yield content
+        return timed_async()
+
+    def timed_sync():
+        for content in user_content:
+            enqueued.append(time.monotonic())
+            yield content
+    return timed_sync()
+
+def synthetic_entries(count: int, start: int, rng: random.Random) -> List[dict]:
+    """生成格式与 arXiv RSS 条目一致的合成条目"""
+    entries = []
+    for i in range(start, start + count):
+        arxiv_id = f"2504.{i:05d}"
+        title = " ".join(rng.choices(WORDS, k=10))
+        abstract = " ".join(rng.choices(WORDS, k=180))
+        entries.append({
+            "id": f"oai:arXiv.org:{arxiv_id}v1",
+            "title": title,
+            "link": f"https://arxiv.org/abs/{arxiv_id}",
+            "author": "Alice, Bob",
+            "published": "Mon, 14 Apr 2025 00:00:00 -0400",
+            "summary": f"arXiv:{arxiv_id}v1 Announce Type: new \nAbstract: {abstract}",
+            "announce_type": "new",
+            "version": 1,
+        })
+    return entries
+
+def build_feeds(size: int, feed_urls: List[str], overlap: float, seed: int) -> Dict[str, dict]:
+    """将 size 个条目均分到各个 feed，其中 overlap 比例的条目在 feed 之间交叉出现"""
+    rng = random.Random(seed)
+    per_feed = max(1, size // len(feed_urls))
+    shared = synthetic_entries(int(per_feed * overlap), 0, rng)
+    feeds = {}
+    next_id = len(shared)
+    for feed_url in feed_urls:
+        own = synthetic_entries(per_feed - len(shared), next_id, rng)
+        next_id += len(own)
+        feeds[feed_url] = {
+            "feed": {
+                "title": feed_url,
+                "link": feed_url,
+                "updated": "Mon, 14 Apr 2025 00:00:00 -0400",
+                "published": "Mon, 14 Apr 2025 00:00:00 -0400"
+            },
+            "entries": shared + own
+        }
+    return feeds
+
+def run_single(args: argparse.Namespace) -> dict:
+    """在临时目录中运行一次完整的筛选流程并返回指标（在子进程中调用）"""
+    for key, value in {**DEFAULT_ENV, **dict(item.split("=", 1) for item in args.env)}.items():
+        os.environ[key] = value
+    work_dir = tempfile.mkdtemp(prefix="arxiv_bench_")
+    os.chdir(work_dir)
+    if not args.verbose:
+        logging.disable(logging.CRITICAL)
+
+    import batch_inference
+    import run_filter
+    import scheduler
+    from subscriptions import SubscriptionRegistry
+    from entry_store import EntryStore
+    from mock_ark import MockArk, MockArkConfig
+    from utils import extract_arxiv_id
+
+    mock = MockArk(MockArkConfig(
+        latency_distribution=args.latency_distribution,
+        latency_median=args.latency_median,
+        latency_sigma=args.latency_sigma,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        malformed_rate=args.malformed_rate,
+        truncated_rate=args.truncated_rate,
+        related_rate=args.related_rate,
+        seed=args.seed
+    ))
+    batch_inference.client_factory = lambda: mock
+
+    # 统计每个推理阶段的输入数、成功数，以及每篇论文从进入待处理队列到产出结果的耗时
+    stage_counts: Dict[str, Dict[str, int]] = {}
+    paper_latencies: Dict[str, List[float]] = {}
+    original_stream_tasks = batch_inference.BatchInference.stream_tasks
+
+    async def counting_stream_tasks(self, system_prompt, user_content):
+        counts = stage_counts.setdefault(self.stage_name, {"items": 0, "succeeded": 0})
+        latencies = paper_latencies.setdefault(self.stage_name, [])
+        enqueued: List[float] = []
+        async for task_index, content, result in original_stream_tasks(self, system_prompt, timed_input(user_content, enqueued)):
+            counts["items"] += 1
+            latencies.append(time.monotonic() - enqueued[task_index])
+            if result is not None and result["success"] is True:
+                counts["succeeded"] += 1
+            yield task_index, content, result
+
+    batch_inference.BatchInference.stream_tasks = counting_stream_tasks
+
+    # 每次请求在客户端的耗时：等待并发名额和限流令牌的时间加上请求本身，失败的请求同样记录，被取消的对冲请求不记录
+    request_latencies: List[float] = []
+    original_request = scheduler.RequestScheduler.request
+
+    @asynccontextmanager
+    async def timed_request(self, estimated_tokens, group="default"):
+        start = time.monotonic()
+        try:
+            async with original_request(self, estimated_tokens, group) as record:
+                yield record
+        except asyncio.CancelledError:
+            raise
+        except BaseException:
+            request_latencies.append(time.monotonic() - start)
+            raise
+        request_latencies.append(time.monotonic() - start)
+
+    scheduler.RequestScheduler.request = timed_request
+
+    # 记录第一条分类结果写入结果文件的时间，以及写入了成功结果的论文
+    first_result_at: List[float] = []
+    written_ids: Set[str] = set()
+    original_write = run_filter.ResultSink.write
+
+    def timed_write(self, rss_url, user_interest, result):
+        if not first_result_at:
+            first_result_at.append(time.monotonic())
+        if result.get("success") is True:
+            written_ids.add(extract_arxiv_id(result["id"]))
+        original_write(self, rss_url, user_interest, result)
+
+    run_filter.ResultSink.write = timed_write
+
+    feed_urls = SubscriptionRegistry.load().feed_urls()
+    store = EntryStore()
+    paper_ids: Set[str] = set()
+    for feed_url, feed in build_feeds(args.run_size, feed_urls, args.overlap, args.seed).items():
+        store.save_feed(feed_url, feed)
+        paper_ids.update(extract_arxiv_id(entry["id"]) for entry in feed["entries"])
+    store.close()
+
+    start = time.monotonic()
+    try:
+        asyncio.run(run_filter.main(multi_interest=args.multi_interest))
+        wall_time = time.monotonic() - start
+        # 运行结束后仍待筛选的论文：推迟到下次运行的，以及推理失败的
+        store = EntryStore()
+        pending = store.load_pending()
+        store.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    deferred_ids = set().union(*(feed["deferred"] for feed in pending.values()))
+    unfinished_ids = {extract_arxiv_id(entry["id"]) for feed in pending.values() for entry in feed["entries"]}
+    # 只统计所有 (feed, 研究兴趣) 都得到成功结果的论文，推迟和失败的论文不算完成
+    completed = len(written_ids - unfinished_ids)
+
+    first_stage_name = "gate" if "gate" in stage_counts else "main"
+    first_stage_latencies = paper_latencies.get(first_stage_name, [])
+    completions = mock.completions
+    return {
+        "size": args.run_size,
+        "multi_interest": args.multi_interest,
+        "env": dict(item.split("=", 1) for item in args.env),
+        "wall_time": wall_time,
+        "papers": len(paper_ids),
+        "completed": completed,
+        "deferred": len(deferred_ids),
+        "failed": len(unfinished_ids - deferred_ids),
+        "throughput": completed / wall_time if wall_time else 0.0,
+        "time_to_first_result": first_result_at[0] - start if first_result_at else None,
+        "requests": len(completions.latencies),
+        "request_latency_p50": percentile(request_latencies, 50),
+        "request_latency_p95": percentile(request_latencies, 95),
+        "request_latency_p99": percentile(request_latencies, 99),
+        "paper_latency_p50": percentile(first_stage_latencies, 50),
+        "paper_latency_p95": percentile(first_stage_latencies, 95),
+        "paper_latency_p99": percentile(first_stage_latencies, 99),
+        # Linux 上 ru_maxrss 的单位为 KB
+        "peak_memory_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "success_rate": completed / len(paper_ids) if paper_ids else 1.0,
+        "stages": stage_counts,
+        "status_counts": completions.status_counts,
+        "prefix_contexts_created": mock.context.created,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="BatchInference 吞吐基准测试（使用本地模拟服务端）")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 5000, 20000], help="合成 feed 的条目总数")
+    parser.add_argument("--multi-interest", action="store_true", help="使用多兴趣模式运行")
+    parser.add_argument("--overlap", type=float, default=0.2, help="在各个 feed 之间交叉出现的条目比例")
+    parser.add_argument("--latency-distribution", choices=["fixed", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--latency-median", type=float, default=0.5, help="模拟请求延迟的中位数（秒）")
+    parser.add_argument("--latency-sigma", type=float, default=0.5)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 500 的概率")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="返回 429 的概率")
+    parser.add_argument("--malformed-rate", type=float, default=0.0, help="返回不规范 JSON 的概率（不使用 RESPONSE_FORMAT 时）")
+    parser.add_argument("--truncated-rate", type=float, default=0.0, help="返回被截断、无法修复的 JSON 的概率")
+    parser.add_argument("--related-rate", type=float, default=0.05, help="论文被判断为相关的比例")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--env", action="append", default=[], help="覆盖配置的环境变量，格式为 KEY=VALUE，可重复")
+    parser.add_argument("--output", help="结果输出的 JSON 文件，默认输出到标准输出")
+    parser.add_argument("--verbose", action="store_true", help="保留推理过程的日志")
+    parser.add_argument("--run-size", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_size is not None:
+        print(json.dumps(run_single(args)))
+        return
+
+    # 每个规模在独立的子进程中运行，保证峰值内存和模块状态互不影响
+    repo_dir = os.path.dirname(os.path.abspath(__file__))
+    child_args = sys.argv[1:]
+    results = []
+    for size in args.sizes:
+        completed = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), *child_args, "--run-size", str(size)],
+            cwd=repo_dir, env={**os.environ, "PYTHONPATH": repo_dir}, capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            print(completed.stderr, file=sys.stderr)
+            raise SystemExit(f"benchmark failed for size {size}")
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        print(f"size={size} throughput={result['throughput']:.1f}/s request_p95={result['request_latency_p95']:.3f}s "
+              f"paper_p95={result['paper_latency_p95']:.3f}s deferred={result['deferred']} success={result['success_rate']:.2%} peak={result['peak_memory_mb']:.0f}MB", file=sys.stderr)
+        results.append(result)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(output)
+    else:
+        print(output)
+
+if __name__ == "__main__":
+    main()
@@ -1,36 +1,28 @@
-import json
+import asyncio
 import os
-from datetime import datetime
-from typing import Dict, Optional
-from config import area_interest_list
-from get_rss import get_rss_from_url
+from typing import Dict, List, Optional
+import httpx
+from subscriptions import SubscriptionRegistry
+from entry_store import EntryStore
+from get_rss import fetch_rss_from_url
 from logger import setup_logger
 
 logger = setup_logger(__name__)
 
-CACHE_FILE = "rss_cache.json"
+REQUEST_TIMEOUT = 30  # 单个RSS请求的超时时间（秒）
 
-def load_cache() -> Dict:
-    """加载缓存的RSS数据"""
-    if os.path.exists(CACHE_FILE):
-        try:
-            with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception as e:
-            logger.error(f"读取缓存文件失败: {str(e)}")
-    return {}
+async def check_feed_update(client: httpx.AsyncClient, feed_url: str, cache: Dict) -> tuple[bool, Optional[dict]]:
+    """检查RSS feed是否有更新，feed未修改时服务端返回 304，直接复用缓存的元信息"""
+    cached_feed = cache.get(feed_url)
+    if cached_feed:
+        is_not_modified, current_feed = await fetch_rss_from_url(
+            client, feed_url, cached_feed.get("etag"), cached_feed.get("last_modified")
+        )
+        if is_not_modified:
+            return False, cached_feed
+    else:
+        _, current_feed = await fetch_rss_from_url(client, feed_url)
 
-def save_cache(cache: Dict) -> None:
-    """保存RSS数据到缓存"""
-    try:
-        with open(CACHE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(cache, f, ensure_ascii=False, indent=2)
-    except Exception as e:
-        logger.error(f"保存缓存文件失败: {str(e)}")
-
-def check_feed_update(feed_url: str, cache: Dict) -> tuple[bool, Optional[dict]]:
-    """检查RSS feed是否有更新"""
-    current_feed = get_rss_from_url(feed_url)
     if not current_feed:
         return False, None
 
@@ -51,33 +43,59 @@ def check_feed_update(feed_url: str, cache: Dict) -> tuple[bool, Optional[dict]]
 
     return False, current_feed
 
-def main() -> bool:
-    """
-    主函数，检查所有RSS源是否有更新
-    返回: 如果有任何更新返回True，否则返回False
-    """
-    cache = load_cache()
+async def check_all_feeds(cache: Dict, feed_urls: List[str]) -> tuple[bool, Dict]:
+    """通过共享连接池并发检查所有RSS源，多个用户订阅的同一个feed只请求一次"""
+    async with httpx.AsyncClient(timeout=REQUEST_TIMEOUT, follow_redirects=True) as client:
+        results = await asyncio.gather(*(check_feed_update(client, feed_url, cache) for feed_url in feed_urls))
+
     new_cache = {}
     has_updates = False
-
-    for item in area_interest_list:
-        feed_url = item["rss_url"]
-        is_updated, current_feed = check_feed_update(feed_url, cache)
-        
+    for feed_url, (is_updated, current_feed) in zip(feed_urls, results):
         if is_updated:
             has_updates = True
             logger.info(f"发现更新: {feed_url}")
-        
+
         if current_feed:
             new_cache[feed_url] = current_feed
+    return has_updates, new_cache
 
-    if has_updates:
-        save_cache(new_cache)
+def main(store: Optional[EntryStore] = None, registry: Optional[SubscriptionRegistry] = None) -> bool:
+    """
+    主函数，检查所有RSS源是否有更新
+    参数: store 为调用方打开的条目库（单进程运行完整流程时与筛选步骤共用），None 时自行打开并关闭
+          registry 为订阅注册表，None 时按配置加载
+    返回: 如果有任何待筛选的新增或变化条目返回True，否则返回False
+    """
+    registry = registry or SubscriptionRegistry.load()
+    owns_store = store is None
+    if owns_store:
+        store = EntryStore()
+    try:
+        cache = store.load_feeds()
+        has_updates, new_cache = asyncio.run(check_all_feeds(cache, registry.feed_urls()))
+
+        # 返回 304 的feed只有缓存的元信息，没有条目，无需写入
+        for feed_url, current_feed in new_cache.items():
+            if "entries" in current_feed and store.save_feed(feed_url, current_feed):
+                has_updates = True
+
+        # 上次筛选中断时遗留的待筛选条目也需要重新筛选
+        if store.count_pending():
+            has_updates = True
+    finally:
+        if owns_store:
+            store.close()
         
     return has_updates
 
-if __name__ == "__main__":
-    has_updates = main()
+def write_github_output(has_updates: bool) -> None:
+    """在 GitHub Actions 中运行时写入步骤输出"""
+    output_file = os.environ.get('GITHUB_OUTPUT')
+    if not output_file:
+        return
     # 使用新的 GITHUB_OUTPUT 环境文件语法
-    with open(os.environ['GITHUB_OUTPUT'], 'a') as f:
-        f.write(f"has_updates={str(has_updates).lower()}\n") 
\ No newline at end of file
+    with open(output_file, 'a') as f:
+        f.write(f"has_updates={str(has_updates).lower()}\n")
+
+if __name__ == "__main__":
+    write_github_output(main())
@@ -0,0 +1,142 @@
+"""arXiv Paper Filter 命令行入口
+
+在同一个进程中运行检查更新、筛选和生成 RSS 的各个步骤:
+
+    python cli.py check     # 检查RSS更新，不需要配置 API
+    python cli.py filter    # 筛选待筛选的论文
+    python cli.py render    # 生成 feed.xml
+    python cli.py all       # 依次运行以上步骤，步骤之间直接在内存中传递数据
+    python cli.py backfill arxiv-metadata-oai-snapshot.json --start-date 2025-01-01  # 回填历史结果
+    python cli.py results query --interest 音频 --start-date 2025-04-01  # 查询结果库
+    python cli.py classifier report  # 查看本地分类器的校准报告和影子模式一致率
+    python cli.py filter --trace --profile  # 导出时间线并生成性能分析报告
+
+各子命令只在运行时才导入需要的模块，check 不会加载模型 SDK。
+"""
+import argparse
+import asyncio
+import contextlib
+import sys
+
+def run_check(args: argparse.Namespace) -> int:
+    from check_updates import main as check_main, write_github_output
+
+    has_updates = check_main()
+    write_github_output(has_updates)
+    return 0
+
+def run_filter(args: argparse.Namespace) -> int:
+    from run_filter import main as filter_main
+
+    asyncio.run(filter_main(multi_interest=args.multi_interest, resume=args.resume, render_feed=args.render_feed, deadline_minutes=args.deadline))
+    return 0
+
+def run_render(args: argparse.Namespace) -> int:
+    from generate_rss import main as render_main
+
+    render_main()
+    return 0
+
+def run_all(args: argparse.Namespace) -> int:
+    from check_updates import main as check_main, write_github_output
+    from entry_store import EntryStore
+    from logger import setup_logger
+
+    logger = setup_logger(__name__)
+    # 检查和筛选共用同一个条目库连接，筛选结果在写出时直接追加到 feed
+    store = EntryStore()
+    try:
+        has_updates = check_main(store)
+        write_github_output(has_updates)
+        if not has_updates:
+            logger.info("没有检测到更新，跳过筛选")
+            return 0
+
+        from run_filter import main as filter_main
+
+        asyncio.run(filter_main(multi_interest=args.multi_interest, resume=args.resume, render_feed=True, store=store, deadline_minutes=args.deadline))
+    finally:
+        store.close()
+    return 0
+
+def run_backfill(args: argparse.Namespace) -> int:
+    from backfill import run_backfill as backfill_main
+
+    asyncio.run(backfill_main(args))
+    return 0
+
+def run_results(args: argparse.Namespace) -> int:
+    from result_store import run_results_command
+
+    return run_results_command(args)
+
+def run_classifier(args: argparse.Namespace) -> int:
+    from local_classifier import run_classifier_command
+
+    return run_classifier_command(args)
+
+def run_command(args: argparse.Namespace) -> int:
+    """按 --trace / --profile 开启追踪和性能分析后运行子命令"""
+    if not getattr(args, "trace", False) and not getattr(args, "profile", False):
+        return args.handler(args)
+
+    from tracing import tracer, profiled
+
+    if args.trace:
+        tracer.enable()
+    try:
+        with profiled(args.command) if args.profile else contextlib.nullcontext():
+            with tracer.span(args.command, "run", "main"):
+                return args.handler(args)
+    finally:
+        tracer.save()
+
+def add_filter_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--multi-interest", action="store_true", help="每篇论文只请求一次模型，同时判断所有研究兴趣")
+    parser.add_argument("--resume", action="store_true", help="读取当天的推理日志，只补跑未成功的任务")
+    parser.add_argument("--deadline", type=float, metavar="MINUTES", help="筛选的时间预算（分钟），到时未完成的论文推迟到下次运行，默认使用 RUN_DEADLINE_MINUTES")
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="使用LLM根据研究兴趣筛选arXiv论文")
+    # 运行各步骤的子命令共用的追踪和性能分析开关
+    hooks = argparse.ArgumentParser(add_help=False)
+    hooks.add_argument("--trace", action="store_true", help="记录各步骤的时间区间，导出为 Chrome trace 格式的 arxiv_updates/trace_<日期>_<时间>.json")
+    hooks.add_argument("--profile", action="store_true", help="用 cProfile 和 tracemalloc 包裹本次运行，在 arxiv_updates 下写出报告")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    check_parser = subparsers.add_parser("check", parents=[hooks], help="检查RSS更新并写入条目库")
+    check_parser.set_defaults(handler=run_check)
+
+    filter_parser = subparsers.add_parser("filter", parents=[hooks], help="筛选条目库中待筛选的论文")
+    add_filter_arguments(filter_parser)
+    filter_parser.add_argument("--render-feed", action="store_true", help="筛选的同时逐条写入RSS feed")
+    filter_parser.set_defaults(handler=run_filter)
+
+    render_parser = subparsers.add_parser("render", parents=[hooks], help="合并最近几天的结果生成 feed.xml")
+    render_parser.set_defaults(handler=run_render)
+
+    all_parser = subparsers.add_parser("all", parents=[hooks], help="在同一个进程中检查更新、筛选并生成RSS")
+    add_filter_arguments(all_parser)
+    all_parser.set_defaults(handler=run_all)
+
+    from backfill import add_backfill_arguments
+
+    backfill_parser = subparsers.add_parser("backfill", parents=[hooks], help="用 arXiv 元数据快照回填历史筛选结果")
+    add_backfill_arguments(backfill_parser)
+    backfill_parser.set_defaults(handler=run_backfill)
+
+    from result_store import add_results_arguments
+
+    results_parser = subparsers.add_parser("results", help="查询、导出和整理筛选结果库")
+    add_results_arguments(results_parser)
+    results_parser.set_defaults(handler=run_results)
+
+    classifier_parser = subparsers.add_parser("classifier", help="训练本地分类器并查看校准报告")
+    classifier_parser.add_argument("classifier_command", choices=["train", "report"], help="train: 重新训练；report: 输出校准报告和影子模式一致率")
+    classifier_parser.set_defaults(handler=run_classifier)
+
+    args = parser.parse_args(argv)
+    return run_command(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -9,18 +9,94 @@ API_KEY = os.getenv('API_KEY')
 MODEL_NAME = os.getenv('MODEL_NAME')
 BASE_URL = os.getenv('BASE_URL')
 
-# 检查必要的环境变量是否已设置
-if not all([API_KEY, MODEL_NAME, BASE_URL]):
-    raise ValueError("请在 .env 文件中设置所有必要的环境变量")
+def check_api_config() -> None:
+    """检查调用模型所需的环境变量是否已设置
+
+    只在创建模型客户端时检查，检查RSS更新、生成feed等不调用模型的步骤不需要配置 API。
+    """
+    if not all([API_KEY, MODEL_NAME, BASE_URL]):
+        raise ValueError("请在 .env 文件中设置所有必要的环境变量")
+
+# 日志配置（可选）：日志由后台线程写出，日志文件为 JSON lines 并按大小轮转
+LOG_FILE = os.getenv('LOG_FILE', 'out.log')
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_BYTES', str(10 * 1024 * 1024)))  # 单个日志文件的大小上限
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', '5'))  # 保留的历史日志文件数
+LOG_CONSOLE_FORMAT = os.getenv('LOG_CONSOLE_FORMAT', 'text').lower()  # 控制台日志格式：text 或 json
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', '10000'))  # 待写出日志的队列长度，队列满时丢弃新的日志
+LOG_TASK_RATE = int(os.getenv('LOG_TASK_RATE', '20'))  # 每秒最多输出的单篇论文 INFO 日志条数，0 表示不限制
+
+# 推理调度配置（可选，可通过环境变量覆盖）
+MAX_CONCURRENCY = int(os.getenv('MAX_CONCURRENCY', '64'))  # 并发请求上限
+INITIAL_CONCURRENCY = int(os.getenv('INITIAL_CONCURRENCY', '8'))  # 初始并发数，之后按 AIMD 自适应调整
+REQUESTS_PER_SECOND = float(os.getenv('REQUESTS_PER_SECOND', '10'))  # 每秒请求数上限
+TOKENS_PER_MINUTE = float(os.getenv('TOKENS_PER_MINUTE', '1000000'))  # 每分钟 token 数上限
+LATENCY_THRESHOLD = float(os.getenv('LATENCY_THRESHOLD', '30'))  # 单次请求延迟低于该值（秒）时才增大并发
+
+# 运行截止时间与对冲请求配置（可选）
+RUN_DEADLINE_MINUTES = float(os.getenv('RUN_DEADLINE_MINUTES', '0'))  # 筛选阶段的时间预算（分钟），0 表示不限时；到时未完成的论文推迟到下次运行
+HEDGE_ENABLED = os.getenv('HEDGE_ENABLED', 'false').lower() == 'true'
+HEDGE_QUANTILE = float(os.getenv('HEDGE_QUANTILE', '0.95'))  # 请求耗时超过最近延迟的该分位数时发送一个相同的对冲请求
+HEDGE_MIN_SAMPLES = int(os.getenv('HEDGE_MIN_SAMPLES', '20'))  # 计算分位数至少需要的延迟样本数
+HEDGE_MAX_RATIO = float(os.getenv('HEDGE_MAX_RATIO', '0.1'))  # 对冲请求数占请求总数的比例上限
+
+# 打包请求配置（可选）：将多篇论文放入同一个请求，减少重复发送的系统提示词
+MICRO_BATCH_SIZE = int(os.getenv('MICRO_BATCH_SIZE', '1'))  # 每个请求最多包含的论文数，1 表示不打包
+MICRO_BATCH_MAX_TOKENS = int(os.getenv('MICRO_BATCH_MAX_TOKENS', '8000'))  # 打包请求的输入 token 上限（粗略估算）
+
+# 前缀缓存配置（可选）：每个系统提示词创建一次服务端缓存上下文，之后的请求只发送论文内容
+PREFIX_CACHE_ENABLED = os.getenv('PREFIX_CACHE_ENABLED', 'false').lower() == 'true'
+PREFIX_CACHE_TTL = int(os.getenv('PREFIX_CACHE_TTL', '3600'))  # 上下文的存活时间（秒）
+PREFIX_CACHE_REFRESH_MARGIN = float(os.getenv('PREFIX_CACHE_REFRESH_MARGIN', '300'))  # 距离过期不足该秒数时重新创建
+PREFIX_CACHE_RETRY_SECONDS = float(os.getenv('PREFIX_CACHE_RETRY_SECONDS', '60'))  # 临时错误导致创建失败后，再次尝试前等待的秒数
+
+# 结构化输出配置（可选）：回复先提取和修复 JSON 再按推理阶段的格式校验，无法恢复的回复才重新请求
+RESPONSE_FORMAT = os.getenv('RESPONSE_FORMAT', 'json_object').lower()  # json_object / json_schema / off，模型不支持时自动退回普通请求
+PARSE_RETRY_LIMIT = int(os.getenv('PARSE_RETRY_LIMIT', '1'))  # 修复后仍无法使用的回复重新请求的次数
+
+# 两阶段级联推理配置（可选）：小模型先判断相关性，主模型只为相关论文生成简介
+CASCADE_ENABLED = os.getenv('CASCADE_ENABLED', 'false').lower() == 'true'
+GATE_MODEL_NAME = os.getenv('GATE_MODEL_NAME') or MODEL_NAME  # 第一阶段使用的小模型
+GATE_MAX_TOKENS = int(os.getenv('GATE_MAX_TOKENS', '16'))  # 第一阶段的输出 token 上限
+GATE_MAX_CONCURRENCY = int(os.getenv('GATE_MAX_CONCURRENCY', str(MAX_CONCURRENCY)))  # 第一阶段的并发请求上限
+SUMMARY_MAX_CONCURRENCY = int(os.getenv('SUMMARY_MAX_CONCURRENCY', str(MAX_CONCURRENCY)))  # 第二阶段的并发请求上限
+
+# 本地预筛选配置（可选）：送入 LLM 前先用 BM25 剔除明显不相关的论文
+PREFILTER_ENABLED = os.getenv('PREFILTER_ENABLED', 'false').lower() == 'true'
+PREFILTER_TOP_K = int(os.getenv('PREFILTER_TOP_K', '50'))  # 每个研究兴趣至少保留的论文数
+PREFILTER_MIN_KEEP_RATIO = float(os.getenv('PREFILTER_MIN_KEEP_RATIO', '0.3'))  # 每个研究兴趣至少保留的论文比例
+PREFILTER_THRESHOLD = float(os.getenv('PREFILTER_THRESHOLD', '5'))  # BM25 得分超过该值的论文总是保留
+
+# 本地分类器配置（可选）：用历史 LLM 判断为每个研究兴趣训练线性模型，有把握判断为不相关的论文不再送入 LLM
+LOCAL_CLASSIFIER_MODE = os.getenv('LOCAL_CLASSIFIER_MODE', 'off').lower()  # off: 关闭；shadow: 只与 LLM 比较；active: 达到一致率后直接判断
+LOCAL_CLASSIFIER_THRESHOLD = float(os.getenv('LOCAL_CLASSIFIER_THRESHOLD', '0.98'))  # 不相关的概率不低于该值时由本地模型判断
+LOCAL_CLASSIFIER_RETRAIN_DAYS = float(os.getenv('LOCAL_CLASSIFIER_RETRAIN_DAYS', '7'))  # 每隔几天用新的结果重新训练
+LOCAL_CLASSIFIER_MIN_AGREEMENT = float(os.getenv('LOCAL_CLASSIFIER_MIN_AGREEMENT', '0.99'))  # 影子模式下与 LLM 的一致率达到该值才启用
+LOCAL_CLASSIFIER_MIN_SHADOW_SAMPLES = int(os.getenv('LOCAL_CLASSIFIER_MIN_SHADOW_SAMPLES', '200'))  # 计算一致率至少需要的论文数
+
+# 费用估算配置（可选）：每百万 token 的价格，用于指标中的费用统计
+PROMPT_TOKEN_PRICE = float(os.getenv('PROMPT_TOKEN_PRICE', '0'))  # 输入 token 单价
+COMPLETION_TOKEN_PRICE = float(os.getenv('COMPLETION_TOKEN_PRICE', '0'))  # 输出 token 单价
+CACHED_PROMPT_TOKEN_PRICE = float(os.getenv('CACHED_PROMPT_TOKEN_PRICE', str(PROMPT_TOKEN_PRICE)))  # 命中前缀缓存的输入 token 单价
 
 area_interest_list = [
     {
         "rss_url": "https://rss.arxiv.org/rss/cs.CL+cs.CV+cs.MM+cs.LG+cs.SI",
-        "area_interest": "我关注的研究话题是多模态大模型，尤其是与结构化数据（图、序列等）相关的研究，包括大模型结构化数据特征对齐、大模型结构化数据RAG、大模型思维链。具体的研究问题有：（1）如何有效地将结构化的信息（图、序列数据）与自然语言的语义空间进行对齐，使得模型能够同时理解数据结构和语义信息；（2）如何用适当的指令使得大模型理解结构化数据中的结构信息；（3）如何赋予大语言模型图学习下游任务的逐步推理能力，从而逐步推断出更复杂的关系和属性。（4）对于下游任务的推理能力，目前的研究比较少，针对序列数据的推理能力研究非常少。"
+        "area_interest": "我关注的研究话题是多模态大模型，尤其是与结构化数据（图、序列等）相关的研究，包括大模型结构化数据特征对齐、大模型结构化数据RAG、大模型思维链。具体的研究问题有：（1）如何有效地将结构化的信息（图、序列数据）与自然语言的语义空间进行对齐，使得模型能够同时理解数据结构和语义信息；（2）如何用适当的指令使得大模型理解结构化数据中的结构信息；（3）如何赋予大语言模型图学习下游任务的逐步推理能力，从而逐步推断出更复杂的关系和属性。（4）对于下游任务的推理能力，目前的研究比较少，针对序列数据的推理能力研究非常少。",
+        # 预筛选使用的英文关键词（论文摘要为英文，中文兴趣描述难以直接匹配）
+        "keywords": [
+            "multimodal", "large language model", "LLM", "graph", "graph neural network", "structured data",
+            "sequence", "time series", "alignment", "retrieval-augmented generation", "RAG",
+            "chain-of-thought", "reasoning", "instruction tuning", "graph learning"
+        ]
     },
     {
         "rss_url": "https://rss.arxiv.org/rss/cs.SD+eess.AS",
-        "area_interest": "我关注的研究话题是：1) 音频分类，包括Audioset/DCASE等数据集上有关audio tagging/sound event detection的工作，尤其是与Audioset Ontology相关的研究。2) 音频生成，包括：a）基础音频生成模型，包括Diffusion、Flow、VQGAN等；b）能够处理音频的LLM，包括音频的tokenization、音频的prompt、音频的上下文学习等。"
+        "area_interest": "我关注的研究话题是：1) 音频分类，包括Audioset/DCASE等数据集上有关audio tagging/sound event detection的工作，尤其是与Audioset Ontology相关的研究。2) 音频生成，包括：a）基础音频生成模型，包括Diffusion、Flow、VQGAN等；b）能够处理音频的LLM，包括音频的tokenization、音频的prompt、音频的上下文学习等。",
+        "keywords": [
+            "audio", "sound", "audio classification", "audio tagging", "sound event detection", "AudioSet",
+            "DCASE", "ontology", "audio generation", "diffusion", "flow matching", "VQGAN", "codec",
+            "audio LLM", "tokenization", "tokenizer", "prompt", "in-context learning"
+        ]
     },
 ]
 
@@ -62,3 +138,107 @@ For matching papers, summarize the abstract into a 200 - character Chinese intro
 - The "chineseSummary" part should be within 200 characters, accurately extract the core points of the paper, be in Chinese, and include the background, methods, and effects.
 - The "isRelated" field must be a boolean value (true/false), not a string ("true"/"false").
 """
+
+
+# 多兴趣模式的系统提示词：每篇论文只请求一次，同时判断所有研究兴趣
+MULTI_INTEREST_SYSTEM_PROMPT = """
+# Role
+You are a senior researcher dedicated to tracking academic frontier trends. You excel at precisely selecting valuable content from a vast amount of academic information. You can understand the user's research interests and compile the latest papers on arXiv each day that match the user's interests.
+
+## User Interests
+The user has several independent research interests, each identified by a number:
+
+{{user_interests}}
+
+## Work Steps
+### Step 1: Determine for every interest whether the paper matches
+1. For each interest listed above, determine independently if the abstract of this paper matches that interest.
+2. For an interest that does not match, output false (boolean value, not string) for "isRelated" and simply output "Unrelated" in the "chineseSummary" field without adding any other characters.
+3. For an interest that matches, proceed to the next step.
+
+### Step 2: Summarize the abstract and return
+For each matching interest, summarize the abstract into a 200 - character Chinese introduction, including the background, methods, and effects. If the abstract provides quantitative indicators of the effects, these indicators must also be included in the introduction.
+
+==Sample Reply (with interests 1 and 2)==
+{
+    "1": {
+        "isRelated": true,
+        "chineseSummary": "这是一篇关于..."
+    },
+    "2": {
+        "isRelated": false,
+        "chineseSummary": "Unrelated"
+    }
+}
+==End of Sample Reply==
+
+## Constraints:
+- Each conversation must strictly follow the steps.
+- The output should be a single JSON object whose keys are the interest numbers (as strings), and every interest number listed above must appear exactly once.
+- The "chineseSummary" part should be within 200 characters, accurately extract the core points of the paper, be in Chinese, and include the background, methods, and effects.
+- The "isRelated" field must be a boolean value (true/false), not a string ("true"/"false").
+"""
+
+
+# 打包请求时追加在系统提示词之后的说明
+PACKED_PROMPT_SUFFIX = """
+
+## Multiple Papers
+In this conversation you will receive several papers at once. Each paper starts with a line "## Paper <paperId>" (for example "## Paper P1").
+Apply all of the steps above to every paper independently.
+Instead of a single JSON object, output a JSON array with exactly one element per paper, in the same order as the input.
+Each element must be the JSON object you would reply for that paper alone, with an additional "paperId" field holding the paper's id, for example:
+[
+    {"paperId": "P1", ...},
+    {"paperId": "P2", ...}
+]
+Output only the JSON array, without any other text.
+"""
+
+# 回复无法解析或格式不符时，重新请求追加在用户消息之后的说明
+REASK_PROMPT_SUFFIX = """
+
+## Note
+Your previous reply for this paper could not be used: {{error}}
+Reply again with only the JSON object in the required format, without any other text.
+"""
+
+# 级联推理第一阶段的系统提示词：只判断是否相关
+GATE_SYSTEM_PROMPT = """
+# Role
+You are a senior researcher who screens new arXiv papers for a user.
+
+## User Interests
+{{user_interest}}
+
+## Task
+Based on the academic fields that the user has clearly stated an interest in, determine if the abstract of the paper matches the user's interests.
+
+## Output
+Output only a JSON object with a single boolean field, without any other text:
+{"isRelated": true}
+or
+{"isRelated": false}
+"""
+
+# 级联推理第二阶段的系统提示词：为已判断为相关的论文生成中文简介
+SUMMARY_SYSTEM_PROMPT = """
+# Role
+You are a senior researcher dedicated to tracking academic frontier trends. The following paper has already been judged to match the user's research interests.
+
+## User Interests
+{{user_interest}}
+
+## Task
+Summarize the abstract into a 200 - character Chinese introduction, including the background, methods, and effects. If the abstract provides quantitative indicators of the effects, these indicators must also be included in the introduction.
+
+==Sample Reply==
+{
+    "chineseSummary": "这是一篇关于..."
+}
+==End of Sample Reply==
+
+## Constraints:
+- The output should be in JSON format and must be organized according to the given sample reply format.
+- The "chineseSummary" part should be within 200 characters, accurately extract the core points of the paper, be in Chinese, and include the background, methods, and effects.
+"""
@@ -0,0 +1,188 @@
+import sqlite3
+import time
+from typing import Dict, Iterable, List
+from inference_cache import hash_text
+from logger import setup_logger
+from utils import extract_abstract, extract_announce_type, extract_arxiv_id, extract_version
+
+logger = setup_logger(__name__)
+
+STORE_FILE = "rss_store.db"
+
+ENTRY_FIELDS = ("id", "title", "link", "author", "published", "summary", "announce_type", "version")
+
+# 旧版本创建的条目库缺少的列，打开时补上
+ADDED_COLUMNS = {"announce_type": "TEXT", "version": "INTEGER"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS feeds (
+    feed_url TEXT PRIMARY KEY,
+    title TEXT,
+    link TEXT,
+    updated TEXT,
+    published TEXT,
+    etag TEXT,
+    last_modified TEXT,
+    fetched_at REAL
+);
+CREATE TABLE IF NOT EXISTS entries (
+    feed_url TEXT NOT NULL,
+    arxiv_id TEXT NOT NULL,
+    id TEXT,
+    title TEXT,
+    link TEXT,
+    author TEXT,
+    published TEXT,
+    summary TEXT,
+    announce_type TEXT,  -- new / cross / replace / replace-cross
+    version INTEGER,
+    content_hash TEXT NOT NULL,
+    first_seen_at REAL,
+    updated_at REAL,
+    pending INTEGER NOT NULL DEFAULT 1,  -- 0: 已处理；1: 待筛选；2: 上次运行到截止时间未完成，推迟到本次
+    PRIMARY KEY (feed_url, arxiv_id)
+);
+CREATE INDEX IF NOT EXISTS idx_entries_pending ON entries (feed_url, pending);
+"""
+
+def entry_content_hash(entry: dict) -> str:
+    """条目内容哈希：标题或摘要变化时视为条目有更新"""
+    return hash_text(entry["title"] + "\n" + extract_abstract(entry["summary"]))
+
+def entry_values(entry: dict) -> tuple:
+    """条目各字段的值，缺少公告类型或版本号的条目（如补录的历史条目）从 id 和摘要中提取"""
+    fields = {
+        "announce_type": entry.get("announce_type") or extract_announce_type(entry["summary"]),
+        "version": entry.get("version") or extract_version(entry["id"])
+    }
+    return tuple(fields[field] if field in fields else entry[field] for field in ENTRY_FIELDS)
+
+class EntryStore:
+    """基于 SQLite 的RSS条目库
+
+    按 (feed, arXiv id) 增量保存条目，写入时与已有条目比较，
+    新增或内容变化的条目标记为待筛选，筛选阶段只读取这些条目。
+    """
+
+    def __init__(self, db_file: str = STORE_FILE):
+        self.db_file = db_file
+        self.conn = sqlite3.connect(db_file)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(entries)")}
+        with self.conn:
+            for column, column_type in ADDED_COLUMNS.items():
+                if column not in columns:
+                    self.conn.execute(f"ALTER TABLE entries ADD COLUMN {column} {column_type}")
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def load_feeds(self) -> Dict[str, dict]:
+        """读取所有feed的元信息（不含条目），格式与 get_rss 的返回值一致"""
+        feeds = {}
+        for row in self.conn.execute("SELECT * FROM feeds"):
+            feeds[row["feed_url"]] = {
+                "feed": {
+                    "title": row["title"],
+                    "link": row["link"],
+                    "updated": row["updated"],
+                    "published": row["published"]
+                },
+                "etag": row["etag"],
+                "last_modified": row["last_modified"]
+            }
+        return feeds
+
+    def save_feed(self, feed_url: str, feed: dict) -> List[str]:
+        """保存一次获取到的feed，返回新增或内容变化的条目的 arXiv id
+
+        标题和摘要都没有变化的新版本（如只更新了 PDF 的 replace 公告）只更新版本号和公告类型，不重新筛选。
+        """
+        now = time.time()
+        existing = {
+            row["arxiv_id"]: (row["content_hash"], row["id"])
+            for row in self.conn.execute("SELECT arxiv_id, content_hash, id FROM entries WHERE feed_url = ?", (feed_url,))
+        }
+        changed_rows = []
+        version_rows = []
+        for entry in feed["entries"]:
+            arxiv_id = extract_arxiv_id(entry["id"])
+            content_hash = entry_content_hash(entry)
+            values = entry_values(entry)
+            previous_hash, previous_id = existing.get(arxiv_id, (None, None))
+            if previous_hash == content_hash:
+                if previous_id != entry["id"]:
+                    version_rows.append((entry["id"], *values[-2:], now, feed_url, arxiv_id))
+                continue
+            existing[arxiv_id] = (content_hash, entry["id"])
+            changed_rows.append((feed_url, arxiv_id, *values, content_hash, now, now))
+
+        with self.conn:
+            self.conn.execute(
+                """INSERT INTO feeds (feed_url, title, link, updated, published, etag, last_modified, fetched_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (feed_url) DO UPDATE SET
+                       title = excluded.title, link = excluded.link, updated = excluded.updated,
+                       published = excluded.published, etag = excluded.etag,
+                       last_modified = excluded.last_modified, fetched_at = excluded.fetched_at""",
+                (feed_url, feed["feed"]["title"], feed["feed"]["link"], feed["feed"]["updated"],
+                 feed["feed"]["published"], feed.get("etag"), feed.get("last_modified"), now)
+            )
+            self.conn.executemany(
+                """INSERT INTO entries (feed_url, arxiv_id, id, title, link, author, published, summary,
+                                        announce_type, version, content_hash, first_seen_at, updated_at, pending)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, 1)
+                   ON CONFLICT (feed_url, arxiv_id) DO UPDATE SET
+                       id = excluded.id, title = excluded.title, link = excluded.link, author = excluded.author,
+                       published = excluded.published, summary = excluded.summary,
+                       announce_type = excluded.announce_type, version = excluded.version,
+                       content_hash = excluded.content_hash, updated_at = excluded.updated_at, pending = 1""",
+                changed_rows
+            )
+            self.conn.executemany(
+                "UPDATE entries SET id = ?, announce_type = ?, version = ?, updated_at = ? WHERE feed_url = ? AND arxiv_id = ?",
+                version_rows
+            )
+        logger.info(f"{feed_url}: 共 {len(feed['entries'])} 个条目，新增或变化 {len(changed_rows)} 个，内容未变的新版本 {len(version_rows)} 个")
+        return [row[1] for row in changed_rows]
+
+    def load_pending(self) -> Dict[str, dict]:
+        """读取所有待筛选的条目，按feed分组，格式与 get_rss 的返回值一致
+
+        上次运行推迟的条目的 arXiv id 放在 deferred 字段中，筛选时优先处理。
+        """
+        feeds = self.load_feeds()
+        pending = {}
+        for feed_url, feed in feeds.items():
+            rows = self.conn.execute(
+                f"SELECT arxiv_id, pending, {', '.join(ENTRY_FIELDS)} FROM entries WHERE feed_url = ? AND pending >= 1 ORDER BY rowid",
+                (feed_url,)
+            ).fetchall()
+            if rows:
+                pending[feed_url] = {
+                    **feed,
+                    "entries": [dict(zip(ENTRY_FIELDS, entry_values(dict(row)))) for row in rows],
+                    "deferred": {row["arxiv_id"] for row in rows if row["pending"] == 2}
+                }
+        return pending
+
+    def count_pending(self) -> int:
+        """待筛选的条目数"""
+        return self.conn.execute("SELECT COUNT(*) FROM entries WHERE pending >= 1").fetchone()[0]
+
+    def mark_processed(self, feed_url: str, entries: Iterable[dict]) -> None:
+        """将已筛选的条目标记为已处理，期间内容再次变化的条目保持待筛选"""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE entries SET pending = 0 WHERE feed_url = ? AND arxiv_id = ? AND content_hash = ?",
+                [(feed_url, extract_arxiv_id(entry["id"]), entry_content_hash(entry)) for entry in entries]
+            )
+
+    def mark_deferred(self, feed_url: str, entries: Iterable[dict]) -> None:
+        """将到截止时间仍未完成的条目标记为推迟，下次运行时优先筛选"""
+        with self.conn:
+            self.conn.executemany(
+                "UPDATE entries SET pending = 2 WHERE feed_url = ? AND arxiv_id = ? AND content_hash = ?",
+                [(feed_url, extract_arxiv_id(entry["id"]), entry_content_hash(entry)) for entry in entries]
+            )
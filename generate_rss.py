@@ -1,118 +1,211 @@
+import io
 import os
-import json
 from datetime import datetime
 import pytz
-from typing import List, Dict
+from typing import Iterable, List, Dict, Optional, TextIO
+from xml.sax.saxutils import escape, quoteattr
 from logger import setup_logger
+from result_store import ResultStore
+from tracing import tracer
+from subscriptions import SubscriptionRegistry
 from dotenv import load_dotenv
 
 load_dotenv()
 
 logger = setup_logger(__name__)
 
-def generate_rss_feed(json_data: List[Dict]) -> str:
-    """将JSON数据转换为RSS feed格式
-    
-    Args:
-        json_data: 包含论文信息的JSON数据
-        
-    Returns:
-        RSS feed的XML字符串
-    """
-    # 获取当前时间
-    now = datetime.now(pytz.timezone('Asia/Shanghai'))
-    current_time = now.strftime("%a, %d %b %Y %H:%M:%S %z")
-    
-    # 生成RSS feed的头部
-    rss_content = f"""<?xml version="1.0" encoding="UTF-8"?>
+ARXIV_UPDATES_DIR = "arxiv_updates"
+FEED_FILE = "feed.xml"
+FEED_TITLE = "arXiv Paper Filter"
+USER_FEEDS_DIR = "feeds"  # 多用户订阅时每个用户的feed: feeds/<用户 id>.xml
+RSS_WINDOW_DAYS = int(os.getenv("RSS_WINDOW_DAYS", "7"))  # feed 中保留最近几天的筛选结果
+RSS_TIME_FORMAT = "%a, %d %b %Y %H:%M:%S %z"
+
+def cdata(text: str) -> str:
+    """将文本包装为 CDATA，拆开文本中的 ]]> 以免提前结束"""
+    return "<![CDATA[" + text.replace("]]>", "]]]]><![CDATA[>") + "]]>"
+
+def write_rss_header(f: TextIO, current_time: str, feed_path: str = FEED_FILE, title: str = FEED_TITLE) -> None:
+    """写入RSS feed的头部"""
+    user_name = os.getenv("USER_NAME")
+    f.write(f"""<?xml version="1.0" encoding="UTF-8"?>
 <rss xmlns:arxiv="http://arxiv.org/schemas/atom" xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:atom="http://www.w3.org/2005/Atom" xmlns:content="http://purl.org/rss/1.0/modules/content/" version="2.0">
 <channel>
-    <title>arXiv Paper Filter</title>
-    <link>https://github.com/{os.getenv("USER_NAME")}/arxiv_filter</link>
+    <title>{escape(title)}</title>
+    <link>{escape(f"https://github.com/{user_name}/arxiv_filter")}</link>
     <description>根据研究兴趣筛选的arXiv论文</description>
-    <atom:link href="https://raw.githubusercontent.com/{os.getenv("USER_NAME")}/arxiv_filter/main/feed.xml" rel="self" type="application/rss+xml" />
+    <atom:link href={quoteattr(f"https://raw.githubusercontent.com/{user_name}/arxiv_filter/main/{feed_path}")} rel="self" type="application/rss+xml" />
     <docs>http://www.rssboard.org/rss-specification</docs>
     <language>zh-CN</language>
     <lastBuildDate>{current_time}</lastBuildDate>
-    <managingEditor>{os.getenv("USER_NAME")}@github.com</managingEditor>
+    <managingEditor>{escape(f"{user_name}@github.com")}</managingEditor>
     <pubDate>{current_time}</pubDate>
     <skipDays>
         <day>Saturday</day>
         <day>Sunday</day>
     </skipDays>
-"""
-    
-    # 添加每个论文条目
-    for category in json_data:
-        rss_url = category["rss_url"]
-        user_interest = category["user_interest"]
-        
-        for paper in category["filter_results"]:
-            # 解析发布时间
-            try:
-                published_time = datetime.strptime(paper["published"], "%a, %d %b %Y %H:%M:%S %z")
-            except ValueError:
-                published_time = now
-            
-            # 生成条目
-            rss_content += f"""
+""")
+
+def write_rss_footer(f: TextIO) -> None:
+    """写入RSS feed的尾部"""
+    f.write("""
+</channel>
+</rss>""")
+
+def write_rss_item(f: TextIO, paper: Dict, user_interest: str, now: datetime) -> None:
+    """写入单个论文条目，所有文本字段都经过转义"""
+    # 解析发布时间
+    try:
+        published_time = datetime.strptime(paper["published"], RSS_TIME_FORMAT)
+    except ValueError:
+        published_time = now
+
+    f.write(f"""
     <item>
-        <title>{paper["title"]}</title>
-        <link>{paper["link"]}</link>
-        <guid isPermaLink="false">oai:arXiv.org:{paper["id"]}</guid>
-        <category>{user_interest}</category>
-        <pubDate>{published_time.strftime("%a, %d %b %Y %H:%M:%S %z")}</pubDate>
-        <arxiv:announce_type>new</arxiv:announce_type>
+        <title>{escape(paper["title"])}</title>
+        <link>{escape(paper["link"])}</link>
+        <guid isPermaLink="false">{escape(paper["id"])}</guid>
+        <category>{escape(user_interest)}</category>
+        <pubDate>{published_time.strftime(RSS_TIME_FORMAT)}</pubDate>
+        <arxiv:announce_type>{escape(paper.get("announce_type") or "new")}</arxiv:announce_type>
         <dc:rights>http://arxiv.org/licenses/nonexclusive-distrib/1.0/</dc:rights>
-        <dc:creator>{paper["author"]}</dc:creator>
-        <description><![CDATA[
+        <dc:creator>{escape(paper["author"])}</dc:creator>
+        <description>{cdata(f'''
             {paper["chineseSummary"]}
             {paper["summary"]}
-        ]]></description>
-    </item>"""
-    
-    # 添加RSS feed的尾部
-    rss_content += """
-</channel>
-</rss>"""
-    
-    return rss_content
+        ''')}</description>
+    </item>""")
+
+def write_rss_feed(f: TextIO, json_data: Iterable[Dict]) -> int:
+    """将筛选结果逐条写入RSS feed，不在内存中拼接整个XML
+
+    Args:
+        f: 输出的文本流
+        json_data: 按 (rss_url, user_interest) 分组的筛选结果
+
+    Returns:
+        写入的条目数
+    """
+    now = datetime.now(pytz.timezone('Asia/Shanghai'))
+    write_rss_header(f, now.strftime(RSS_TIME_FORMAT))
+
+    item_count = 0
+    for category in json_data:
+        for paper in category["filter_results"]:
+            write_rss_item(f, paper, category["user_interest"], now)
+            item_count += 1
+
+    write_rss_footer(f)
+    return item_count
+
+def generate_rss_feed(json_data: List[Dict]) -> str:
+    """将JSON数据转换为RSS feed格式
+
+    Args:
+        json_data: 包含论文信息的JSON数据
+
+    Returns:
+        RSS feed的XML字符串
+    """
+    buffer = io.StringIO()
+    write_rss_feed(buffer, json_data)
+    return buffer.getvalue()
+
+class FeedWriter:
+    """逐条追加的RSS feed写入器
+
+    筛选过程中每完成一篇相关论文就追加到临时文件，关闭时补上历史窗口中的条目
+    （同一兴趣下已写入的论文不再重复），再原子替换正式的feed文件。
+    """
+
+    def __init__(self, feed_file: str = FEED_FILE, title: str = FEED_TITLE):
+        self.feed_file = feed_file
+        self.temp_file = feed_file + ".tmp"
+        self.now = datetime.now(pytz.timezone('Asia/Shanghai'))
+        self.file = open(self.temp_file, 'w', encoding='utf-8')
+        self.seen = set()
+        self.item_count = 0
+        write_rss_header(self.file, self.now.strftime(RSS_TIME_FORMAT), feed_file.replace(os.sep, "/"), title)
+
+    def append(self, paper: Dict, user_interest: str) -> None:
+        """追加一个条目并刷盘"""
+        key = (paper["id"], user_interest)
+        if key in self.seen:
+            return
+        self.seen.add(key)
+        write_rss_item(self.file, paper, user_interest, self.now)
+        self.file.flush()
+        self.item_count += 1
+
+    def close(self, history: Optional[Iterable[Dict]] = None) -> int:
+        """写入历史条目和尾部并替换正式的feed文件，返回条目总数"""
+        for category in history or []:
+            for paper in category["filter_results"]:
+                self.append(paper, category["user_interest"])
+        write_rss_footer(self.file)
+        self.file.close()
+        os.replace(self.temp_file, self.feed_file)
+        return self.item_count
+
+    def abort(self) -> None:
+        """放弃写入，保留原有的feed文件"""
+        self.file.close()
+        if os.path.exists(self.temp_file):
+            os.remove(self.temp_file)
+
+def finish_feed(writer: FeedWriter, store: ResultStore) -> None:
+    """用最近 RSS_WINDOW_DAYS 天的结果补全并替换feed，出错时保留原有的feed"""
+    try:
+        with tracer.span("render_feed", "render", feed=writer.feed_file) as span:
+            item_count = writer.close(store.window(RSS_WINDOW_DAYS))
+            span.set(items=item_count)
+        logger.info(f"RSS feed生成成功，共 {item_count} 个条目（最近 {RSS_WINDOW_DAYS} 天）")
+    except Exception as e:
+        logger.error(f"保存RSS feed时发生错误: {e}")
+        writer.abort()
+
+def render_user_feeds(users: Dict[str, List[tuple]], store: ResultStore) -> None:
+    """为每个用户生成只包含其订阅的feed
+
+    Args:
+        users: 用户 id -> 订阅的 (rss_url, user_interest) 列表
+        store: 筛选结果库
+    """
+    window = store.window(RSS_WINDOW_DAYS)
+    os.makedirs(USER_FEEDS_DIR, exist_ok=True)
+    for user_id, subscribed in users.items():
+        subscribed = set(subscribed)
+        writer = FeedWriter(os.path.join(USER_FEEDS_DIR, f"{user_id}.xml"), f"{FEED_TITLE} - {user_id}")
+        try:
+            with tracer.span("render_feed", "render", feed=writer.feed_file):
+                writer.close(category for category in window if (category["rss_url"], category["user_interest"]) in subscribed)
+        except Exception as e:
+            logger.error(f"保存用户 {user_id} 的RSS feed时发生错误: {e}")
+            writer.abort()
+    logger.info(f"已生成 {len(users)} 个用户的RSS feed")
 
 def main():
     """主函数"""
-    # 获取最新的JSON文件
-    arxiv_updates_dir = "arxiv_updates"
-    if not os.path.exists(arxiv_updates_dir):
+    if not os.path.exists(ARXIV_UPDATES_DIR):
         logger.error("arxiv_updates目录不存在")
         return
-    
-    # 获取最新的JSON文件
-    json_files = [f for f in os.listdir(arxiv_updates_dir) if f.endswith('.json')]
-    if not json_files:
-        logger.error("没有找到JSON文件")
-        return
-    
-    latest_json = max(json_files, key=lambda x: os.path.getctime(os.path.join(arxiv_updates_dir, x)))
-    json_path = os.path.join(arxiv_updates_dir, latest_json)
-    
-    # 读取JSON数据
-    try:
-        with open(json_path, 'r', encoding='utf-8') as f:
-            json_data = json.load(f)
-    except Exception as e:
-        logger.error(f"读取JSON文件时发生错误: {e}")
-        return
-    
-    # 生成RSS feed
-    rss_content = generate_rss_feed(json_data)
-    
-    # 保存RSS feed
+
+    store = ResultStore()
     try:
-        with open('feed.xml', 'w', encoding='utf-8') as f:
-            f.write(rss_content)
-        logger.info("RSS feed生成成功")
-    except Exception as e:
-        logger.error(f"保存RSS feed时发生错误: {e}")
+        # 导入结果库之外产生的日期结果文件（如旧版本生成的历史结果）
+        store.import_dated_files()
+        if store.is_empty():
+            logger.error("结果库中没有筛选结果")
+            return
+
+        # 先写入临时文件再替换，避免生成失败时留下不完整的feed
+        finish_feed(FeedWriter(), store)
+
+        registry = SubscriptionRegistry.load()
+        if registry.multi_tenant:
+            render_user_feeds(registry.users(), store)
+    finally:
+        store.close()
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()
@@ -1,45 +1,118 @@
 import feedparser
-from typing import Optional
+import httpx
+from typing import Optional, Tuple
+from lxml import etree
 from logger import setup_logger
+from metrics import metrics
+from rss_parser import UnsupportedFeed, parse_rss
+from tracing import tracer
+from utils import extract_announce_type, extract_version
 
 logger = setup_logger(__name__)
 
+def parse_feed(feed, url: str) -> Optional[dict]:
+    """将 feedparser 的解析结果转换为普通字典"""
+    if not feed.entries:
+        logger.warning(f"RSS feed {url} 中没有找到entries")
+        return None
+
+    if not hasattr(feed.feed, 'updated'):
+        logger.warning(f"RSS feed {url} 中没有updated字段")
+        return None
+
+    return {
+        "feed": {
+            "title": feed.feed.title,
+            "link": feed.feed.link,
+            "updated": feed.feed.updated,
+            "published": feed.feed.published
+        },
+        "entries": [
+            {
+                "id": entry.id,
+                "title": entry.title,
+                "link": entry.link,
+                "author": entry.author,
+                "published": entry.published,
+                "summary": entry.summary,
+                # new / cross / replace / replace-cross，用于增量筛选时跳过或复用之前的判断
+                "announce_type": entry.get("arxiv_announce_type") or extract_announce_type(entry.summary),
+                "version": extract_version(entry.id),
+            }
+            for entry in feed.entries
+        ]
+    }
+
+def parse_content(content: bytes, url: str, response_headers: Optional[dict] = None) -> Optional[dict]:
+    """解析下载的 feed：优先使用 lxml 流式解析，非 arXiv 格式的 feed 退回 feedparser"""
+    try:
+        feed = parse_rss(content)
+    except (etree.XMLSyntaxError, UnsupportedFeed) as e:
+        logger.info(f"RSS feed {url} 无法流式解析（{e}），退回 feedparser")
+        metrics.inc("rss_parser_fallbacks_total", help_text="Feeds parsed with feedparser after the streaming parser gave up", feed=url)
+        return parse_feed(feedparser.parse(content, response_headers=response_headers), url)
+    if not feed["entries"]:
+        logger.warning(f"RSS feed {url} 中没有找到entries")
+        return None
+    if "updated" not in feed["feed"]:
+        logger.warning(f"RSS feed {url} 中没有updated字段")
+        return None
+    feed["feed"].setdefault("published", feed["feed"]["updated"])
+    return feed
+
 def get_rss_from_url(url: str) -> Optional[dict]:
     try:
         logger.info(f"开始获取RSS feed: {url}")
-        feed = feedparser.parse(url)
-        
-        if not feed.entries:
-            logger.warning(f"RSS feed {url} 中没有找到entries")
-            return None
-            
-        if not hasattr(feed.feed, 'updated'):
-            logger.warning(f"RSS feed {url} 中没有updated字段")
-            return None
-            
-        return {
-            "feed": {
-                "title": feed.feed.title,
-                "link": feed.feed.link,
-                "updated": feed.feed.updated,
-                "published": feed.feed.published
-            },
-            "entries": [
-                {
-                    "id": entry.id,
-                    "title": entry.title,
-                    "link": entry.link,
-                    "author": entry.author,
-                    "published": entry.published,
-                    "summary": entry.summary,
-                }
-                for entry in feed.entries
-            ]
-        }
+        response = httpx.get(url, follow_redirects=True, timeout=60)
+        response.raise_for_status()
+        return parse_content(response.content, url, dict(response.headers))
     except Exception as e:
         logger.error(f"获取RSS feed时发生错误: {url}, 错误信息: {str(e)}")
         return None
 
+async def fetch_rss_from_url(
+    client: httpx.AsyncClient,
+    url: str,
+    etag: Optional[str] = None,
+    last_modified: Optional[str] = None
+) -> Tuple[bool, Optional[dict]]:
+    """使用条件请求异步获取RSS feed
+
+    Args:
+        client: 复用连接池的 httpx 异步客户端
+        url: RSS feed 地址
+        etag: 上次响应的 ETag
+        last_modified: 上次响应的 Last-Modified
+
+    Returns:
+        (是否未修改, 解析后的feed)。服务端返回 304 时为 (True, None)，
+        获取或解析失败时为 (False, None)。解析结果中附带本次响应的 etag 和 last_modified。
+    """
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    try:
+        logger.info(f"开始获取RSS feed: {url}")
+        with tracer.span("fetch", "fetch", url=url) as span:
+            response = await client.get(url, headers=headers)
+            span.set(status=response.status_code, bytes=len(response.content))
+        if response.status_code == 304:
+            logger.info(f"RSS feed {url} 未修改 (304)")
+            return True, None
+        response.raise_for_status()
+        with tracer.span("parse", "parse", url=url) as span:
+            feed = parse_content(response.content, url, dict(response.headers))
+            span.set(entries=len(feed["entries"]) if feed is not None else 0)
+        if feed is not None:
+            feed["etag"] = response.headers.get("ETag")
+            feed["last_modified"] = response.headers.get("Last-Modified")
+        return False, feed
+    except Exception as e:
+        logger.error(f"获取RSS feed时发生错误: {url}, 错误信息: {str(e)}")
+        return False, None
+
 if __name__ == "__main__":
     url = "https://rss.arxiv.org/rss/cs.AI"
     result = get_rss_from_url(url)
@@ -0,0 +1,90 @@
+import hashlib
+import json
+import os
+import time
+from typing import Dict, Optional
+from logger import setup_logger
+
+logger = setup_logger(__name__)
+
+INFERENCE_CACHE_FILE = os.path.join("arxiv_updates", "inference_cache.json")
+DEFAULT_MAX_ENTRIES = 50000  # 缓存条目上限，超出后按写入时间淘汰最旧的条目
+DEFAULT_MAX_AGE_DAYS = 30  # 缓存条目最长保留天数
+
+def hash_text(text: str) -> str:
+    """计算文本的哈希值，用于缓存键"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+class InferenceCache:
+    """按论文粒度的推理结果缓存
+
+    缓存键由 arXiv id、摘要哈希、兴趣哈希和模型名共同决定，
+    只要其中任意一项变化就会重新推理，否则直接复用历史结果。
+    """
+
+    def __init__(
+        self,
+        cache_file: str = INFERENCE_CACHE_FILE,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        max_age_days: float = DEFAULT_MAX_AGE_DAYS
+    ):
+        self.cache_file = cache_file
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_days * 24 * 3600
+        self.entries: Dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(arxiv_id: str, abstract: str, user_interest: str, model_name: str) -> str:
+        """生成单篇论文的缓存键"""
+        combined = "|||".join([arxiv_id, hash_text(abstract), hash_text(user_interest), model_name])
+        return hash_text(combined)
+
+    def load(self) -> None:
+        """从文件加载缓存，并淘汰过期条目"""
+        if not os.path.exists(self.cache_file):
+            return
+        try:
+            with open(self.cache_file, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except Exception as e:
+            logger.error(f"读取推理缓存文件失败: {str(e)}")
+            self.entries = {}
+        self.evict()
+        logger.info(f"已加载推理缓存 {len(self.entries)} 条")
+
+    def save(self) -> None:
+        """淘汰后将缓存写回文件"""
+        self.evict()
+        os.makedirs(os.path.dirname(self.cache_file) or ".", exist_ok=True)
+        try:
+            with open(self.cache_file, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            logger.info(f"推理缓存已保存到: {self.cache_file}（{len(self.entries)} 条）")
+        except Exception as e:
+            logger.error(f"保存推理缓存失败: {str(e)}")
+
+    def evict(self) -> None:
+        """按时间和数量上限淘汰条目"""
+        now = time.time()
+        self.entries = {
+            key: value for key, value in self.entries.items()
+            if now - value.get("created_at", 0) <= self.max_age_seconds
+        }
+        if len(self.entries) > self.max_entries:
+            newest = sorted(self.entries.items(), key=lambda kv: kv[1].get("created_at", 0), reverse=True)
+            self.entries = dict(newest[:self.max_entries])
+
+    def get(self, key: str) -> Optional[dict]:
+        """查询缓存，命中时返回模型输出字段"""
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value["result"]
+
+    def put(self, key: str, result: dict) -> None:
+        """写入单篇论文的模型输出"""
+        self.entries[key] = {"result": result, "created_at": time.time()}
@@ -0,0 +1,59 @@
+import json
+import os
+import time
+from datetime import datetime
+from typing import Dict, Optional
+from logger import setup_logger
+
+logger = setup_logger(__name__)
+
+JOURNAL_DIR = "arxiv_updates"
+
+def get_journal_file() -> str:
+    """获取当天的推理日志文件路径"""
+    current_date = datetime.now().strftime("%Y-%m-%d")
+    return os.path.join(JOURNAL_DIR, f"inference_journal_{current_date}.jsonl")
+
+class InferenceJournal:
+    """只追加的推理日志（JSONL）
+
+    每完成一个推理任务立即写入一行并刷盘，进程中途崩溃时已完成的结果不会丢失，
+    以 --resume 重新运行时只需补跑日志中没有成功记录的任务。
+    """
+
+    def __init__(self, journal_file: Optional[str] = None):
+        self.journal_file = journal_file or get_journal_file()
+        self.completed: Dict[str, dict] = {}
+        self.file = None
+
+    def load(self) -> None:
+        """读取已有日志，跳过进程崩溃时可能写了一半的最后一行"""
+        if not os.path.exists(self.journal_file):
+            return
+        with open(self.journal_file, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"跳过损坏的日志行: {self.journal_file}:{line_number}")
+                    continue
+                self.completed[record["key"]] = record["result"]
+        logger.info(f"从 {self.journal_file} 恢复 {len(self.completed)} 条已完成的推理结果")
+
+    def get(self, key: str) -> Optional[dict]:
+        return self.completed.get(key)
+
+    def append(self, key: str, result: dict) -> None:
+        """追加一条已完成的推理结果"""
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.journal_file) or ".", exist_ok=True)
+            self.file = open(self.journal_file, 'a', encoding='utf-8')
+        record = {"key": key, "created_at": time.time(), "result": result}
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.completed[key] = result
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
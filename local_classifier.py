@@ -0,0 +1,385 @@
+"""本地分类器：用历史 LLM 判断为每个研究兴趣训练的线性模型
+
+训练数据来自结果库中 LLM 给出的 (标题和摘要, isRelated)，特征为单词和相邻两词的哈希稀疏特征，
+用 NumPy 训练带 L2 正则的逻辑回归。留出 1/5 的论文（按 arXiv id 哈希划分）计算校准报告。
+
+新训练的模型先运行在影子模式：所有论文仍送入 LLM，只统计本地模型有把握判断为不相关的论文中
+与 LLM 一致的比例。LOCAL_CLASSIFIER_MODE=active 且一致率达到 LOCAL_CLASSIFIER_MIN_AGREEMENT 后，
+这些论文直接判断为不相关，只有不确定的论文送入 LLM。相关的论文仍需要 LLM 生成中文简介，
+所以本地模型只替 LLM 判断不相关的论文。每次重新训练后影子统计从零开始。
+
+示例:
+    python local_classifier.py train
+    python local_classifier.py report
+"""
+import argparse
+import json
+import math
+import os
+import sys
+import time
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from config import (
+    LOCAL_CLASSIFIER_MODE, LOCAL_CLASSIFIER_THRESHOLD, LOCAL_CLASSIFIER_RETRAIN_DAYS,
+    LOCAL_CLASSIFIER_MIN_AGREEMENT, LOCAL_CLASSIFIER_MIN_SHADOW_SAMPLES
+)
+from inference_cache import hash_text
+from logger import setup_logger
+from metrics import metrics, interest_label
+from prefilter import tokenize
+from result_store import ResultStore
+from utils import extract_abstract, extract_arxiv_id, is_related
+
+logger = setup_logger(__name__)
+
+CLASSIFIER_DIR = os.path.join("arxiv_updates", "local_classifier")
+CLASSIFIER_MODES = ("off", "shadow", "active")
+LOCAL_DECISION = "local"  # 本地模型判断的结果在 decidedBy 字段中的取值，不作为训练数据
+FEATURE_BITS = 18  # 特征哈希的维度为 2^18
+TRAIN_EPOCHS = 300
+LEARNING_RATE = 0.5
+L2_PENALTY = 1e-4
+HOLDOUT_BUCKETS = 5  # 按 arXiv id 哈希取 1/HOLDOUT_BUCKETS 的论文作为留出集
+CALIBRATION_BINS = 10
+MIN_TRAIN_SAMPLES = 200  # 训练至少需要的论文数
+MIN_TRAIN_POSITIVES = 10  # 训练至少需要的相关论文数
+
+def paper_text(paper: dict) -> str:
+    """模型输入：标题和摘要"""
+    return paper["title"] + "\n" + extract_abstract(paper["summary"])
+
+def featurize(texts: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """将文本转换为单词和相邻两词的哈希稀疏特征，每行做 L2 归一化
+
+    Returns:
+        (行号, 特征列号, 特征值) 三个等长数组
+    """
+    rows: List[int] = []
+    cols: List[int] = []
+    values: List[float] = []
+    mask = (1 << FEATURE_BITS) - 1
+    for row, text in enumerate(texts):
+        tokens = tokenize(text)
+        counts = Counter(tokens)
+        counts.update(f"{first} {second}" for first, second in zip(tokens, tokens[1:]))
+        features: Dict[int, float] = {}
+        for term, count in counts.items():
+            # crc32 在不同进程间稳定，内置的 hash() 不稳定
+            index = zlib.crc32(term.encode("utf-8")) & mask
+            features[index] = features.get(index, 0.0) + 1.0 + math.log(count)
+        norm = math.sqrt(sum(value * value for value in features.values())) or 1.0
+        for index, value in features.items():
+            rows.append(row)
+            cols.append(index)
+            values.append(value / norm)
+    return np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64), np.array(values, dtype=np.float64)
+
+def sigmoid(z: np.ndarray) -> np.ndarray:
+    return 1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))
+
+class LinearClassifier:
+    """哈希稀疏特征上的逻辑回归，输出论文相关的概率"""
+
+    def __init__(self, weights: np.ndarray, bias: float):
+        self.weights = weights
+        self.bias = bias
+
+    def predict_proba(self, texts: List[str]) -> np.ndarray:
+        rows, cols, values = featurize(texts)
+        z = self.bias + np.bincount(rows, weights=values * self.weights[cols], minlength=len(texts))
+        return sigmoid(z)
+
+    @classmethod
+    def fit(cls, texts: List[str], labels: List[bool]) -> "LinearClassifier":
+        """用 AdaGrad 全批量梯度下降训练，稀疏矩阵乘法用 np.bincount 完成
+
+        Args:
+            texts: 论文文本
+            labels: LLM 给出的 isRelated
+        """
+        y = np.asarray(labels, dtype=np.float64)
+        n = len(texts)
+        dim = 1 << FEATURE_BITS
+        rows, cols, values = featurize(texts)
+        weights = np.zeros(dim)
+        # 偏置从先验的对数几率开始，相关论文很少时收敛更快
+        positive_rate = min(max(y.mean(), 1e-3), 1 - 1e-3)
+        bias = math.log(positive_rate / (1 - positive_rate))
+        squared = np.full(dim, 1e-8)
+        bias_squared = 1e-8
+        for _ in range(TRAIN_EPOCHS):
+            z = bias + np.bincount(rows, weights=values * weights[cols], minlength=n)
+            error = sigmoid(z) - y
+            gradient = np.bincount(cols, weights=values * error[rows], minlength=dim) / n + L2_PENALTY * weights
+            bias_gradient = float(error.mean())
+            squared += gradient ** 2
+            bias_squared += bias_gradient ** 2
+            weights -= LEARNING_RATE * gradient / np.sqrt(squared)
+            bias -= LEARNING_RATE * bias_gradient / math.sqrt(bias_squared)
+        return cls(weights.astype(np.float32), bias)
+
+def calibration_report(probabilities: np.ndarray, labels: np.ndarray, threshold: float) -> dict:
+    """在留出集上统计校准情况和按阈值自动判断的效果
+
+    Returns:
+        包含 Brier 分数、各概率区间的预测均值与实际相关比例、
+        自动判断的比例 (auto_rate)、自动判断的准确率 (auto_accuracy) 和被漏掉的相关论文数 (missed_related)
+    """
+    labels = labels.astype(np.float64)
+    bins = []
+    edges = np.linspace(0.0, 1.0, CALIBRATION_BINS + 1)
+    for index, (low, high) in enumerate(zip(edges[:-1], edges[1:])):
+        in_bin = (probabilities >= low) & ((probabilities < high) if index < CALIBRATION_BINS - 1 else (probabilities <= high))
+        count = int(in_bin.sum())
+        bins.append({
+            "range": [round(float(low), 2), round(float(high), 2)],
+            "count": count,
+            "mean_predicted": float(probabilities[in_bin].mean()) if count else None,
+            "observed_rate": float(labels[in_bin].mean()) if count else None
+        })
+    auto = probabilities <= 1 - threshold
+    return {
+        "samples": len(labels),
+        "positives": int(labels.sum()),
+        "brier": float(np.mean((probabilities - labels) ** 2)) if len(labels) else None,
+        "bins": bins,
+        "auto_rate": float(auto.mean()) if len(labels) else 0.0,
+        "auto_accuracy": float(1 - labels[auto].mean()) if auto.any() else None,
+        "missed_related": int(labels[auto].sum())
+    }
+
+def training_examples(result_store: ResultStore, user_interest: str) -> Tuple[List[str], List[bool], List[str]]:
+    """从结果库中取出某个研究兴趣下 LLM 判断成功的论文，同一篇论文只保留最新的判断
+
+    Returns:
+        (论文文本, isRelated, arXiv id)
+    """
+    texts, labels, arxiv_ids = [], [], []
+    seen = set()
+    for row in result_store.query(interest_hash=hash_text(user_interest), related_only=False):
+        if row.get("success") is not True or row.get("decidedBy") == LOCAL_DECISION:
+            continue
+        arxiv_id = extract_arxiv_id(row["id"])
+        if arxiv_id in seen or not row.get("title") or not row.get("summary"):
+            continue
+        seen.add(arxiv_id)
+        texts.append(paper_text(row))
+        labels.append(is_related(row))
+        arxiv_ids.append(arxiv_id)
+    return texts, labels, arxiv_ids
+
+class LocalClassifiers:
+    """所有研究兴趣的本地分类器
+
+    模型权重保存在 arxiv_updates/local_classifier/<兴趣哈希>.npz，
+    训练时间、校准报告和影子模式统计保存在同目录的 index.json 中，
+    因数据不足而没有训练出模型的尝试时间保存在 failed_attempts.json 中，同样每隔 retrain_days 才重新尝试。
+    """
+
+    def __init__(
+        self,
+        mode: str = LOCAL_CLASSIFIER_MODE,
+        threshold: float = LOCAL_CLASSIFIER_THRESHOLD,
+        retrain_days: float = LOCAL_CLASSIFIER_RETRAIN_DAYS,
+        min_agreement: float = LOCAL_CLASSIFIER_MIN_AGREEMENT,
+        min_shadow_samples: int = LOCAL_CLASSIFIER_MIN_SHADOW_SAMPLES,
+        directory: str = CLASSIFIER_DIR
+    ):
+        if mode not in CLASSIFIER_MODES:
+            raise ValueError(f"LOCAL_CLASSIFIER_MODE 只能是 {' / '.join(CLASSIFIER_MODES)}: {mode}")
+        self.mode = mode
+        self.threshold = threshold
+        self.retrain_days = retrain_days
+        self.min_agreement = min_agreement
+        self.min_shadow_samples = min_shadow_samples
+        self.directory = directory
+        self.index_file = os.path.join(directory, "index.json")
+        self.failed_attempts_file = os.path.join(directory, "failed_attempts.json")
+        self.index: Dict[str, dict] = {}  # 兴趣哈希 -> 模型信息
+        self.failed_attempts: Dict[str, float] = {}  # 兴趣哈希 -> 最近一次训练失败的时间
+        self.models: Dict[str, LinearClassifier] = {}
+
+    def load(self) -> None:
+        if os.path.exists(self.index_file):
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                self.index = json.load(f)
+        if os.path.exists(self.failed_attempts_file):
+            with open(self.failed_attempts_file, 'r', encoding='utf-8') as f:
+                self.failed_attempts = json.load(f)
+
+    def save(self) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        for file_name, data in ((self.index_file, self.index), (self.failed_attempts_file, self.failed_attempts)):
+            temp_file = file_name + ".tmp"
+            with open(temp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(temp_file, file_name)
+
+    def model_file(self, interest_hash: str) -> str:
+        return os.path.join(self.directory, f"{interest_hash}.npz")
+
+    def needs_training(self, user_interest: str) -> bool:
+        """距离上次训练或上次因数据不足失败的尝试超过 retrain_days 时需要训练"""
+        interest_hash = hash_text(user_interest)
+        info = self.index.get(interest_hash)
+        attempted_at = max(info["trained_at"] if info else 0.0, self.failed_attempts.get(interest_hash, 0.0))
+        return time.time() - attempted_at > self.retrain_days * 86400
+
+    def train(self, user_interest: str, result_store: ResultStore) -> Optional[dict]:
+        """用结果库中的历史判断训练模型并保存，数据不足时记录尝试时间并返回 None
+
+        Returns:
+            模型信息，包括留出集上的校准报告
+        """
+        texts, labels, arxiv_ids = training_examples(result_store, user_interest)
+        if len(texts) < MIN_TRAIN_SAMPLES or sum(labels) < MIN_TRAIN_POSITIVES:
+            logger.info(f"研究兴趣 {interest_label(user_interest)} 的训练数据不足: {len(texts)} 篇，其中相关 {sum(labels)} 篇")
+            self.failed_attempts[hash_text(user_interest)] = time.time()
+            return None
+
+        holdout = np.array([zlib.crc32(arxiv_id.encode("utf-8")) % HOLDOUT_BUCKETS == 0 for arxiv_id in arxiv_ids])
+        y = np.array(labels)
+        start = time.perf_counter()
+        model = LinearClassifier.fit([text for text, held in zip(texts, holdout) if not held], y[~holdout].tolist())
+        holdout_texts = [text for text, held in zip(texts, holdout) if held]
+        report = calibration_report(model.predict_proba(holdout_texts), y[holdout], self.threshold)
+        logger.info(
+            f"研究兴趣 {interest_label(user_interest)} 的本地分类器训练完成: {len(texts)} 篇，耗时 {time.perf_counter() - start:.1f}s，"
+            f"留出集 Brier {report['brier']:.4f}，可自动判断 {report['auto_rate']:.1%}，漏掉相关论文 {report['missed_related']} 篇"
+        )
+
+        interest_hash = hash_text(user_interest)
+        os.makedirs(self.directory, exist_ok=True)
+        np.savez_compressed(self.model_file(interest_hash), weights=model.weights, bias=np.array([model.bias]))
+        self.models[interest_hash] = model
+        info = {
+            "user_interest": user_interest,
+            "trained_at": time.time(),
+            "samples": len(texts),
+            "positives": int(sum(labels)),
+            "calibration": report,
+            "shadow": {"confident": 0, "agreed": 0}  # 新模型重新统计一致率
+        }
+        self.index[interest_hash] = info
+        self.failed_attempts.pop(interest_hash, None)
+        return info
+
+    def refresh(self, user_interests: Iterable[str], result_store: ResultStore) -> None:
+        """重新训练缺失或超过 retrain_days 的模型"""
+        for user_interest in dict.fromkeys(user_interests):
+            if self.needs_training(user_interest):
+                self.train(user_interest, result_store)
+        self.save()
+
+    def get(self, user_interest: str) -> Optional[LinearClassifier]:
+        interest_hash = hash_text(user_interest)
+        if interest_hash not in self.index:
+            return None
+        if interest_hash not in self.models:
+            with np.load(self.model_file(interest_hash)) as data:
+                self.models[interest_hash] = LinearClassifier(data["weights"], float(data["bias"][0]))
+        return self.models[interest_hash]
+
+    def agreement(self, user_interest: str) -> Tuple[int, float]:
+        """影子模式下 (有把握的判断数, 与 LLM 的一致率)"""
+        shadow = self.index[hash_text(user_interest)]["shadow"]
+        confident = shadow["confident"]
+        return confident, shadow["agreed"] / confident if confident else 0.0
+
+    def is_trusted(self, user_interest: str) -> bool:
+        """是否可以直接使用本地模型的判断"""
+        if self.mode != "active" or hash_text(user_interest) not in self.index:
+            return False
+        confident, agreement = self.agreement(user_interest)
+        return confident >= self.min_shadow_samples and agreement >= self.min_agreement
+
+    def split(self, user_interest: str, papers: List[dict], labels: Dict[str, str]) -> Tuple[List[dict], List[dict], List[float]]:
+        """按本地模型的判断拆分待推理的论文
+
+        Args:
+            user_interest: 研究兴趣
+            papers: 推理缓存未命中的论文
+            labels: 指标标签
+
+        Returns:
+            (送入 LLM 的论文, 本地判断为不相关的论文, 送入 LLM 的论文的本地预测概率)，
+            没有模型时概率列表为空
+        """
+        model = self.get(user_interest)
+        if model is None or not papers:
+            return papers, [], []
+        probabilities = model.predict_proba([paper_text(paper) for paper in papers])
+        if not self.is_trusted(user_interest):
+            return papers, [], probabilities.tolist()
+
+        confident = probabilities <= 1 - self.threshold
+        decided = [paper for paper, is_confident in zip(papers, confident) if is_confident]
+        remaining = [paper for paper, is_confident in zip(papers, confident) if not is_confident]
+        logger.info(f"本地分类器直接判断 {len(decided)} 篇为不相关，{len(remaining)} 篇送入 LLM")
+        metrics.inc("local_classifier_decisions_total", len(decided), help_text="Papers decided by the local classifier", **labels)
+        return remaining, decided, probabilities[~confident].tolist()
+
+    def record_shadow(self, user_interest: str, probability: float, llm_related: bool, labels: Dict[str, str]) -> None:
+        """记录本地预测与 LLM 判断是否一致"""
+        confident = probability <= 1 - self.threshold
+        agreed = (probability >= 0.5) == llm_related
+        metrics.inc(
+            "local_classifier_shadow_total", help_text="Local classifier predictions compared with the LLM",
+            confident=str(confident).lower(), outcome="agree" if agreed else "disagree", **labels
+        )
+        if confident:
+            shadow = self.index[hash_text(user_interest)]["shadow"]
+            shadow["confident"] += 1
+            shadow["agreed"] += int(not llm_related)
+
+def create_local_classifiers(result_store: ResultStore, user_interests: Iterable[str]) -> Optional[LocalClassifiers]:
+    """按配置加载本地分类器并重新训练过期的模型，关闭时返回 None"""
+    if LOCAL_CLASSIFIER_MODE == "off":
+        return None
+    classifiers = LocalClassifiers()
+    classifiers.load()
+    classifiers.refresh(user_interests, result_store)
+    return classifiers
+
+def run_classifier_command(args: argparse.Namespace) -> int:
+    from subscriptions import SubscriptionRegistry
+
+    classifiers = LocalClassifiers()
+    classifiers.load()
+    user_interests = [item["area_interest"] for item in SubscriptionRegistry.load().interest_items()]
+    if args.classifier_command == "train":
+        result_store = ResultStore()
+        try:
+            for user_interest in dict.fromkeys(user_interests):
+                classifiers.train(user_interest, result_store)
+        finally:
+            result_store.close()
+        classifiers.save()
+    elif args.classifier_command == "report":
+        for user_interest in dict.fromkeys(user_interests):
+            info = classifiers.index.get(hash_text(user_interest))
+            if info is None:
+                continue
+            confident, agreement = classifiers.agreement(user_interest)
+            report = {
+                "interest": interest_label(user_interest),
+                "trained_at": time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(info["trained_at"])),
+                "samples": info["samples"],
+                "positives": info["positives"],
+                "calibration": info["calibration"],
+                "shadow": {"confident": confident, "agreement": agreement},
+                "trusted": classifiers.is_trusted(user_interest)
+            }
+            sys.stdout.write(json.dumps(report, ensure_ascii=False) + "\n")
+    return 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="训练本地分类器并查看校准报告")
+    parser.add_argument("classifier_command", choices=["train", "report"], help="train: 重新训练；report: 输出校准报告和影子模式一致率")
+    return run_classifier_command(parser.parse_args(argv))
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,32 +1,161 @@
+import atexit
+import copy
+import json
 import logging
+import logging.handlers
+import queue
+import sys
+import threading
+import time
+from datetime import datetime
+from config import LOG_FILE, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_CONSOLE_FORMAT, LOG_QUEUE_SIZE, LOG_TASK_RATE
+
+# LogRecord 的标准属性，其余属性都是通过 extra 传入的结构化字段
+STANDARD_ATTRIBUTES = set(vars(logging.LogRecord("", 0, "", 0, "", None, None))) | {"message", "asctime"}
+
+class JsonFormatter(logging.Formatter):
+    """每条日志输出为一行 JSON，extra 中的字段（如 stage、worker、task）原样输出"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in STANDARD_ATTRIBUTES:
+                entry[key] = value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # 经过队列的日志在放入队列前已格式化异常栈，见 NonBlockingQueueHandler.prepare
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class TaskLogSampler(logging.Filter):
+    """单篇论文的 INFO 日志限速
+
+    带有 task 字段的 INFO 日志每秒最多通过 rate 条，超出的直接丢弃，
+    下一条通过的日志附带 suppressed 字段记录期间丢弃的条数，退出时汇总丢弃的总数。警告和错误总是通过。
+    """
+
+    def __init__(self, rate: int):
+        super().__init__()
+        self.rate = rate
+        self.window_start = time.monotonic()
+        self.count = 0
+        self.suppressed = 0
+        self.total_suppressed = 0
+        self.lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0 or record.levelno > logging.INFO or not hasattr(record, "task"):
+            return True
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_start >= 1:
+                self.window_start = now
+                self.count = 0
+            if self.count >= self.rate:
+                self.suppressed += 1
+                self.total_suppressed += 1
+                return False
+            self.count += 1
+            if self.suppressed:
+                record.suppressed = self.suppressed
+                self.suppressed = 0
+        return True
+
+EXCEPTION_FORMATTER = logging.Formatter()
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """只把日志放入有界队列，由后台线程写出；队列满时丢弃日志而不是阻塞事件循环"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """复制日志记录并提前格式化消息，异常栈单独保存在 exc_text 中，不并入 message
+
+        QueueHandler.prepare 会把异常栈拼进消息并清空 exc_info 和 exc_text，写出端的 JsonFormatter 就无法单独输出 exception 字段。
+        """
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or EXCEPTION_FORMATTER.formatException(record.exc_info)
+            # 与 QueueHandler 一样清空 exc_info：traceback 对象无法序列化，也会让异常栈中的对象一直无法释放
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+def create_queue_handler() -> NonBlockingQueueHandler:
+    """创建所有 logger 共用的队列处理器，并启动写出控制台和日志文件的后台线程"""
+    console_handler = logging.StreamHandler()
+    if LOG_CONSOLE_FORMAT == "json":
+        console_handler.setFormatter(JsonFormatter())
+    else:
+        console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+
+    # 日志文件为 JSON lines，超过 LOG_MAX_BYTES 时轮转
+    file_handler = logging.handlers.RotatingFileHandler(
+        LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding='utf-8', delay=True
+    )
+    file_handler.setFormatter(JsonFormatter())
+
+    handler = NonBlockingQueueHandler(queue.Queue(maxsize=LOG_QUEUE_SIZE))
+    sampler = TaskLogSampler(LOG_TASK_RATE)
+    handler.addFilter(sampler)
+    listener = logging.handlers.QueueListener(handler.queue, console_handler, file_handler, respect_handler_level=True)
+    listener.start()
+
+    def stop() -> None:
+        if sampler.total_suppressed:
+            handler.handle(logging.makeLogRecord({
+                "name": __name__, "levelno": logging.INFO, "levelname": "INFO",
+                "msg": f"单篇论文的 INFO 日志超过每秒 {sampler.rate} 条，共丢弃 {sampler.total_suppressed} 条",
+                "suppressed": sampler.total_suppressed
+            }))
+        # 退出前写完队列中剩余的日志
+        listener.stop()
+        if handler.dropped:
+            sys.stderr.write(f"日志队列已满，丢弃了 {handler.dropped} 条日志\n")
+
+    atexit.register(stop)
+    return handler
+
+queue_handler = None
 
 def setup_logger(name):
     """
     设置并返回一个配置好的logger实例
-    
+
+    日志先放入内存队列，由后台线程写入控制台和轮转的日志文件，事件循环中记录日志不会等待磁盘或终端。
+
     Args:
         name: logger的名称，通常使用__name__
-        
+
     Returns:
         logging.Logger: 配置好的logger实例
     """
+    global queue_handler
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
-    
+
     # 如果logger已经有处理器，说明已经配置过，直接返回
     if logger.handlers:
         return logger
-        
-    formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-    
-    # 控制台处理器
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
-    
-    # 文件处理器
-    file_handler = logging.FileHandler('out.log', encoding='utf-8')
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
-    
-    return logger 
\ No newline at end of file
+
+    if queue_handler is None:
+        queue_handler = create_queue_handler()
+    logger.addHandler(queue_handler)
+
+    return logger
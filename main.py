@@ -1,6 +1,7 @@
 from get_rss import get_rss_from_url
 from config import area_interest_list, SYSTEM_PROMPT
 from batch_inference import BatchInference
+from response_parser import PaperDecision, is_related
 from utils import replace_placeholder_in_prompt, extract_paper_summary, save_results
 from logger import setup_logger
 import json
@@ -31,13 +32,10 @@ async def filter_rss_content(rss_url: str, user_interest: str) -> List[dict]:
     for paper_info in paper_infos:
         paper_info["content"] = extract_paper_summary(paper_info)
 
-    batch_inference = BatchInference()
+    batch_inference = BatchInference(response_model=PaperDecision)
     results = await batch_inference.create_tasks(sys_prompt, paper_infos)
     # 只保留isRelated为True，且success为True的paper_info
-    results = [res for res in results 
-               if res is not None 
-               and (res["isRelated"] is True or res["isRelated"] == "true")
-               and res["success"] is True]
+    results = [res for res in results if res is not None and is_related(res)]
 
     return results
 
@@ -0,0 +1,277 @@
+import bisect
+import json
+import os
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+from inference_cache import hash_text
+from logger import setup_logger
+
+logger = setup_logger(__name__)
+
+METRICS_DIR = "arxiv_updates"
+METRIC_PREFIX = "arxiv_filter_"
+
+LATENCY_BUCKETS = [0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120]  # 秒
+TOKEN_BUCKETS = [100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000]
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def interest_label(user_interest: str) -> str:
+    """研究兴趣描述过长，指标中用哈希前缀作为标签值"""
+    return hash_text(user_interest)[:8]
+
+def escape_label_value(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+class Histogram:
+    """累积分桶直方图，与 Prometheus histogram 的语义一致"""
+
+    def __init__(self, buckets: List[float]):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        index = bisect.bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            self.bucket_counts[index] += 1
+        self.count += 1
+        self.sum += value
+
+    def cumulative_counts(self) -> List[int]:
+        counts = []
+        total = 0
+        for bucket_count in self.bucket_counts:
+            total += bucket_count
+            counts.append(total)
+        return counts
+
+class MetricsRegistry:
+    """进程内的指标注册表，按 (指标名, 标签) 聚合计数器和直方图"""
+
+    def __init__(self):
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self.histogram_buckets: Dict[str, List[float]] = {}
+        self.help: Dict[str, str] = {}
+
+    @staticmethod
+    def label_key(labels: Dict[str, str]) -> LabelKey:
+        return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+    def inc(self, name: str, value: float = 1, help_text: str = "", **labels) -> None:
+        """计数器加 value"""
+        series = self.counters.setdefault(name, {})
+        key = self.label_key(labels)
+        series[key] = series.get(key, 0) + value
+        if help_text:
+            self.help.setdefault(name, help_text)
+
+    def observe(self, name: str, value: float, buckets: Optional[List[float]] = None, help_text: str = "", **labels) -> None:
+        """向直方图记录一个观测值"""
+        buckets = self.histogram_buckets.setdefault(name, buckets or LATENCY_BUCKETS)
+        series = self.histograms.setdefault(name, {})
+        key = self.label_key(labels)
+        if key not in series:
+            series[key] = Histogram(buckets)
+        series[key].observe(value)
+        if help_text:
+            self.help.setdefault(name, help_text)
+
+    def reset(self) -> None:
+        self.__init__()
+
+    def to_dict(self) -> dict:
+        """导出为可 JSON 序列化的字典"""
+        return {
+            "generated_at": datetime.now().isoformat(timespec="seconds"),
+            "counters": {
+                name: [{"labels": dict(key), "value": value} for key, value in series.items()]
+                for name, series in self.counters.items()
+            },
+            "histograms": {
+                name: [
+                    {
+                        "labels": dict(key),
+                        "buckets": dict(zip([str(bucket) for bucket in histogram.buckets], histogram.cumulative_counts())),
+                        "count": histogram.count,
+                        "sum": histogram.sum
+                    }
+                    for key, histogram in series.items()
+                ]
+                for name, series in self.histograms.items()
+            }
+        }
+
+    def to_prometheus(self) -> str:
+        """导出为 Prometheus textfile collector 格式"""
+        lines = []
+
+        def format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+            pairs = list(key) + ([extra] if extra else [])
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{label}="{escape_label_value(value)}"' for label, value in pairs) + "}"
+
+        for name, series in self.counters.items():
+            metric = METRIC_PREFIX + name
+            if name in self.help:
+                lines.append(f"# HELP {metric} {self.help[name]}")
+            lines.append(f"# TYPE {metric} counter")
+            for key, value in series.items():
+                lines.append(f"{metric}{format_labels(key)} {value}")
+        for name, series in self.histograms.items():
+            metric = METRIC_PREFIX + name
+            if name in self.help:
+                lines.append(f"# HELP {metric} {self.help[name]}")
+            lines.append(f"# TYPE {metric} histogram")
+            for key, histogram in series.items():
+                for bucket, count in zip(histogram.buckets, histogram.cumulative_counts()):
+                    lines.append(f"{metric}_bucket{format_labels(key, ('le', str(bucket)))} {count}")
+                lines.append(f"{metric}_bucket{format_labels(key, ('le', '+Inf'))} {histogram.count}")
+                lines.append(f"{metric}_sum{format_labels(key)} {histogram.sum}")
+                lines.append(f"{metric}_count{format_labels(key)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def save(self, metrics_dir: str = METRICS_DIR) -> None:
+        """将指标写入 metrics_<日期>.json 和 metrics_<日期>.prom"""
+        os.makedirs(metrics_dir, exist_ok=True)
+        current_date = datetime.now().strftime("%Y-%m-%d")
+        json_file = os.path.join(metrics_dir, f"metrics_{current_date}.json")
+        prom_file = os.path.join(metrics_dir, f"metrics_{current_date}.prom")
+        try:
+            with open(json_file, "w", encoding="utf-8") as f:
+                json.dump(self.to_dict(), f, ensure_ascii=False)
+            # textfile collector 可能随时读取，先写临时文件再替换
+            with open(prom_file + ".tmp", "w", encoding="utf-8") as f:
+                f.write(self.to_prometheus())
+            os.replace(prom_file + ".tmp", prom_file)
+            logger.info(f"指标已保存到: {json_file}, {prom_file}")
+        except Exception as e:
+            logger.error(f"保存指标失败: {e}")
+
+# 全局指标注册表
+metrics = MetricsRegistry()
+
+class CallMetrics:
+    """单个推理阶段的调用指标
+
+    累计本阶段的汇总值用于日志输出，同时将每次调用按标签（阶段、模型、feed、研究兴趣）
+    写入全局注册表的计数器和直方图。
+
+    Args:
+        labels: 指标标签
+        prompt_price: 每百万输入 token 的价格
+        completion_price: 每百万输出 token 的价格
+        cached_prompt_price: 每百万命中前缀缓存的输入 token 的价格，None 表示与 prompt_price 相同
+        registry: 写入的指标注册表
+    """
+
+    def __init__(
+        self,
+        labels: Dict[str, str],
+        prompt_price: float = 0.0,
+        completion_price: float = 0.0,
+        cached_prompt_price: Optional[float] = None,
+        registry: MetricsRegistry = metrics
+    ):
+        self.labels = labels
+        self.prompt_price = prompt_price
+        self.completion_price = completion_price
+        self.cached_prompt_price = prompt_price if cached_prompt_price is None else cached_prompt_price
+        self.registry = registry
+        self.requests = 0
+        self.failures = 0
+        self.retries = 0
+        self.hedges = 0
+        self.parse_failures = 0
+        self.repaired = 0
+        self.reasks = 0
+        self.latency = 0.0
+        self.prompt_tokens = 0
+        self.cached_prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+
+    def record_call(
+        self,
+        latency: float,
+        scheduler_wait: float,
+        prompt_tokens: int,
+        completion_tokens: int,
+        cached_prompt_tokens: int = 0
+    ) -> None:
+        """记录一次成功的模型调用，cached_prompt_tokens 为输入中命中前缀缓存的 token 数"""
+        self.requests += 1
+        self.latency += latency
+        self.prompt_tokens += prompt_tokens
+        self.cached_prompt_tokens += cached_prompt_tokens
+        self.completion_tokens += completion_tokens
+        cost = (
+            (prompt_tokens - cached_prompt_tokens) * self.prompt_price
+            + cached_prompt_tokens * self.cached_prompt_price
+            + completion_tokens * self.completion_price
+        ) / 1_000_000
+        self.cost += cost
+        registry = self.registry
+        registry.inc("requests_total", help_text="Model calls by outcome", outcome="success", **self.labels)
+        registry.inc("prompt_tokens_total", prompt_tokens, help_text="Prompt tokens reported by the provider", **self.labels)
+        if cached_prompt_tokens:
+            registry.inc("cached_prompt_tokens_total", cached_prompt_tokens, help_text="Prompt tokens served from the provider prefix cache", **self.labels)
+        registry.inc("completion_tokens_total", completion_tokens, help_text="Completion tokens reported by the provider", **self.labels)
+        registry.inc("cost_total", cost, help_text="Estimated cost from configured token prices", **self.labels)
+        registry.observe("request_latency_seconds", latency, help_text="Model call latency", **self.labels)
+        registry.observe("scheduler_wait_seconds", scheduler_wait, help_text="Time spent waiting for rate limits and concurrency slots", **self.labels)
+        registry.observe("prompt_tokens", prompt_tokens, TOKEN_BUCKETS, help_text="Prompt tokens per call", **self.labels)
+        registry.observe("completion_tokens", completion_tokens, TOKEN_BUCKETS, help_text="Completion tokens per call", **self.labels)
+
+    def record_context_creation(self, prompt_tokens: int) -> None:
+        """记录创建前缀缓存上下文时按输入计费的 token"""
+        self.prompt_tokens += prompt_tokens
+        cost = prompt_tokens * self.prompt_price / 1_000_000
+        self.cost += cost
+        self.registry.inc("prompt_tokens_total", prompt_tokens, help_text="Prompt tokens reported by the provider", **self.labels)
+        self.registry.inc("cost_total", cost, help_text="Estimated cost from configured token prices", **self.labels)
+
+    def record_failure(self, will_retry: bool) -> None:
+        """记录一次失败的模型调用"""
+        self.requests += 1
+        self.failures += 1
+        self.registry.inc("requests_total", help_text="Model calls by outcome", outcome="failure", **self.labels)
+        if will_retry:
+            self.retries += 1
+            self.registry.inc("retries_total", help_text="Model calls retried after a transient error", **self.labels)
+
+    def record_hedge(self, outcome: str) -> None:
+        """记录一次对冲请求，outcome 为 won（对冲请求先完成）、lost（原请求先完成）或 failed"""
+        self.hedges += 1
+        self.registry.inc("hedged_requests_total", help_text="Hedged duplicate requests by outcome", outcome=outcome, **self.labels)
+
+    def record_parse_failure(self, count: int = 1) -> None:
+        """记录无法解析的回复（打包请求中缺失的论文也计入）"""
+        self.parse_failures += count
+        self.registry.inc("parse_failures_total", count, help_text="Papers whose response could not be parsed", **self.labels)
+
+    def record_repair(self, count: int = 1) -> None:
+        """记录经过提取或修复才能解析的回复"""
+        self.repaired += count
+        self.registry.inc("responses_repaired_total", count, help_text="Responses recovered by JSON extraction or repair", **self.labels)
+
+    def record_reask(self, outcome: str) -> None:
+        """记录一次因回复无法使用而重新请求，outcome 为 recovered（重新请求后可用）或 failed"""
+        self.reasks += 1
+        self.registry.inc("reasks_total", help_text="Targeted re-requests after unusable responses by outcome", outcome=outcome, **self.labels)
+
+    def record_queue_wait(self, seconds: float) -> None:
+        """记录任务在待处理队列中的等待时间"""
+        self.registry.observe("queue_wait_seconds", seconds, help_text="Time a task spent in the work queue", **self.labels)
+
+    def summary(self) -> str:
+        successes = self.requests - self.failures
+        avg_latency = self.latency / successes if successes else 0.0
+        return (
+            f"requests={self.requests} failures={self.failures} retries={self.retries} hedges={self.hedges} "
+            f"parse_failures={self.parse_failures} repaired={self.repaired} reasks={self.reasks} avg_latency={avg_latency:.2f}s "
+            f"prompt_tokens={self.prompt_tokens} cached_prompt_tokens={self.cached_prompt_tokens} completion_tokens={self.completion_tokens} cost={self.cost:.4f}"
+        )
@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from types import SimpleNamespace
+from typing import List, Optional
+from scheduler import estimate_tokens
+
+class MockAPIStatusError(Exception):
+    """模拟服务端返回的错误状态码"""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"Mock API error {status_code}")
+        self.status_code = status_code
+
+class MockArkConfig:
+    """模拟服务端的行为配置
+
+    Args:
+        latency_distribution: 延迟分布，fixed / uniform / lognormal
+        latency_median: 延迟中位数（秒）
+        latency_sigma: lognormal 分布的 sigma，uniform 分布时为相对中位数的半宽
+        error_rate: 返回 500 的概率
+        throttle_rate: 返回 429 的概率
+        malformed_rate: 返回不规范 JSON（前置说明文字、代码块包裹、末尾多余的逗号）的概率，请求携带 response_format 时不会出现
+        truncated_rate: 返回被截断、无法修复的 JSON 的概率
+        related_rate: 论文被判断为相关的比例
+        context_cache: 是否支持 Context API 的前缀缓存，不支持时创建上下文返回 404
+        context_ttl: 服务端允许的上下文最长存活时间（秒），过期后使用上下文的请求返回 404
+        response_format: 是否支持 response_format，不支持时携带该参数的请求返回 400
+        seed: 随机数种子
+    """
+
+    def __init__(
+        self,
+        latency_distribution: str = "lognormal",
+        latency_median: float = 0.5,
+        latency_sigma: float = 0.5,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        malformed_rate: float = 0.0,
+        truncated_rate: float = 0.0,
+        related_rate: float = 0.05,
+        context_cache: bool = True,
+        context_ttl: float = 3600,
+        response_format: bool = True,
+        seed: Optional[int] = None
+    ):
+        self.latency_distribution = latency_distribution
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.malformed_rate = malformed_rate
+        self.truncated_rate = truncated_rate
+        self.related_rate = related_rate
+        self.context_cache = context_cache
+        self.context_ttl = context_ttl
+        self.response_format = response_format
+        self.seed = seed
+
+class MockCompletions:
+    """模拟 AsyncArk 的 chat.completions / batch_chat.completions 接口"""
+
+    def __init__(self, config: MockArkConfig):
+        self.config = config
+        self.random = random.Random(config.seed)
+        self.latencies: List[float] = []
+        self.status_counts = {"ok": 0, "malformed": 0, "truncated": 0, "429": 0, "500": 0, "404": 0, "400": 0}
+
+    def sample_latency(self) -> float:
+        config = self.config
+        if config.latency_distribution == "fixed":
+            return config.latency_median
+        if config.latency_distribution == "uniform":
+            half_width = config.latency_median * config.latency_sigma
+            return max(0.0, self.random.uniform(config.latency_median - half_width, config.latency_median + half_width))
+        return self.random.lognormvariate(0, config.latency_sigma) * config.latency_median
+
+    def is_related(self, text: str, salt: str = "") -> bool:
+        """按内容哈希决定是否相关，同一篇论文的结果在多次请求间保持一致"""
+        digest = hashlib.md5((salt + text).encode("utf-8")).digest()
+        return int.from_bytes(digest[:4], "big") / 2 ** 32 < self.config.related_rate
+
+    def answer_one(self, system_prompt: str, paper_text: str) -> dict:
+        """按照系统提示词要求的格式生成单篇论文的回复"""
+        interest_ids = re.findall(r"### Interest (\d+)", system_prompt)
+        if interest_ids:
+            return {
+                interest_id: self.decision(paper_text, interest_id)
+                for interest_id in interest_ids
+            }
+        if '"isRelated"' not in system_prompt:
+            return {"chineseSummary": "这是一篇模拟生成的中文简介。"}
+        decision = self.decision(paper_text)
+        if '"chineseSummary"' not in system_prompt:
+            return {"isRelated": decision["isRelated"]}
+        return decision
+
+    def decision(self, paper_text: str, salt: str = "") -> dict:
+        related = self.is_related(paper_text, salt)
+        return {"isRelated": related, "chineseSummary": "这是一篇模拟生成的中文简介。" if related else "Unrelated"}
+
+    def build_content(self, system_prompt: str, user_text: str) -> str:
+        papers = re.split(r"^## Paper (P\d+)\n", user_text, flags=re.M)
+        if len(papers) > 1:
+            return json.dumps([
+                {"paperId": papers[i], **self.answer_one(system_prompt, papers[i + 1])}
+                for i in range(1, len(papers), 2)
+            ], ensure_ascii=False)
+        return json.dumps(self.answer_one(system_prompt, user_text), ensure_ascii=False)
+
+    async def create(self, model: str, messages: List[dict], cached_prefix: Optional[str] = None, response_format: Optional[dict] = None, **kwargs) -> SimpleNamespace:
+        """cached_prefix 为缓存上下文提供的系统提示词，由 MockContextCompletions 传入"""
+        if response_format is not None and not self.config.response_format:
+            self.status_counts["400"] += 1
+            raise MockAPIStatusError(400)
+        start = time.monotonic()
+        await asyncio.sleep(self.sample_latency())
+        self.latencies.append(time.monotonic() - start)
+        system_prompt = cached_prefix if cached_prefix is not None else messages[0]["content"]
+        user_text = messages[-1]["content"]
+
+        roll = self.random.random()
+        if roll < self.config.throttle_rate:
+            self.status_counts["429"] += 1
+            raise MockAPIStatusError(429)
+        roll -= self.config.throttle_rate
+        if roll < self.config.error_rate:
+            self.status_counts["500"] += 1
+            raise MockAPIStatusError(500)
+        roll -= self.config.error_rate
+
+        content = self.build_content(system_prompt, user_text)
+        if roll < self.config.truncated_rate:
+            self.status_counts["truncated"] += 1
+            content = content[:len(content) // 2]
+        elif roll - self.config.truncated_rate < self.config.malformed_rate and response_format is None:
+            self.status_counts["malformed"] += 1
+            # 模拟常见的不规范输出：前置说明文字、代码块包裹和末尾多余的逗号
+            content = "Here is the result:\n```json\n" + content[:-1] + "," + content[-1] + "\n```"
+        else:
+            self.status_counts["ok"] += 1
+
+        prompt_tokens = estimate_tokens(system_prompt + user_text)
+        completion_tokens = estimate_tokens(content)
+        cached_tokens = estimate_tokens(cached_prefix) if cached_prefix is not None else 0
+        return SimpleNamespace(
+            choices=[SimpleNamespace(message=SimpleNamespace(content=content))],
+            usage=SimpleNamespace(
+                prompt_tokens=prompt_tokens,
+                completion_tokens=completion_tokens,
+                total_tokens=prompt_tokens + completion_tokens,
+                prompt_tokens_details=SimpleNamespace(cached_tokens=cached_tokens)
+            )
+        )
+
+class MockContext:
+    """模拟 AsyncArk 的 context 接口（common_prefix 模式），上下文保存在模拟服务端的内存中"""
+
+    def __init__(self, completions: MockCompletions):
+        self.config = completions.config
+        self.contexts = {}  # 上下文 ID -> (系统提示词, 过期时间)
+        self.created = 0
+        self.completions = MockContextCompletions(self, completions)
+
+    async def create(self, model: str, messages: List[dict], mode: str = "session", ttl: Optional[int] = None, **kwargs) -> SimpleNamespace:
+        if not self.config.context_cache:
+            raise MockAPIStatusError(404)
+        ttl = min(ttl or self.config.context_ttl, self.config.context_ttl)
+        self.created += 1
+        context_id = f"ctx-{self.created:06d}"
+        prefix = "".join(message["content"] for message in messages)
+        self.contexts[context_id] = (prefix, time.monotonic() + ttl)
+        prompt_tokens = estimate_tokens(prefix)
+        return SimpleNamespace(
+            id=context_id, model=model, mode=mode, ttl=ttl,
+            usage=SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=0, total_tokens=prompt_tokens)
+        )
+
+class MockContextCompletions:
+    """模拟 context.completions 接口，系统提示词取自缓存上下文"""
+
+    def __init__(self, context: MockContext, completions: MockCompletions):
+        self.context = context
+        self.completions = completions
+
+    async def create(self, context_id: str, model: str, messages: List[dict], **kwargs) -> SimpleNamespace:
+        prefix, expires_at = self.context.contexts.get(context_id, (None, 0.0))
+        if prefix is None or time.monotonic() >= expires_at:
+            self.completions.status_counts["404"] += 1
+            raise MockAPIStatusError(404)
+        return await self.completions.create(model, messages, cached_prefix=prefix, **kwargs)
+
+class MockArk:
+    """AsyncArk 的本地替身，chat、batch_chat 和 context 共用同一个模拟接口"""
+
+    def __init__(self, config: Optional[MockArkConfig] = None):
+        self.completions = MockCompletions(config or MockArkConfig())
+        self.chat = SimpleNamespace(completions=self.completions)
+        self.batch_chat = SimpleNamespace(completions=self.completions)
+        self.context = MockContext(self.completions)
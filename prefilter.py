@@ -0,0 +1,148 @@
+import math
+import re
+from collections import Counter
+from typing import Dict, List, Tuple
+import numpy as np
+from logger import setup_logger
+from utils import extract_abstract
+
+logger = setup_logger(__name__)
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "can", "for", "from", "has", "have", "how", "in",
+    "into", "is", "it", "its", "of", "on", "or", "our", "such", "that", "the", "their", "these", "this",
+    "to", "we", "which", "while", "with", "without", "both", "also", "than", "then", "they", "via",
+    "paper", "propose", "proposed", "method", "methods", "approach", "results", "show", "using", "based",
+}
+
+def normalize_token(token: str) -> str:
+    """简单的词形归一化：去掉常见的复数后缀"""
+    if len(token) > 4 and token.endswith("ies"):
+        return token[:-3] + "y"
+    if len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        return token[:-1]
+    return token
+
+def tokenize(text: str) -> List[str]:
+    """英文按单词切分，中文按相邻两字切分"""
+    text = text.lower()
+    tokens = [
+        normalize_token(word) for word in re.findall(r"[a-z0-9]+(?:-[a-z0-9]+)*", text)
+        if word not in STOPWORDS and len(word) > 1
+    ]
+    for segment in re.findall(r"[一-鿿]+", text):
+        tokens.extend(segment[i:i + 2] for i in range(len(segment) - 1))
+    return tokens
+
+def build_query(user_interest: str, keywords: List[str]) -> str:
+    """预筛选的查询文本：研究兴趣描述加上配置的英文关键词"""
+    return " ".join([user_interest] + list(keywords))
+
+class RelevancePrefilter:
+    """基于 BM25 的本地相关性预筛选
+
+    对一个 feed 中的所有论文一次性计算 BM25 得分矩阵（论文 × 研究兴趣），
+    只把得分靠前或超过阈值的论文送入 LLM。为了保证召回率，
+    每个研究兴趣至少保留 top_k 篇和 min_keep_ratio 比例的论文。
+    """
+
+    def __init__(
+        self,
+        top_k: int = 50,
+        min_keep_ratio: float = 0.3,
+        threshold: float = 5.0,
+        k1: float = 1.5,
+        b: float = 0.75
+    ):
+        self.top_k = top_k
+        self.min_keep_ratio = min_keep_ratio
+        self.threshold = threshold
+        self.k1 = k1
+        self.b = b
+
+    def score(self, documents: List[str], queries: List[str]) -> np.ndarray:
+        """计算 BM25 得分矩阵
+
+        只统计查询中出现过的词，词频矩阵大小为 论文数 × 查询词数，
+        得分通过一次矩阵乘法得到。
+
+        Args:
+            documents: 论文文本列表
+            queries: 查询文本列表
+
+        Returns:
+            形状为 (len(documents), len(queries)) 的得分矩阵
+        """
+        query_counts = [Counter(tokenize(query)) for query in queries]
+        vocabulary: Dict[str, int] = {}
+        for counts in query_counts:
+            for term in counts:
+                vocabulary.setdefault(term, len(vocabulary))
+        if not documents or not vocabulary:
+            return np.zeros((len(documents), len(queries)), dtype=np.float32)
+
+        term_freq = np.zeros((len(documents), len(vocabulary)), dtype=np.float32)
+        doc_lengths = np.zeros(len(documents), dtype=np.float32)
+        for row, document in enumerate(documents):
+            tokens = tokenize(document)
+            doc_lengths[row] = len(tokens)
+            for term, count in Counter(tokens).items():
+                column = vocabulary.get(term)
+                if column is not None:
+                    term_freq[row, column] = count
+
+        doc_freq = np.count_nonzero(term_freq, axis=0)
+        idf = np.log1p((len(documents) - doc_freq + 0.5) / (doc_freq + 0.5)).astype(np.float32)
+        avg_length = max(float(doc_lengths.mean()), 1.0)
+        length_norm = self.k1 * (1 - self.b + self.b * doc_lengths / avg_length)
+        weights = term_freq * (self.k1 + 1) / (term_freq + length_norm[:, None]) * idf
+
+        query_matrix = np.zeros((len(vocabulary), len(queries)), dtype=np.float32)
+        for column, counts in enumerate(query_counts):
+            for term, count in counts.items():
+                query_matrix[vocabulary[term], column] = count
+        return weights @ query_matrix
+
+    def select(self, papers: List[dict], queries: List[str]) -> Tuple[List[dict], List[dict]]:
+        """按得分筛选论文，任意一个研究兴趣保留的论文即保留
+
+        Args:
+            papers: 论文信息列表（需包含 title 和 summary）
+            queries: 查询文本列表，每个研究兴趣一个
+
+        Returns:
+            (保留的论文, 被剔除的论文)，被剔除的论文带有 prefilter_score 字段
+        """
+        if not papers:
+            return [], []
+        documents = [f"{paper['title']} {extract_abstract(paper['summary'])}" for paper in papers]
+        scores = self.score(documents, queries)
+
+        keep_count = min(len(papers), max(self.top_k, math.ceil(self.min_keep_ratio * len(papers))))
+        keep = scores >= self.threshold
+        top_indices = np.argsort(-scores, axis=0, kind="stable")[:keep_count]
+        for column in range(scores.shape[1]):
+            keep[top_indices[:, column], column] = True
+        keep_any = keep.any(axis=1)
+        best_scores = scores.max(axis=1)
+
+        kept, pruned = [], []
+        for paper, is_kept, best_score in zip(papers, keep_any, best_scores):
+            if is_kept:
+                kept.append(paper)
+            else:
+                pruned.append({**paper, "prefilter_score": float(best_score)})
+        return kept, pruned
+
+    def priorities(self, papers: List[dict], queries: List[str]) -> np.ndarray:
+        """每篇论文对各个研究兴趣的最高 BM25 得分，有截止时间时按它从高到低推理"""
+        if not papers:
+            return np.zeros(0, dtype=np.float32)
+        documents = [f"{paper['title']} {extract_abstract(paper['summary'])}" for paper in papers]
+        return self.score(documents, queries).max(axis=1)
+
+    def log_pruned(self, rss_url: str, kept: List[dict], pruned: List[dict]) -> None:
+        """记录预筛选结果和被剔除的论文"""
+        logger.info(f"{rss_url}: 预筛选保留 {len(kept)} 篇，剔除 {len(pruned)} 篇")
+        for paper in pruned:
+            logger.info(f"预筛选剔除 {paper['id']} (score={paper['prefilter_score']:.2f}): {paper['title']}")
@@ -0,0 +1,131 @@
+"""服务端前缀缓存
+
+一次运行中同一个研究兴趣的所有请求共用同一个很长的系统提示词，只有论文摘要不同。
+开启 PREFIX_CACHE_ENABLED 后，每个 (模型, 系统提示词) 通过方舟 Context API 的 common_prefix 模式
+创建一次缓存上下文，之后的请求只发送论文内容，服务端直接复用已经计算过的前缀，
+同时减少输入 token 费用和首 token 延迟。
+
+上下文在过期前 PREFIX_CACHE_REFRESH_MARGIN 秒重新创建，刷新期间的请求继续使用旧的上下文。
+创建失败时退回普通请求：临时错误在 PREFIX_CACHE_RETRY_SECONDS 秒后再次尝试，
+其他错误（模型不支持、提示词过短等）在本次运行中不再尝试。
+"""
+import asyncio
+import time
+from typing import Dict, Optional, Tuple
+from config import PREFIX_CACHE_ENABLED, PREFIX_CACHE_TTL, PREFIX_CACHE_REFRESH_MARGIN, PREFIX_CACHE_RETRY_SECONDS
+from logger import setup_logger
+from metrics import CallMetrics, metrics
+from scheduler import is_transient_error
+from tracing import tracer
+
+logger = setup_logger(__name__)
+
+CacheKey = Tuple[str, str]
+
+class PrefixContext:
+    """一个已创建的缓存上下文，到 refresh_at 后重新创建"""
+
+    def __init__(self, context_id: str, expires_at: float, refresh_at: float):
+        self.context_id = context_id
+        self.expires_at = expires_at
+        self.refresh_at = refresh_at
+
+class PrefixCache:
+    """按 (模型, 系统提示词) 管理缓存上下文，一次运行中的所有推理阶段共用
+
+    Args:
+        enabled: 是否使用前缀缓存，关闭时 context_id 总是返回 None
+        ttl: 上下文的存活时间（秒）
+        refresh_margin: 距离过期不足该秒数时重新创建
+        retry_seconds: 临时错误导致创建失败后，再次尝试前等待的秒数
+    """
+
+    def __init__(
+        self,
+        enabled: bool = PREFIX_CACHE_ENABLED,
+        ttl: int = PREFIX_CACHE_TTL,
+        refresh_margin: float = PREFIX_CACHE_REFRESH_MARGIN,
+        retry_seconds: float = PREFIX_CACHE_RETRY_SECONDS
+    ):
+        self.enabled = enabled
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.retry_seconds = retry_seconds
+        self.contexts: Dict[CacheKey, PrefixContext] = {}
+        self.creating: Dict[CacheKey, asyncio.Task] = {}
+        self.retry_at: Dict[CacheKey, float] = {}  # 值为 inf 表示本次运行中不再尝试
+
+    async def context_id(self, client, model: str, system_prompt: str, stats: CallMetrics) -> Optional[str]:
+        """返回系统提示词对应的缓存上下文 ID，不可用时返回 None（调用方退回普通请求）
+
+        同一个键同时只有一个创建请求，其余调用等待它完成。
+
+        Args:
+            client: 模型客户端
+            model: 模型名称
+            system_prompt: 渲染后的系统提示词
+            stats: 创建上下文消耗的 token 计入的推理阶段指标
+        """
+        if not self.enabled:
+            return None
+        key = (model, system_prompt)
+        now = time.monotonic()
+        context = self.contexts.get(key)
+        if context is not None and now < context.refresh_at:
+            return context.context_id
+        if now < self.retry_at.get(key, 0.0):
+            return context.context_id if context is not None and now < context.expires_at else None
+
+        task = self.creating.get(key)
+        if task is None:
+            task = asyncio.create_task(self.create(client, model, system_prompt, stats))
+            self.creating[key] = task
+            task.add_done_callback(lambda _: self.creating.pop(key, None))
+        # 刷新期间旧的上下文仍然有效，不必等待
+        if context is not None and now < context.expires_at:
+            return context.context_id
+        context = await asyncio.shield(task)
+        return context.context_id if context is not None else None
+
+    async def create(self, client, model: str, system_prompt: str, stats: CallMetrics) -> Optional[PrefixContext]:
+        key = (model, system_prompt)
+        refresh = key in self.contexts
+        try:
+            with tracer.span("context_create", "llm", model=model, refresh=refresh):
+                response = await client.context.create(
+                    model=model,
+                    mode="common_prefix",
+                    messages=[{"role": "system", "content": system_prompt}],
+                    ttl=self.ttl
+                )
+        except Exception as e:
+            transient = is_transient_error(e)
+            self.retry_at[key] = time.monotonic() + self.retry_seconds if transient else float("inf")
+            metrics.inc("prefix_contexts_total", help_text="Prefix cache contexts by outcome", outcome="failed", model=model)
+            logger.warning(f"创建前缀缓存失败（{model}）: {e}，{'稍后重试' if transient else '本次运行退回普通请求'}")
+            context = self.contexts.get(key)
+            return context if context is not None and time.monotonic() < context.expires_at else None
+
+        # 服务端可能缩短存活时间，按实际的存活时间计算刷新时间，且至少使用一半的存活时间
+        ttl = getattr(response, "ttl", None) or self.ttl
+        now = time.monotonic()
+        context = PrefixContext(response.id, now + ttl, now + ttl - min(self.refresh_margin, ttl / 2))
+        self.contexts[key] = context
+        usage = getattr(response, "usage", None)
+        stats.record_context_creation(usage.prompt_tokens if usage is not None else 0)
+        metrics.inc("prefix_contexts_total", help_text="Prefix cache contexts by outcome", outcome="refreshed" if refresh else "created", model=model)
+        logger.info(f"{'刷新' if refresh else '创建'}前缀缓存 {response.id}（{model}），有效期 {ttl}s")
+        return context
+
+    def invalidate(self, model: str, system_prompt: str, context_id: str) -> None:
+        """使用上下文的请求失败而同样的普通请求成功（如上下文已被服务端回收）时丢弃该上下文，本次运行不再使用"""
+        key = (model, system_prompt)
+        context = self.contexts.get(key)
+        if context is not None and context.context_id == context_id:
+            del self.contexts[key]
+            self.retry_at[key] = float("inf")
+            metrics.inc("prefix_contexts_total", help_text="Prefix cache contexts by outcome", outcome="invalidated", model=model)
+            logger.warning(f"前缀缓存 {context_id}（{model}）不可用，本次运行退回普通请求")
+
+# 全局前缀缓存，一次运行中的所有推理阶段共用
+prefix_contexts = PrefixCache()
@@ -0,0 +1,194 @@
+"""模型回复的解析、修复和校验
+
+模型偶尔会在 JSON 前后加上说明文字、用代码块包裹，或留下末尾多余的逗号。直接 json.loads 会让
+已经付费的回复变成解析失败，因此先从回复中提取 JSON 并做常见的修复，再按各推理阶段的 pydantic
+模型校验字段。只有修复后仍无法解析或校验失败的回复才需要重新请求。
+
+开启 RESPONSE_FORMAT 后请求携带 response_format，服务端直接约束输出为 JSON；
+模型不支持时自动退回普通请求，本次运行中不再使用。
+"""
+import json
+import re
+from typing import Any, Dict, Iterator, Optional, Set, Tuple, Type
+from pydantic import BaseModel, RootModel, ValidationError, model_validator
+from config import RESPONSE_FORMAT
+from logger import setup_logger
+from metrics import metrics
+from utils import is_related  # noqa: F401  结果库等不需要 pydantic 的模块直接从 utils 导入
+
+logger = setup_logger(__name__)
+
+FENCE_PATTERN = re.compile(r"```(?:json|JSON)?\s*\n?(.*?)```", re.S)
+TRAILING_COMMA_PATTERN = re.compile(r",\s*([}\]])")
+# 只替换出现在值的位置上的 Python 字面量，不改动字符串中的文字
+PYTHON_LITERAL_PATTERN = re.compile(r"([:\[,]\s*)(True|False|None)\b")
+PYTHON_LITERALS = {"True": "true", "False": "false", "None": "null"}
+# 只替换出现在结构位置（对象和数组的括号、逗号、冒号旁边）的中文引号，字符串内容中的中文引号保持不变
+SMART_QUOTE_PATTERN = re.compile(r'(?<=[{\[,:])(\s*)[“”]|[“”](?=\s*[:,}\]])')
+
+class ResponseParseError(ValueError):
+    """回复中没有可以修复的 JSON，或 JSON 不符合推理阶段要求的格式"""
+
+class PaperDecision(BaseModel):
+    """单兴趣推理的回复：是否相关以及中文简介"""
+
+    isRelated: bool
+    chineseSummary: str = "Unrelated"
+
+    @model_validator(mode="after")
+    def require_summary(self) -> "PaperDecision":
+        if self.isRelated and not self.chineseSummary.strip():
+            raise ValueError("chineseSummary is required when isRelated is true")
+        return self
+
+class GateDecision(BaseModel):
+    """级联推理第一阶段的回复：只判断是否相关"""
+
+    isRelated: bool
+
+class PaperSummary(BaseModel):
+    """级联推理第二阶段的回复：中文简介"""
+
+    chineseSummary: str
+
+class MultiInterestDecision(RootModel[Dict[str, PaperDecision]]):
+    """多兴趣推理的回复：研究兴趣编号 -> 判断结果"""
+
+def extract_json(text: str) -> Tuple[Any, bool]:
+    """从模型回复中提取 JSON，必要时修复常见的格式问题
+
+    依次尝试：原文、代码块中的内容、第一个 { 或 [ 到最后一个 } 或 ] 之间的内容，
+    每个候选在直接解析失败后再逐步修复（见 repair_steps），每修复一步尝试解析一次。
+
+    Returns:
+        (解析结果, 是否经过提取或修复)
+
+    Raises:
+        ResponseParseError: 所有候选都无法解析
+    """
+    if text is None:
+        raise ResponseParseError("empty response")
+    text = text.strip().lstrip("﻿")
+    candidates = [text]
+    candidates.extend(match.strip() for match in FENCE_PATTERN.findall(text))
+    starts = [index for index in (text.find("{"), text.find("[")) if index != -1]
+    end = max(text.rfind("}"), text.rfind("]"))
+    if starts and end > min(starts):
+        candidates.append(text[min(starts):end + 1])
+
+    error = None
+    for index, candidate in enumerate(dict.fromkeys(candidates)):
+        for step, fixed in enumerate(repair_steps(candidate)):
+            try:
+                return json.loads(fixed, strict=False), index > 0 or step > 0
+            except json.JSONDecodeError as e:
+                error = error or e
+    raise ResponseParseError(f"no valid JSON in response: {error}")
+
+def repair_steps(text: str) -> Iterator[str]:
+    """依次产出原文和逐步修复后的文本，每一步在上一步的基础上只多做一种修复
+
+    修复顺序：去掉末尾多余的逗号、替换 Python 字面量、替换结构位置的中文引号。
+    中文引号最后处理，也只在结构位置替换，避免改动字符串值中合法的中文引号。
+    """
+    yield text
+    repairs = (
+        lambda text: TRAILING_COMMA_PATTERN.sub(r"\1", text),
+        lambda text: PYTHON_LITERAL_PATTERN.sub(lambda match: match.group(1) + PYTHON_LITERALS[match.group(2)], text),
+        lambda text: SMART_QUOTE_PATTERN.sub(lambda match: (match.group(1) or "") + '"', text),
+    )
+    for repair in repairs:
+        repaired = repair(text)
+        if repaired != text:
+            text = repaired
+            yield text
+
+def validate_response(parsed: Any, response_model: Optional[Type[BaseModel]] = None) -> dict:
+    """按推理阶段的 pydantic 模型校验并规范化字段（如 "true" 转为 true），未指定模型时只要求是 JSON 对象
+
+    Raises:
+        ResponseParseError: 不是 JSON 对象或不符合模型
+    """
+    if response_model is None:
+        if not isinstance(parsed, dict):
+            raise ResponseParseError(f"expected a JSON object, got {type(parsed).__name__}")
+        return parsed
+    try:
+        return response_model.model_validate(parsed).model_dump()
+    except ValidationError as e:
+        raise ResponseParseError(f"response does not match {response_model.__name__}: {e.errors(include_url=False)}") from e
+
+def parse_response(text: str, response_model: Optional[Type[BaseModel]] = None) -> Tuple[dict, bool]:
+    """提取、修复并校验单篇论文的回复
+
+    Returns:
+        (校验后的结果, 是否经过提取或修复)
+
+    Raises:
+        ResponseParseError: 回复无法恢复，需要重新请求
+    """
+    parsed, repaired = extract_json(text)
+    return validate_response(parsed, response_model), repaired
+
+def strict_schema(response_model: Type[BaseModel]) -> Optional[dict]:
+    """生成 strict 模式可以接受的 JSON schema：所有字段都列为必填，对象不允许额外字段，去掉默认值
+
+    研究兴趣编号这类动态键无法在 strict 模式下描述，RootModel 返回 None，调用方退回 json_object。
+    """
+    if issubclass(response_model, RootModel):
+        return None
+
+    def restrict(node: Any) -> Any:
+        if isinstance(node, list):
+            return [restrict(item) for item in node]
+        if not isinstance(node, dict):
+            return node
+        restricted = {}
+        for key, value in node.items():
+            if key in ("default", "title"):
+                continue
+            # properties 和 $defs 的键是字段名和模型名，不是 schema 关键字
+            if key in ("properties", "$defs"):
+                restricted[key] = {name: restrict(child) for name, child in value.items()}
+            else:
+                restricted[key] = restrict(value)
+        if restricted.get("type") == "object":
+            restricted["required"] = list(restricted.get("properties", {}))
+            restricted["additionalProperties"] = False
+        return restricted
+
+    return restrict(response_model.model_json_schema())
+
+class ResponseFormats:
+    """按模型记录服务端是否支持 response_format，一次运行中的所有推理阶段共用
+
+    Args:
+        mode: json_object 要求输出 JSON 对象；json_schema 同时按 strict schema 约束字段（需要模型支持，多兴趣回复的动态键无法约束，仍使用 json_object）；off 不使用
+    """
+
+    def __init__(self, mode: str = RESPONSE_FORMAT):
+        self.mode = mode
+        self.unsupported: Set[str] = set()
+
+    def params(self, model: str, response_model: Optional[Type[BaseModel]], expected_items: int = 1) -> dict:
+        """请求参数中的 response_format，打包请求的回复是 JSON 数组，不使用"""
+        if self.mode == "off" or model in self.unsupported or expected_items > 1:
+            return {}
+        schema = strict_schema(response_model) if self.mode == "json_schema" and response_model is not None else None
+        if schema is not None:
+            return {"response_format": {
+                "type": "json_schema",
+                "json_schema": {"name": response_model.__name__, "schema": schema, "strict": True}
+            }}
+        return {"response_format": {"type": "json_object"}}
+
+    def disable(self, model: str, error: Exception) -> None:
+        """携带 response_format 的请求失败而同样的普通请求成功时调用，本次运行不再对该模型使用"""
+        if model in self.unsupported:
+            return
+        self.unsupported.add(model)
+        metrics.inc("response_format_disabled_total", help_text="Models whose endpoint rejected response_format", model=model)
+        logger.warning(f"模型 {model} 不支持 response_format={self.mode}（{error}），本次运行退回普通请求")
+
+# 全局的 response_format 支持情况，一次运行中的所有推理阶段共用
+response_formats = ResponseFormats()
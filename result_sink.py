@@ -0,0 +1,38 @@
+import json
+import os
+from datetime import datetime
+from typing import Optional
+from logger import setup_logger
+
+logger = setup_logger(__name__)
+
+RESULTS_DIR = "arxiv_updates"
+
+def get_results_file() -> str:
+    """获取当天的分类结果文件路径"""
+    current_date = datetime.now().strftime("%Y-%m-%d")
+    return os.path.join(RESULTS_DIR, f"results_{current_date}.jsonl")
+
+class ResultSink:
+    """按完成顺序逐条写入分类结果的 JSONL 文件
+
+    每篇论文（无论是否相关）完成分类后立即追加一行并刷盘，
+    下游可以在筛选仍在进行时读取已完成的结果。
+    """
+
+    def __init__(self, results_file: Optional[str] = None):
+        self.results_file = results_file or get_results_file()
+        os.makedirs(os.path.dirname(self.results_file) or ".", exist_ok=True)
+        self.file = open(self.results_file, 'a', encoding='utf-8')
+        self.count = 0
+
+    def write(self, rss_url: str, user_interest: str, result: dict) -> None:
+        """写入一条分类结果"""
+        record = {"rss_url": rss_url, "user_interest": user_interest, **result}
+        self.file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self.file.flush()
+        self.count += 1
+
+    def close(self) -> None:
+        self.file.close()
+        logger.info(f"已写入 {self.count} 条分类结果到: {self.results_file}")
@@ -0,0 +1,323 @@
+"""基于 SQLite 的筛选结果库
+
+所有分类结果（包括不相关的论文）按 (arXiv id, feed, 研究兴趣, 日期) 保存，
+在 arXiv id、日期、研究兴趣和相关性上建有索引，生成feed、去重和统计时无需读取所有日期的 JSON 文件。
+arxiv_updates/<日期>.json 仍作为兼容格式导出。
+
+示例:
+    python result_store.py query --interest 音频 --start-date 2025-04-01
+    python result_store.py export --date 2025-04-14
+    python result_store.py compact
+"""
+import argparse
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from inference_cache import hash_text
+from logger import setup_logger
+from tracing import tracer
+from utils import extract_arxiv_id, is_related
+
+logger = setup_logger(__name__)
+
+ARXIV_UPDATES_DIR = "arxiv_updates"
+RESULT_STORE_FILE = os.path.join(ARXIV_UPDATES_DIR, "results.db")
+DATED_RESULT_PATTERN = re.compile(r"^(\d{4}-\d{2}-\d{2})\.json$")
+TEMP_SNAPSHOT_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}_temp_[\d-]+\.json$")
+OMITTED_FIELDS = ("content",)  # 可以由其他字段重新生成，不写入结果库
+RESULT_WRITE_BATCH_SIZE = 500  # 筛选时每累积这么多条结果在一个事务中写入一次
+LOOKUP_BATCH_SIZE = 500  # 按 arXiv id 批量查询时每条 SQL 的参数个数
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    arxiv_id TEXT NOT NULL,
+    rss_url TEXT NOT NULL,
+    interest_hash TEXT NOT NULL,
+    user_interest TEXT NOT NULL,
+    date TEXT NOT NULL,
+    is_related INTEGER NOT NULL,
+    success INTEGER NOT NULL,
+    paper TEXT NOT NULL,
+    updated_at REAL,
+    PRIMARY KEY (arxiv_id, rss_url, interest_hash, date)
+);
+CREATE INDEX IF NOT EXISTS idx_results_arxiv_id ON results (arxiv_id);
+CREATE INDEX IF NOT EXISTS idx_results_date ON results (date, is_related);
+CREATE INDEX IF NOT EXISTS idx_results_interest ON results (interest_hash, date, is_related);
+CREATE TABLE IF NOT EXISTS imported_files (
+    file_name TEXT PRIMARY KEY,
+    mtime REAL NOT NULL
+);
+"""
+
+def group_by_category(rows: Iterable[dict]) -> List[Dict]:
+    """将查询结果按 (日期, rss_url, user_interest) 分组为与日期 JSON 文件相同的格式"""
+    categories: List[Dict] = []
+    current_key = None
+    for row in rows:
+        key = (row.pop("date"), row["rss_url"], row["user_interest"])
+        rss_url = row.pop("rss_url")
+        user_interest = row.pop("user_interest")
+        if key != current_key:
+            categories.append({"rss_url": rss_url, "user_interest": user_interest, "filter_results": []})
+            current_key = key
+        categories[-1]["filter_results"].append(row)
+    return categories
+
+class ResultStore:
+    """基于 SQLite 的筛选结果库
+
+    每次写入在一个事务中完成，同一天重复筛选的结果覆盖之前的结果，
+    feed 的历史窗口、按研究兴趣和日期的查询都直接使用索引。
+    """
+
+    def __init__(self, db_file: str = RESULT_STORE_FILE):
+        self.db_file = db_file
+        os.makedirs(os.path.dirname(db_file) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(db_file)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def write_results(self, date: str, results: Iterable[Tuple[str, str, dict]]) -> int:
+        """在一个事务中批量写入分类结果，同一天重复写入的结果会被覆盖
+
+        Args:
+            date: 结果日期，格式 YYYY-MM-DD
+            results: (rss_url, user_interest, 分类结果) 列表
+
+        Returns:
+            写入的条数
+        """
+        now = time.time()
+        rows = []
+        for rss_url, user_interest, result in results:
+            paper = {key: value for key, value in result.items() if key not in OMITTED_FIELDS}
+            rows.append((
+                extract_arxiv_id(result["id"]), rss_url, hash_text(user_interest), user_interest, date,
+                int(is_related(result)), int(result.get("success") is True),
+                json.dumps(paper, ensure_ascii=False), now
+            ))
+        with tracer.span("result_store_write", "store", rows=len(rows)), self.conn:
+            self.conn.executemany(
+                """INSERT INTO results (arxiv_id, rss_url, interest_hash, user_interest, date, is_related, success, paper, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT (arxiv_id, rss_url, interest_hash, date) DO UPDATE SET
+                       is_related = excluded.is_related, success = excluded.success,
+                       paper = excluded.paper, updated_at = excluded.updated_at""",
+                rows
+            )
+        return len(rows)
+
+    def query(
+        self,
+        interest: Optional[str] = None,
+        interest_hash: Optional[str] = None,
+        rss_url: Optional[str] = None,
+        start_date: Optional[str] = None,
+        end_date: Optional[str] = None,
+        related_only: bool = True,
+        limit: Optional[int] = None
+    ) -> Iterator[dict]:
+        """按条件查询分类结果，新的日期在前
+
+        Args:
+            interest: 研究兴趣描述中包含的文字
+            interest_hash: 研究兴趣哈希的前缀（即指标中的 interest 标签）
+            rss_url: feed 地址
+            start_date: 起始日期（含）
+            end_date: 结束日期（含）
+            related_only: 是否只返回相关的论文
+            limit: 最多返回的条数
+
+        Yields:
+            包含 date、rss_url、user_interest 和论文字段的字典
+        """
+        conditions = []
+        params: List = []
+        if interest:
+            conditions.append("user_interest LIKE ?")
+            params.append(f"%{interest}%")
+        if interest_hash:
+            # GLOB 区分大小写，前缀匹配可以使用索引
+            conditions.append("interest_hash GLOB ?")
+            params.append(re.sub(r"[^0-9a-f]", "", interest_hash.lower()) + "*")
+        if rss_url:
+            conditions.append("rss_url = ?")
+            params.append(rss_url)
+        if start_date:
+            conditions.append("date >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("date <= ?")
+            params.append(end_date)
+        if related_only:
+            conditions.append("is_related = 1")
+        sql = "SELECT date, rss_url, user_interest, paper FROM results"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY date DESC, rss_url, interest_hash, rowid"
+        if limit:
+            sql += " LIMIT ?"
+            params.append(limit)
+        for row in self.conn.execute(sql, params):
+            yield {"date": row["date"], "rss_url": row["rss_url"], "user_interest": row["user_interest"], **json.loads(row["paper"])}
+
+    def is_empty(self) -> bool:
+        return self.conn.execute("SELECT 1 FROM results LIMIT 1").fetchone() is None
+
+    def has_result(self, arxiv_id: str, user_interest: str, related_only: bool = False) -> bool:
+        """该论文在该研究兴趣下是否已有分类结果"""
+        sql = "SELECT 1 FROM results WHERE arxiv_id = ? AND interest_hash = ?"
+        if related_only:
+            sql += " AND is_related = 1"
+        return self.conn.execute(sql + " LIMIT 1", (arxiv_id, hash_text(user_interest))).fetchone() is not None
+
+    def latest_results(self, arxiv_ids: Iterable[str]) -> Dict[Tuple[str, str], dict]:
+        """这些论文在每个研究兴趣下最近一次解析成功的分类结果
+
+        Returns:
+            (arXiv id, 研究兴趣) -> 包含 rss_url 和论文字段的字典
+        """
+        arxiv_ids = list(dict.fromkeys(arxiv_ids))
+        latest = {}
+        # 分批查询，避免超过 SQLite 的参数个数上限
+        for start in range(0, len(arxiv_ids), LOOKUP_BATCH_SIZE):
+            batch = arxiv_ids[start:start + LOOKUP_BATCH_SIZE]
+            rows = self.conn.execute(
+                f"SELECT arxiv_id, rss_url, user_interest, paper FROM results "
+                f"WHERE success = 1 AND arxiv_id IN ({', '.join('?' * len(batch))}) ORDER BY date, rowid",
+                batch
+            )
+            for row in rows:
+                latest[(row["arxiv_id"], row["user_interest"])] = {"rss_url": row["rss_url"], **json.loads(row["paper"])}
+        return latest
+
+    def window(self, window_days: int) -> List[Dict]:
+        """最近 window_days 天的相关论文，新的日期在前，同一兴趣下重复的论文（包括新版本）只保留最新的一次"""
+        start_date = (datetime.now() - timedelta(days=window_days - 1)).strftime("%Y-%m-%d")
+        seen = set()
+
+        def deduplicated() -> Iterator[dict]:
+            for row in self.query(start_date=start_date):
+                key = (extract_arxiv_id(row["id"]), row["user_interest"])
+                if key in seen:
+                    continue
+                seen.add(key)
+                yield row
+
+        return group_by_category(deduplicated())
+
+    def export_json(self, date: str, output_dir: str = ARXIV_UPDATES_DIR) -> str:
+        """将某一天的相关论文导出为 arxiv_updates/<日期>.json，返回文件路径"""
+        categories = group_by_category(self.query(start_date=date, end_date=date))
+        output_file = os.path.join(output_dir, f"{date}.json")
+        temp_file = output_file + ".tmp"
+        with open(temp_file, "w", encoding="utf-8") as f:
+            json.dump(categories, f, ensure_ascii=False, indent=2)
+        os.replace(temp_file, output_file)
+        # 导出的文件已经在库中，之后导入时跳过
+        self.mark_imported(os.path.basename(output_file), os.path.getmtime(output_file))
+        return output_file
+
+    def mark_imported(self, file_name: str, mtime: float) -> None:
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO imported_files (file_name, mtime) VALUES (?, ?) "
+                "ON CONFLICT (file_name) DO UPDATE SET mtime = excluded.mtime",
+                (file_name, mtime)
+            )
+
+    def import_dated_files(self, input_dir: str = ARXIV_UPDATES_DIR) -> int:
+        """导入结果库之外产生或修改过的日期 JSON 文件（如旧版本生成的历史结果），返回导入的文件数"""
+        if not os.path.isdir(input_dir):
+            return 0
+        imported = {row["file_name"]: row["mtime"] for row in self.conn.execute("SELECT * FROM imported_files")}
+        count = 0
+        for file_name in sorted(os.listdir(input_dir)):
+            match = DATED_RESULT_PATTERN.match(file_name)
+            if not match:
+                continue
+            path = os.path.join(input_dir, file_name)
+            mtime = os.path.getmtime(path)
+            if imported.get(file_name) == mtime:
+                continue
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    categories = json.load(f)
+            except Exception as e:
+                logger.error(f"读取JSON文件 {file_name} 时发生错误: {e}")
+                continue
+            self.write_results(match.group(1), (
+                (category["rss_url"], category["user_interest"], paper)
+                for category in categories
+                for paper in category["filter_results"]
+            ))
+            self.mark_imported(file_name, mtime)
+            count += 1
+            logger.info(f"已导入结果文件: {file_name}")
+        return count
+
+    def compact(self, input_dir: str = ARXIV_UPDATES_DIR) -> int:
+        """删除推理过程中留下的临时快照文件并整理数据库，返回删除的文件数"""
+        removed = 0
+        if os.path.isdir(input_dir):
+            for file_name in os.listdir(input_dir):
+                if TEMP_SNAPSHOT_PATTERN.match(file_name):
+                    os.remove(os.path.join(input_dir, file_name))
+                    removed += 1
+        self.conn.execute("VACUUM")
+        logger.info(f"已删除 {removed} 个临时快照文件")
+        return removed
+
+def add_results_arguments(parser: argparse.ArgumentParser) -> None:
+    subparsers = parser.add_subparsers(dest="results_command", required=True)
+
+    query_parser = subparsers.add_parser("query", help="按研究兴趣和日期范围查询结果")
+    query_parser.add_argument("--interest", help="研究兴趣描述中包含的文字")
+    query_parser.add_argument("--interest-hash", help="研究兴趣哈希的前缀")
+    query_parser.add_argument("--feed", help="feed 地址")
+    query_parser.add_argument("--start-date", help="起始日期（含），格式 YYYY-MM-DD")
+    query_parser.add_argument("--end-date", help="结束日期（含），格式 YYYY-MM-DD")
+    query_parser.add_argument("--all", action="store_true", help="同时返回不相关的论文")
+    query_parser.add_argument("--limit", type=int, help="最多返回的条数")
+
+    export_parser = subparsers.add_parser("export", help="导出某一天的结果为 arxiv_updates/<日期>.json")
+    export_parser.add_argument("--date", default=datetime.now().strftime("%Y-%m-%d"), help="导出的日期，默认今天")
+
+    subparsers.add_parser("import", help="导入 arxiv_updates 下的日期 JSON 文件")
+    subparsers.add_parser("compact", help="删除临时快照文件并整理数据库")
+
+def run_results_command(args: argparse.Namespace) -> int:
+    store = ResultStore()
+    try:
+        if args.results_command == "query":
+            for row in store.query(
+                interest=args.interest, interest_hash=args.interest_hash, rss_url=args.feed,
+                start_date=args.start_date, end_date=args.end_date, related_only=not args.all, limit=args.limit
+            ):
+                sys.stdout.write(json.dumps(row, ensure_ascii=False) + "\n")
+        elif args.results_command == "export":
+            logger.info(f"已导出: {store.export_json(args.date)}")
+        elif args.results_command == "import":
+            logger.info(f"共导入 {store.import_dated_files()} 个结果文件")
+        elif args.results_command == "compact":
+            store.compact()
+    finally:
+        store.close()
+    return 0
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="查询和维护筛选结果库")
+    add_results_arguments(parser)
+    return run_results_command(parser.parse_args(argv))
+
+if __name__ == "__main__":
+    sys.exit(main())
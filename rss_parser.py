@@ -0,0 +1,243 @@
+"""基于 lxml 的 arXiv RSS 流式解析
+
+feedparser 为每个条目构建完整的 FeedParserDict（包括 HTML 清洗和各种兼容字段），多分类合并的大 feed
+解析需要数秒并占用大量内存，而筛选只需要其中几个字段。这里用 lxml.etree.iterparse 逐个读取 <item>，
+只取 guid、title、link、dc:creator、pubDate、description 和 arxiv:announce_type，取完立即清除元素，
+解析过程中不保留整棵树。description 按 RSS 2.0 的约定是 HTML，与 feedparser 一样经过清洗（去掉 <script>、
+<style> 和事件属性等），其余字段原样保留。非 RSS 2.0 格式或缺少必要字段的 feed 抛出 UnsupportedFeed，由调用方退回 feedparser。
+
+示例:
+    python rss_parser.py record https://rss.arxiv.org/rss/cs.AI+cs.CL+cs.CV+cs.LG --output-dir fixtures
+    python rss_parser.py synthesize --sizes 2000 20000 --output-dir fixtures
+    python rss_parser.py benchmark fixtures/*.xml --repeat 5
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+from typing import Dict, Iterator, List, Optional, Union
+from xml.sax.saxutils import escape
+from feedparser.sanitizer import _sanitize_html
+from lxml import etree
+from utils import extract_announce_type, extract_version
+
+DC_NAMESPACE = "http://purl.org/dc/elements/1.1/"
+ARXIV_NAMESPACE = "http://arxiv.org/schemas/atom"
+
+# <item> 的子元素 -> 条目字段，与 get_rss.parse_feed 的输出一致
+ITEM_FIELDS = {
+    "guid": "id",
+    "title": "title",
+    "link": "link",
+    f"{{{DC_NAMESPACE}}}creator": "author",
+    "pubDate": "published",
+    "description": "summary",
+    f"{{{ARXIV_NAMESPACE}}}announce_type": "announce_type",
+}
+REQUIRED_ITEM_FIELDS = ("id", "title", "link", "author", "published", "summary")
+
+# <channel> 的子元素 -> feed 元信息字段
+CHANNEL_FIELDS = {
+    "title": "title",
+    "link": "link",
+    "lastBuildDate": "updated",
+    "pubDate": "published",
+}
+
+class UnsupportedFeed(ValueError):
+    """不是这里能处理的 RSS 2.0 feed，需要退回 feedparser"""
+
+def iter_entries(source: Union[bytes, io.IOBase], channel: Optional[dict] = None) -> Iterator[dict]:
+    """逐个产出 feed 中的条目，格式与 get_rss.parse_feed 的条目一致
+
+    Args:
+        source: feed 的原始字节或文件对象
+        channel: 传入时在解析过程中填入 feed 的元信息（title、link、updated、published），
+            arXiv 的 feed 中这些字段位于所有条目之前，读到第一个条目时已经可用
+
+    Raises:
+        etree.XMLSyntaxError: XML 格式错误
+        UnsupportedFeed: 根元素不是 <rss>，或条目缺少必要字段
+    """
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    channel = {} if channel is None else channel
+    context = etree.iterparse(
+        source, events=("start", "end"), remove_comments=True, resolve_entities=False, no_network=True, huge_tree=True
+    )
+    depth = 0
+    for event, element in context:
+        if event == "start":
+            if depth == 0 and element.tag != "rss":
+                raise UnsupportedFeed(f"root element is <{element.tag}>, not <rss>")
+            depth += 1
+            continue
+        depth -= 1
+        parent = element.getparent()
+        if element.tag == "item":
+            entry = {}
+            for child in element:
+                field = ITEM_FIELDS.get(child.tag)
+                if field is not None and field not in entry:
+                    entry[field] = (child.text or "").strip()
+            missing = [field for field in REQUIRED_ITEM_FIELDS if field not in entry]
+            if missing:
+                raise UnsupportedFeed(f"item without {', '.join(missing)}")
+            # 不含标签的摘要清洗前后相同，跳过清洗
+            if "<" in entry["summary"]:
+                entry["summary"] = _sanitize_html(entry["summary"], "utf-8", "text/html")
+            entry["announce_type"] = entry.get("announce_type") or extract_announce_type(entry["summary"])
+            entry["version"] = extract_version(entry["id"])
+            yield {field: entry[field] for field in (*REQUIRED_ITEM_FIELDS, "announce_type", "version")}
+            # 清除已读取的条目及之前的兄弟节点，内存占用不随条目数增长
+            element.clear()
+            while element.getprevious() is not None:
+                del parent[0]
+        elif depth == 2 and parent is not None and parent.tag == "channel":
+            field = CHANNEL_FIELDS.get(element.tag)
+            if field is not None and field not in channel:
+                channel[field] = (element.text or "").strip()
+
+def parse_rss(source: Union[bytes, io.IOBase]) -> dict:
+    """完整解析一个 feed，返回 {"feed": 元信息, "entries": 条目列表}
+
+    条目在产出后才转为列表：只有整个文档解析成功时才使用结果，出错时调用方可以整体退回 feedparser。
+
+    Raises:
+        etree.XMLSyntaxError: XML 格式错误
+        UnsupportedFeed: 不是 RSS 2.0 格式或缺少必要字段
+    """
+    channel: Dict[str, str] = {}
+    entries = list(iter_entries(source, channel))
+    missing = [field for field in ("title", "link") if field not in channel]
+    if missing:
+        raise UnsupportedFeed(f"channel without {', '.join(missing)}")
+    return {"feed": channel, "entries": entries}
+
+def synthesize_feed(size: int, seed: int = 0) -> bytes:
+    """生成格式与 arXiv RSS 一致的合成 feed，包含需要转义的字符、交叉列表和新版本条目"""
+    from benchmark import synthetic_entries
+    rng = random.Random(seed)
+    announce_types = ["new"] * 6 + ["cross"] * 2 + ["replace", "replace-cross"]
+    lines = [
+        '<?xml version=\'1.0\' encoding=\'UTF-8\'?>',
+        f'<rss xmlns:arxiv="{ARXIV_NAMESPACE}" xmlns:dc="{DC_NAMESPACE}" '
+        'xmlns:atom="http://www.w3.org/2005/Atom" xmlns:content="http://purl.org/rss/1.0/modules/content/" version="2.0">',
+        "<channel>",
+        "<title>cs.AI+cs.CL+cs.CV+cs.LG updates on arXiv.org</title>",
+        "<link>http://rss.arxiv.org/rss/cs.AI+cs.CL+cs.CV+cs.LG</link>",
+        "<description>cs.AI+cs.CL+cs.CV+cs.LG updates on the arXiv.org e-print archive.</description>",
+        "<language>en-us</language>",
+        "<lastBuildDate>Tue, 15 Apr 2025 00:30:23 +0000</lastBuildDate>",
+        "<pubDate>Tue, 15 Apr 2025 00:00:00 -0400</pubDate>",
+    ]
+    for entry in synthetic_entries(size, 0, rng):
+        announce_type = rng.choice(announce_types)
+        version = "v1" if announce_type in ("new", "cross") else f"v{rng.randint(2, 4)}"
+        arxiv_id = entry["link"].rsplit("/", 1)[-1]
+        abstract = entry["summary"].split("Abstract: ", 1)[1] + " We report F1 > 0.9 & \"robust\" results in $O(n<m)$ time."
+        lines.append(
+            f"<item><title>{escape(entry['title'])}</title><link>{entry['link']}</link>"
+            f"<description>{escape(f'arXiv:{arxiv_id}{version} Announce Type: {announce_type} ' + chr(10) + 'Abstract: ' + abstract)}</description>"
+            f'<guid isPermaLink="false">oai:arXiv.org:{arxiv_id}{version}</guid><category>cs.AI</category>'
+            f"<pubDate>{entry['published']}</pubDate><arxiv:announce_type>{announce_type}</arxiv:announce_type>"
+            "<dc:rights>http://arxiv.org/licenses/nonexclusive-distrib/1.0/</dc:rights>"
+            f"<dc:creator>{escape(entry['author'])}</dc:creator></item>"
+        )
+    lines.append("</channel></rss>")
+    return "\n".join(lines).encode("utf-8")
+
+def measure(parse, data: bytes, repeat: int) -> dict:
+    """多次解析取最短耗时，另外单独解析一次记录峰值内存（tracemalloc 会拖慢解析，不与计时同时进行）"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(data)
+        timings.append(time.perf_counter() - start)
+    tracemalloc.start()
+    parse(data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"seconds": min(timings), "peak_memory_mb": peak / 1024 / 1024}
+
+def run_benchmark(files: List[str], repeat: int) -> List[dict]:
+    """在同样的 feed 文件上比较 lxml 流式解析和 feedparser，并检查两者输出的条目是否一致"""
+    import feedparser
+    from get_rss import parse_feed
+
+    parsers = {
+        "lxml": parse_rss,
+        "feedparser": lambda data: parse_feed(feedparser.parse(data), "benchmark"),
+    }
+    results = []
+    for file_name in files:
+        with open(file_name, "rb") as f:
+            data = f.read()
+        outputs = {name: parse(data) for name, parse in parsers.items()}
+        result = {
+            "file": file_name,
+            "bytes": len(data),
+            "entries": len(outputs["lxml"]["entries"]),
+            "identical": outputs["lxml"]["entries"] == outputs["feedparser"]["entries"],
+        }
+        for name, parse in parsers.items():
+            result[name] = measure(parse, data, repeat)
+        result["speedup"] = result["feedparser"]["seconds"] / result["lxml"]["seconds"]
+        print(
+            f"{os.path.basename(file_name)}: {result['entries']} entries, "
+            f"lxml {result['lxml']['seconds']:.3f}s / {result['lxml']['peak_memory_mb']:.1f}MB, "
+            f"feedparser {result['feedparser']['seconds']:.3f}s / {result['feedparser']['peak_memory_mb']:.1f}MB, "
+            f"speedup {result['speedup']:.1f}x, identical={result['identical']}",
+            file=sys.stderr
+        )
+        results.append(result)
+    return results
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="arXiv RSS 解析器的测试数据和基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    record_parser = subparsers.add_parser("record", help="下载真实的 feed 保存为测试数据")
+    record_parser.add_argument("urls", nargs="+")
+    record_parser.add_argument("--output-dir", default="fixtures")
+    synthesize_parser = subparsers.add_parser("synthesize", help="生成格式与 arXiv RSS 一致的合成 feed")
+    synthesize_parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 20000], help="每个 feed 的条目数")
+    synthesize_parser.add_argument("--output-dir", default="fixtures")
+    synthesize_parser.add_argument("--seed", type=int, default=0)
+    benchmark_parser = subparsers.add_parser("benchmark", help="比较 lxml 流式解析和 feedparser 的耗时与峰值内存")
+    benchmark_parser.add_argument("files", nargs="+", help="feed 文件（record 或 synthesize 生成）")
+    benchmark_parser.add_argument("--repeat", type=int, default=3, help="每个文件的计时次数，取最短耗时")
+    benchmark_parser.add_argument("--output", help="结果输出的 JSON 文件，默认输出到标准输出")
+    args = parser.parse_args(argv)
+
+    if args.command in ("record", "synthesize"):
+        os.makedirs(args.output_dir, exist_ok=True)
+    if args.command == "record":
+        import httpx
+        for url in args.urls:
+            response = httpx.get(url, follow_redirects=True, timeout=60)
+            response.raise_for_status()
+            output_file = os.path.join(args.output_dir, url.rstrip("/").rsplit("/", 1)[-1] + ".xml")
+            with open(output_file, "wb") as f:
+                f.write(response.content)
+            print(f"{url} -> {output_file} ({len(response.content)} bytes)", file=sys.stderr)
+    elif args.command == "synthesize":
+        for size in args.sizes:
+            output_file = os.path.join(args.output_dir, f"synthetic_{size}.xml")
+            with open(output_file, "wb") as f:
+                f.write(synthesize_feed(size, args.seed))
+            print(f"{output_file} ({size} entries)", file=sys.stderr)
+    else:
+        output = json.dumps(run_benchmark(args.files, args.repeat), indent=2)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                f.write(output)
+        else:
+            print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
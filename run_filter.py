@@ -1,131 +1,543 @@
-from config import area_interest_list, SYSTEM_PROMPT
-from batch_inference import BatchInference
-from utils import replace_placeholder_in_prompt, extract_paper_summary, save_results
+from config import (
+    SYSTEM_PROMPT, MULTI_INTEREST_SYSTEM_PROMPT, MODEL_NAME,
+    CASCADE_ENABLED, GATE_MODEL_NAME, GATE_SYSTEM_PROMPT, SUMMARY_SYSTEM_PROMPT,
+    PREFILTER_ENABLED, PREFILTER_TOP_K, PREFILTER_MIN_KEEP_RATIO, PREFILTER_THRESHOLD,
+    MAX_CONCURRENCY, GATE_MAX_CONCURRENCY, SUMMARY_MAX_CONCURRENCY, RUN_DEADLINE_MINUTES, check_api_config
+)
+from batch_inference import BatchInference, CascadeInference, create_scheduler
+from scheduler import Deadline, RequestScheduler
+from subscriptions import SubscriptionRegistry
+from entry_store import EntryStore
+from inference_cache import InferenceCache
+from local_classifier import LocalClassifiers, LOCAL_DECISION, create_local_classifiers
+from journal import InferenceJournal
+from metrics import metrics, interest_label
+from tracing import tracer
+from prefilter import RelevancePrefilter, build_query
+from result_sink import ResultSink
+from generate_rss import FeedWriter, finish_feed, render_user_feeds
+from result_store import ResultStore, RESULT_WRITE_BATCH_SIZE
+from response_parser import MultiInterestDecision, PaperDecision, is_related
+from utils import replace_placeholder_in_prompt, extract_paper_summary, extract_abstract, extract_arxiv_id
 from logger import setup_logger
-import json
-from typing import List, Dict
-import asyncio
-import os
 from datetime import datetime
-import hashlib
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Set, Tuple
+import argparse
+import asyncio
 
 # 配置日志
 logger = setup_logger(__name__)
 
-CACHE_FILE = "rss_cache.json"
-RESULTS_CACHE_DIR = "arxiv_updates"
+CACHED_FIELDS = ("isRelated", "chineseSummary")  # 写入推理缓存的模型输出字段
+REPLACEMENT_TYPES = ("replace", "replace-cross")  # 已公告论文的新版本
+CROSS_LIST_SEEN = "cross_list_seen"
+REPLACEMENT_REUSED = "replacement_reused"
 
-def load_cache() -> Dict:
-    """加载缓存的RSS数据"""
-    if not os.path.exists(CACHE_FILE):
-        logger.error(f"缓存文件 {CACHE_FILE} 不存在")
-        return {}
-    
-    try:
-        with open(CACHE_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        logger.error(f"读取缓存文件失败: {str(e)}")
-        return {}
-
-def get_results_cache_file() -> str:
-    """获取当天的结果缓存文件路径"""
-    current_date = datetime.now().strftime("%Y-%m-%d")
-    return os.path.join(RESULTS_CACHE_DIR, f"batch_results_{current_date}.json")
-
-def load_results_cache() -> Dict:
-    """加载当天的batch inference结果缓存"""
-    cache_file = get_results_cache_file()
-    if not os.path.exists(cache_file):
-        return {}
-    
-    try:
-        with open(cache_file, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    except Exception as e:
-        logger.error(f"读取结果缓存文件失败: {str(e)}")
-        return {}
-
-def save_results_cache(results_cache: Dict) -> None:
-    """保存batch inference结果到缓存文件"""
-    # 创建目录
-    os.makedirs(RESULTS_CACHE_DIR, exist_ok=True)
-    
-    cache_file = get_results_cache_file()
-    try:
-        with open(cache_file, 'w', encoding='utf-8') as f:
-            json.dump(results_cache, f, ensure_ascii=False, indent=2)
-        logger.info(f"结果缓存已保存到: {cache_file}")
-    except Exception as e:
-        logger.error(f"保存结果缓存失败: {str(e)}")
-
-def generate_cache_key(rss_url: str, user_interest: str) -> str:
-    """生成缓存键值，使用哈希避免过长的user_interest"""
-    # 将 rss_url 和 user_interest 组合后生成哈希值
-    combined_content = f"{rss_url}|||{user_interest}"
-    hash_object = hashlib.md5(combined_content.encode('utf-8'))
-    return hash_object.hexdigest()
-
-async def filter_rss_content(rss_content: dict, user_interest: str, rss_url: str, results_cache: Dict) -> List[dict]:
-    """过滤RSS内容，支持缓存机制"""
-    cache_key = generate_cache_key(rss_url, user_interest)
-    
-    # 检查是否有缓存的结果
-    if cache_key in results_cache:
-        logger.info(f"使用缓存的batch inference结果: {rss_url}")
-        return results_cache[cache_key]
-    
-    logger.info(f"执行新的batch inference: {rss_url}")
+EarlierResults = Dict[Tuple[str, str], dict]  # (arXiv id, 研究兴趣) -> 之前最近一次成功的分类结果
+
+def prefilter_entries(entries: List[dict], queries: List[str], rss_url: str) -> List[dict]:
+    """用本地 BM25 预筛选剔除明显不相关的论文，未开启时原样返回"""
+    if not PREFILTER_ENABLED:
+        return entries
+    prefilter = RelevancePrefilter(
+        top_k=PREFILTER_TOP_K,
+        min_keep_ratio=PREFILTER_MIN_KEEP_RATIO,
+        threshold=PREFILTER_THRESHOLD
+    )
+    with tracer.span("prefilter", "prefilter", feed=rss_url, papers=len(entries)):
+        kept, pruned = prefilter.select(entries, queries)
+    prefilter.log_pruned(rss_url, kept, pruned)
+    return kept
+
+def priority_order(papers: List[dict], queries: List[str], deferred: Set[str]) -> List[int]:
+    """返回论文的推理顺序：上次运行推迟的论文优先，其余按与研究兴趣的 BM25 得分从高到低排列"""
+    scores = RelevancePrefilter().priorities(papers, queries)
+    return sorted(range(len(papers)), key=lambda i: (extract_arxiv_id(papers[i]["id"]) not in deferred, -scores[i]))
+
+def earlier_results(result_store: ResultStore, cache: Dict) -> EarlierResults:
+    """读取待筛选条目中交叉列表和新版本论文之前的分类结果"""
+    return result_store.latest_results(
+        extract_arxiv_id(entry["id"])
+        for feed in cache.values()
+        for entry in feed["entries"]
+        if entry.get("announce_type") == "cross" or entry.get("announce_type") in REPLACEMENT_TYPES
+    )
+
+def earlier_decision(paper_info: dict, user_interest: str, earlier: Optional[EarlierResults]) -> Tuple[Optional[str], Optional[dict]]:
+    """按公告类型决定是否沿用之前的分类结果
+
+    交叉列表（cross）的论文在该研究兴趣下已经在其他分类中判断过时跳过；
+    新版本（replace / replace-cross）的摘要与之前判断时相同则复用之前的判断，摘要变化时重新推理。
+
+    Returns:
+        (outcome, 判断结果)。跳过时为 (CROSS_LIST_SEEN, None)，复用时为 (REPLACEMENT_REUSED, 判断结果)，需要推理时为 (None, None)
+    """
+    announce_type = paper_info.get("announce_type")
+    if not earlier or (announce_type != "cross" and announce_type not in REPLACEMENT_TYPES):
+        return None, None
+    previous = earlier.get((extract_arxiv_id(paper_info["id"]), user_interest))
+    if previous is None:
+        return None, None
+    if announce_type == "cross":
+        return CROSS_LIST_SEEN, None
+    if extract_abstract(previous["summary"]) != extract_abstract(paper_info["summary"]):
+        return None, None
+    # 保留 decidedBy，本地分类器的判断复用后仍不作为训练数据
+    return REPLACEMENT_REUSED, {field: previous[field] for field in (*CACHED_FIELDS, "decidedBy") if field in previous}
+
+def with_content(paper_info: dict) -> dict:
+    """拼接送入模型的论文内容（标题和摘要）"""
+    with tracer.span("extract_paper_summary", "parse"):
+        return {**paper_info, "content": extract_paper_summary(paper_info)}
+
+def cache_key_for(paper_info: dict, user_interest: str, model_name: str) -> str:
+    """论文在推理缓存中的键"""
+    return InferenceCache.make_key(
+        extract_arxiv_id(paper_info["id"]),
+        extract_abstract(paper_info["summary"]),
+        user_interest,
+        model_name
+    )
+
+async def stream_rss_content(rss_content: dict, user_interest: str, rss_url: str, inference_cache: InferenceCache, journal: Optional[InferenceJournal] = None, keywords: Optional[List[str]] = None, schedulers: Optional[Dict[str, RequestScheduler]] = None, classifiers: Optional[LocalClassifiers] = None, deadline: Optional[Deadline] = None, earlier: Optional[EarlierResults] = None) -> AsyncIterator[dict]:
+    """过滤RSS内容，按完成顺序逐条产出每篇论文的分类结果
+
+    已推理过的论文直接复用缓存结果并最先产出，其余论文在送入模型前才拼接提示词内容。
+    earlier 为交叉列表和新版本论文之前的分类结果，已判断过的交叉列表不再产出，摘要未变的新版本复用之前的判断。
+    schedulers 为按阶段名共用的请求调度器，多个 (feed, 研究兴趣) 同时筛选时共用并发和限流额度。
+    classifiers 为本地分类器，可信时有把握判断为不相关的论文不再送入模型，否则只与模型的判断比较。
+    deadline 为运行截止时间，有截止时间时按优先级推理，到时仍未完成的论文产出带有 deferred 字段的条目。
+    请求失败的论文产出带有 failed 字段的条目，不写入结果，条目保持待筛选。
+    """
+    schedulers = schedulers or {}
+    deadline = deadline or Deadline()
     sys_prompt = replace_placeholder_in_prompt(SYSTEM_PROMPT, "user_interest", user_interest)
-    
-    paper_infos = rss_content["entries"]
-    for paper_info in paper_infos:
-        paper_info["content"] = extract_paper_summary(paper_info)
-
-    batch_inference = BatchInference()
-    results = await batch_inference.create_tasks(sys_prompt, paper_infos)
-
-    # 只保留isRelated为True，且success为True的paper_info
-    filtered_results = [res for res in results 
-               if res is not None 
-               and (res["isRelated"] is True or res["isRelated"] == "true")
-               and res["success"] is True]
-    
-    # 将结果保存到缓存
-    results_cache[cache_key] = filtered_results
-    
-    return filtered_results
+    labels = {"feed": rss_url, "interest": interest_label(user_interest)}
+    entries = prefilter_entries(rss_content["entries"], [build_query(user_interest, keywords or [])], rss_url)
+    metrics.inc("papers_total", len(rss_content["entries"]) - len(entries), help_text="Papers by outcome", outcome="prefiltered", **labels)
+    # 级联模式的结果同时取决于两个模型
+    model_name = f"{GATE_MODEL_NAME}+{MODEL_NAME}" if CASCADE_ENABLED else MODEL_NAME
 
-async def main():
-    cache = load_cache()
-    if not cache:
-        logger.error("无法获取缓存的RSS内容")
+    pending = []  # 缓存未命中、需要送入模型的论文
+    cache_hits = 0
+    outcomes = {CROSS_LIST_SEEN: 0, REPLACEMENT_REUSED: 0}
+    for paper_info in entries:
+        outcome, decision = earlier_decision(paper_info, user_interest, earlier)
+        if outcome is not None:
+            outcomes[outcome] += 1
+            if decision is not None:
+                yield {**with_content(paper_info), **decision, "success": True}
+            continue
+        cached = inference_cache.get(cache_key_for(paper_info, user_interest, model_name))
+        if cached is not None:
+            cache_hits += 1
+            yield {**with_content(paper_info), **cached, "success": True}
+        else:
+            pending.append(paper_info)
+
+    # 本地分类器判断为不相关的论文不写入推理缓存，缓存中只保存模型的判断
+    probabilities: List[float] = []  # 送入模型的论文的本地预测概率，用于影子模式比较
+    if classifiers is not None:
+        with tracer.span("local_classifier", "classify", papers=len(pending), **labels):
+            pending, decided, probabilities = classifiers.split(user_interest, pending, labels)
+        for paper_info in decided:
+            yield {
+                **with_content(paper_info),
+                "isRelated": False, "chineseSummary": "Unrelated", "success": True, "decidedBy": LOCAL_DECISION
+            }
+        metrics.inc("papers_total", len(decided), outcome="local", **labels)
+
+    if deadline.expires_at is not None:
+        order = priority_order(pending, [build_query(user_interest, keywords or [])], rss_content.get("deferred", set()))
+        pending = [pending[i] for i in order]
+        probabilities = [probabilities[i] for i in order] if probabilities else probabilities
+
+    logger.info(
+        f"{rss_url}: 缓存命中 {cache_hits} 篇，跳过已判断的交叉列表 {outcomes[CROSS_LIST_SEEN]} 篇，"
+        f"复用摘要未变的新版本 {outcomes[REPLACEMENT_REUSED]} 篇，需推理 {len(pending)} 篇"
+    )
+    metrics.inc("papers_total", cache_hits, outcome="cache_hit", **labels)
+    for outcome, count in outcomes.items():
+        metrics.inc("papers_total", count, outcome=outcome, **labels)
+    metrics.inc("papers_total", len(pending), outcome="inferred", **labels)
+    if not pending:
         return
 
-    # 加载当天的结果缓存
-    results_cache = load_results_cache()
-    
-    output = []
-    for item in area_interest_list:
+    def pending_contents() -> Iterator[dict]:
+        for paper_info in pending:
+            yield with_content(paper_info)
+
+    if CASCADE_ENABLED:
+        results = CascadeInference(journal=journal, labels=labels, schedulers=schedulers, deadline=deadline).stream_tasks(
+            replace_placeholder_in_prompt(GATE_SYSTEM_PROMPT, "user_interest", user_interest),
+            replace_placeholder_in_prompt(SUMMARY_SYSTEM_PROMPT, "user_interest", user_interest),
+            pending_contents()
+        )
+    else:
+        batch_inference = BatchInference(
+            journal=journal,
+            labels=labels,
+            # 共用调度器时 worker 数不必超过待推理的论文数
+            max_concurrency=min(MAX_CONCURRENCY, len(pending)),
+            scheduler=schedulers.get("main"),
+            deadline=deadline,
+            response_model=PaperDecision
+        )
+        results = batch_inference.stream_tasks(sys_prompt, pending_contents())
+    completed = set()
+    async for task_index, paper_info, res in results:
+        completed.add(task_index)
+        if res is None:
+            yield {**paper_info, "failed": True}
+            continue
+        # 只缓存解析成功的结果，失败的论文下次运行时重新推理
+        if res["success"] is True:
+            inference_cache.put(
+                cache_key_for(paper_info, user_interest, model_name),
+                {field: res[field] for field in CACHED_FIELDS if field in res}
+            )
+            if probabilities:
+                classifiers.record_shadow(user_interest, probabilities[task_index], is_related(res), labels)
+        yield res
+
+    # 到截止时间仍未完成的论文
+    deferred = [paper_info for task_index, paper_info in enumerate(pending) if task_index not in completed]
+    if deferred:
+        logger.warning(f"{rss_url}: 到达截止时间，{len(deferred)} 篇论文推迟到下次运行")
+        metrics.inc("papers_total", len(deferred), outcome="deferred", **labels)
+        for paper_info in deferred:
+            yield {**paper_info, "deferred": True}
+
+def format_interests(interests: List[str]) -> str:
+    """将多个研究兴趣编号后拼接，填入多兴趣系统提示词"""
+    return "\n\n".join(f"### Interest {index}\n{interest}" for index, interest in enumerate(interests, 1))
+
+async def stream_multi_interest(cache: Dict, interest_items: List[dict], inference_cache: InferenceCache, journal: Optional[InferenceJournal] = None, deadline: Optional[Deadline] = None, earlier: Optional[EarlierResults] = None) -> AsyncIterator[Tuple[str, str, dict]]:
+    """多兴趣模式：跨feed按arXiv id去重，每篇论文只请求一次模型，同时判断所有研究兴趣
+
+    每篇论文完成后，立即为它所在的每个 (feed, 研究兴趣) 组合产出一条结果。
+    已判断过的交叉列表在对应的研究兴趣下不再产出，摘要未变的新版本复用之前的判断。
+    到截止时间仍未完成的论文在它所在的每个 feed 下产出一条带有 deferred 字段的条目，
+    请求或解析失败、缺少部分研究兴趣判断的论文同样产出带有 failed 字段的条目。
+
+    Yields:
+        (rss_url, user_interest, 分类结果)
+    """
+    items = [item for item in interest_items if item["rss_url"] in cache]
+    interests = list(dict.fromkeys(item["area_interest"] for item in items))
+    sys_prompt = replace_placeholder_in_prompt(MULTI_INTEREST_SYSTEM_PROMPT, "user_interests", format_interests(interests))
+    interests_by_feed: Dict[str, List[str]] = {}
+    for item in items:
+        interests_by_feed.setdefault(item["rss_url"], []).append(item["area_interest"])
+
+    # 预筛选时每篇论文对所有研究兴趣打分，任意一个兴趣保留即保留
+    queries = list(dict.fromkeys(build_query(item["area_interest"], item.get("keywords", [])) for item in items))
+
+    # 跨feed去重，交叉列表的论文只保留一份，并记录它出现在哪些feed中
+    papers: Dict[str, dict] = {}
+    feeds_by_id: Dict[str, List[str]] = {}
+    for rss_url in interests_by_feed:
+        for paper_info in prefilter_entries(cache[rss_url]["entries"], queries, rss_url):
+            arxiv_id = extract_arxiv_id(paper_info["id"])
+            if arxiv_id not in papers:
+                papers[arxiv_id] = paper_info
+            feeds_by_id.setdefault(arxiv_id, []).append(rss_url)
+
+    skipped: Dict[str, Set[str]] = {}  # arXiv id -> 已判断过该交叉列表的研究兴趣
+
+    def emit(arxiv_id: str, decisions: Dict[str, dict]) -> Iterator[Tuple[str, str, dict]]:
+        paper_info = with_content(papers[arxiv_id])
+        for rss_url in feeds_by_id[arxiv_id]:
+            for user_interest in interests_by_feed[rss_url]:
+                if user_interest in decisions and user_interest not in skipped.get(arxiv_id, ()):
+                    yield rss_url, user_interest, {**paper_info, **decisions[user_interest], "success": True}
+
+    pending = []  # 至少有一个兴趣未命中缓存的论文
+    reused = 0
+    for arxiv_id, paper_info in papers.items():
+        abstract = extract_abstract(paper_info["summary"])
+        cache_keys = {interest: InferenceCache.make_key(arxiv_id, abstract, interest, MODEL_NAME) for interest in interests}
+        decisions = {}
+        for interest, cache_key in cache_keys.items():
+            outcome, decision = earlier_decision(paper_info, interest, earlier)
+            if outcome == CROSS_LIST_SEEN:
+                skipped.setdefault(arxiv_id, set()).add(interest)
+                continue
+            if decision is not None:
+                reused += 1
+                decisions[interest] = decision
+                continue
+            cached = inference_cache.get(cache_key)
+            if cached is not None:
+                decisions[interest] = cached
+        if len(decisions) + len(skipped.get(arxiv_id, ())) < len(interests):
+            pending.append((arxiv_id, cache_keys))
+        else:
+            for output in emit(arxiv_id, decisions):
+                yield output
+
+    logger.info(
+        f"多兴趣模式: 去重后共 {len(papers)} 篇论文，{len(interests)} 个研究兴趣，"
+        f"跳过已判断的交叉列表 {sum(len(values) for values in skipped.values())} 项，复用摘要未变的新版本 {reused} 项，需推理 {len(pending)} 篇"
+    )
+    # 多兴趣模式下一个请求覆盖所有 feed 和研究兴趣
+    labels = {"feed": "all", "interest": "all"}
+    metrics.inc("papers_total", len(papers) - len(pending), help_text="Papers by outcome", outcome="cache_hit", **labels)
+    metrics.inc("papers_total", len(pending), outcome="inferred", **labels)
+    if not pending:
+        return
+
+    deadline = deadline or Deadline()
+    if deadline.expires_at is not None:
+        deferred_ids = set().union(*(cache[rss_url].get("deferred", set()) for rss_url in interests_by_feed))
+        order = priority_order([papers[arxiv_id] for arxiv_id, _ in pending], queries, deferred_ids)
+        pending = [pending[i] for i in order]
+
+    def pending_contents() -> Iterator[dict]:
+        for arxiv_id, _ in pending:
+            yield with_content(papers[arxiv_id])
+
+    batch_inference = BatchInference(journal=journal, labels=labels, deadline=deadline, response_model=MultiInterestDecision)
+    completed = set()
+    async for task_index, _, res in batch_inference.stream_tasks(sys_prompt, pending_contents()):
+        completed.add(task_index)
+        arxiv_id, cache_keys = pending[task_index]
+        if res is None or res["success"] is not True:
+            for rss_url in feeds_by_id[arxiv_id]:
+                yield rss_url, interests_by_feed[rss_url][0], {**papers[arxiv_id], "failed": True}
+            continue
+        decisions = {}
+        complete = True
+        for index, interest in enumerate(interests, 1):
+            decision = res.get(str(index))
+            if not isinstance(decision, dict) or "isRelated" not in decision:
+                logger.warning(f"论文 {arxiv_id} 缺少兴趣 {index} 的判断结果")
+                complete = False
+                continue
+            decision = {field: decision[field] for field in CACHED_FIELDS if field in decision}
+            decisions[interest] = decision
+            inference_cache.put(cache_keys[interest], decision)
+        for output in emit(arxiv_id, decisions):
+            yield output
+        # 缺少部分判断的论文保持待筛选，下次运行时已缓存的兴趣直接复用，只重新请求缺少的部分
+        if not complete:
+            for rss_url in feeds_by_id[arxiv_id]:
+                yield rss_url, interests_by_feed[rss_url][0], {**papers[arxiv_id], "failed": True}
+
+    deferred = [arxiv_id for task_index, (arxiv_id, _) in enumerate(pending) if task_index not in completed]
+    if deferred:
+        logger.warning(f"多兴趣模式: 到达截止时间，{len(deferred)} 篇论文推迟到下次运行")
+        metrics.inc("papers_total", len(deferred), outcome="deferred", **labels)
+        for arxiv_id in deferred:
+            for rss_url in feeds_by_id[arxiv_id]:
+                yield rss_url, interests_by_feed[rss_url][0], {**papers[arxiv_id], "deferred": True}
+
+async def merge_streams(streams: List[AsyncIterator], buffer_size: int) -> AsyncIterator:
+    """同时消费多个异步迭代器，经有界队列按产出顺序合并"""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=buffer_size)
+    finished = object()
+
+    async def drain(stream: AsyncIterator) -> None:
+        async for item in stream:
+            await queue.put(item)
+
+    async def run() -> None:
+        tasks = [asyncio.create_task(drain(stream)) for stream in streams]
+        try:
+            await asyncio.gather(*tasks)
+        except Exception:
+            await queue.put(finished)
+            raise
+        finally:
+            for task in tasks:
+                task.cancel()
+        await queue.put(finished)
+
+    runner = asyncio.create_task(run())
+    try:
+        while True:
+            item = await queue.get()
+            if item is finished:
+                break
+            yield item
+        await runner
+    finally:
+        runner.cancel()
+
+async def stream_results(cache: Dict, interest_items: List[dict], inference_cache: InferenceCache, journal: InferenceJournal, multi_interest: bool, classifiers: Optional[LocalClassifiers] = None, deadline: Optional[Deadline] = None, earlier: Optional[EarlierResults] = None) -> AsyncIterator[Tuple[str, str, dict]]:
+    """按完成顺序产出所有 (rss_url, user_interest, 分类结果)
+
+    各个 (feed, 研究兴趣) 同时筛选并共用同一组调度器，并发名额在它们之间轮流分配，
+    订阅很大的 feed 不会让其他订阅一直等待。多兴趣模式下一个请求同时判断所有研究兴趣，不使用本地分类器。
+    有截止时间时，到时仍未完成的论文以带有 deferred 字段的条目产出。
+    earlier 为交叉列表和新版本论文之前的分类结果，用于跳过或复用之前的判断。
+    """
+    if multi_interest:
+        async for output in stream_multi_interest(cache, interest_items, inference_cache, journal, deadline, earlier):
+            yield output
+        return
+
+    schedulers = {
+        "main": create_scheduler(MAX_CONCURRENCY),
+        "gate": create_scheduler(GATE_MAX_CONCURRENCY),
+        "summary": create_scheduler(SUMMARY_MAX_CONCURRENCY)
+    }
+
+    async def stream_item(item: dict) -> AsyncIterator[Tuple[str, str, dict]]:
         rss_url = item["rss_url"]
         user_interest = item["area_interest"]
-        
-        if rss_url not in cache:
-            logger.warning(f"在缓存中未找到RSS内容: {rss_url}")
+        async for res in stream_rss_content(cache[rss_url], user_interest, rss_url, inference_cache, journal, item.get("keywords"), schedulers, classifiers, deadline, earlier):
+            yield rss_url, user_interest, res
+
+    streams = []
+    for item in interest_items:
+        if item["rss_url"] not in cache:
+            logger.info(f"没有待筛选的RSS条目: {item['rss_url']}")
             continue
-            
-        filter_results = await filter_rss_content(cache[rss_url], user_interest, rss_url, results_cache)
+        streams.append(stream_item(item))
+    async for output in merge_streams(streams, 2 * MAX_CONCURRENCY):
+        yield output
+
+async def main(multi_interest: bool = False, resume: bool = False, render_feed: bool = False, store: Optional[EntryStore] = None, registry: Optional[SubscriptionRegistry] = None, deadline_minutes: Optional[float] = None) -> List[dict]:
+    """筛选条目库中待筛选的论文
+
+    Args:
+        multi_interest: 是否使用多兴趣模式
+        resume: 是否读取当天的推理日志，只补跑未成功的任务
+        render_feed: 是否在筛选的同时逐条写入RSS feed
+        store: 调用方打开的条目库（单进程运行完整流程时与检查步骤共用），None 时自行打开并关闭
+        registry: 订阅注册表，None 时按配置加载
+        deadline_minutes: 筛选的时间预算（分钟），None 时使用 RUN_DEADLINE_MINUTES，0 表示不限时
+
+    Returns:
+        按 (rss_url, user_interest) 分组的筛选结果
+    """
+    deadline = Deadline((RUN_DEADLINE_MINUTES if deadline_minutes is None else deadline_minutes) * 60)
+    owns_store = store is None
+    if owns_store:
+        store = EntryStore()
+    result_store = ResultStore()
+    try:
+        return await filter_pending(store, result_store, registry or SubscriptionRegistry.load(), multi_interest, resume, render_feed, deadline)
+    finally:
+        result_store.close()
+        if owns_store:
+            store.close()
+
+async def filter_pending(store: EntryStore, result_store: ResultStore, registry: SubscriptionRegistry, multi_interest: bool, resume: bool, render_feed: bool, deadline: Deadline) -> List[dict]:
+    # 只读取条目库中新增或内容变化、尚未筛选的条目
+    cache = store.load_pending()
+    if not cache:
+        logger.info("没有待筛选的RSS条目")
+        return []
+    check_api_config()
+
+    # 加载按论文粒度的推理缓存
+    inference_cache = InferenceCache()
+    inference_cache.load()
+
+    # 推理日志：每完成一篇立即落盘，--resume 时跳过日志中已成功的任务
+    journal = InferenceJournal()
+    if resume:
+        journal.load()
+
+    # 所有用户的订阅合并去重，每个 (feed, 研究兴趣) 只筛选一次
+    interest_items = registry.interest_items()
+
+    # 本地分类器：按需用结果库中的历史判断重新训练
+    classifiers = None if multi_interest else create_local_classifiers(result_store, (item["area_interest"] for item in interest_items))
+
+    # 交叉列表和新版本论文之前的分类结果，须在本次写入结果之前读取
+    earlier = earlier_results(result_store, cache)
+
+    # 每篇论文完成分类后立即写入结果文件，相关的论文同时追加到feed，结果库按批在一个事务中写入
+    date = datetime.now().strftime("%Y-%m-%d")
+    sink = ResultSink()
+    feed_writer = FeedWriter() if render_feed else None
+    related: Dict[Tuple[str, str], List[dict]] = {}
+    deferred: Dict[str, Dict[str, dict]] = {}  # feed -> arXiv id -> 到截止时间仍未完成的条目
+    failed: Dict[str, Set[str]] = {}  # feed -> 请求或解析失败的 arXiv id
+    rows: List[Tuple[str, str, dict]] = []
+    try:
+        async for rss_url, user_interest, res in stream_results(cache, interest_items, inference_cache, journal, multi_interest, classifiers, deadline, earlier):
+            if res.get("deferred"):
+                deferred.setdefault(rss_url, {})[extract_arxiv_id(res["id"])] = res
+                continue
+            if res.get("failed"):
+                failed.setdefault(rss_url, set()).add(extract_arxiv_id(res["id"]))
+                continue
+            # 解析失败的结果照常写入以便排查，但条目保持待筛选
+            if res.get("success") is not True:
+                failed.setdefault(rss_url, set()).add(extract_arxiv_id(res["id"]))
+            sink.write(rss_url, user_interest, res)
+            rows.append((rss_url, user_interest, res))
+            if len(rows) >= RESULT_WRITE_BATCH_SIZE:
+                result_store.write_results(date, rows)
+                rows = []
+            if not is_related(res):
+                continue
+            related.setdefault((rss_url, user_interest), []).append(res)
+            if feed_writer is not None:
+                feed_writer.append(res, user_interest)
+    except BaseException:
+        if feed_writer is not None:
+            feed_writer.abort()
+        raise
+    finally:
+        sink.close()
+        # 中断时也保存已完成的结果
+        result_store.write_results(date, rows)
+
+    # 按原有的 (rss_url, user_interest) 组合输出结果
+    output = []
+    for item in interest_items:
+        key = (item["rss_url"], item["area_interest"])
+        if item["rss_url"] not in cache:
+            continue
+        filter_results = related.get(key, [])
+        metrics.inc("papers_total", len(filter_results), outcome="related", feed=key[0], interest=interest_label(key[1]))
         output.append({
-            "rss_url": rss_url,
-            "user_interest": user_interest,
+            "rss_url": key[0],
+            "user_interest": key[1],
             "filter_results": filter_results
         })
+
+    # 保存更新的推理缓存
+    logger.info(f"推理缓存命中 {inference_cache.hits} 次，未命中 {inference_cache.misses} 次")
+    inference_cache.save()
+    journal.close()
+    if classifiers is not None:
+        classifiers.save()
     
-    # 保存更新的结果缓存
-    save_results_cache(results_cache)
-    
-    # 保存最终输出
-    save_results(output)
+    # 导出当天的结果文件（兼容原有的 arxiv_updates/<日期>.json 格式）和本次运行的指标
+    result_store.export_json(date)
+    metrics.save()
+
+    # 结果保存后再标记条目已处理，中途失败时下次运行会重新筛选；推迟的条目下次运行时优先筛选，
+    # 请求或解析失败的条目不标记，保持待筛选
+    for feed_url, feed in cache.items():
+        feed_deferred = deferred.get(feed_url, {})
+        unfinished = feed_deferred.keys() | failed.get(feed_url, set())
+        store.mark_processed(feed_url, [entry for entry in feed["entries"] if extract_arxiv_id(entry["id"]) not in unfinished])
+        store.mark_deferred(feed_url, feed_deferred.values())
+    if failed:
+        logger.warning(f"共 {sum(len(ids) for ids in failed.values())} 个条目推理失败，保持待筛选，下次运行时重新推理")
+    if deferred:
+        logger.warning(f"到达截止时间，共 {sum(len(entries) for entries in deferred.values())} 个条目推迟到下次运行")
+
+    # 补上最近几天的历史条目，完成feed，多用户订阅时再按用户分发
+    if feed_writer is not None:
+        result_store.import_dated_files()
+        finish_feed(feed_writer, result_store)
+        if registry.multi_tenant:
+            render_user_feeds(registry.users(), result_store)
+    return output
 
 if __name__ == "__main__":
-    asyncio.run(main()) 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="使用LLM根据研究兴趣筛选arXiv论文")
+    parser.add_argument("--multi-interest", action="store_true", help="每篇论文只请求一次模型，同时判断所有研究兴趣")
+    parser.add_argument("--resume", action="store_true", help="读取当天的推理日志，只补跑未成功的任务")
+    parser.add_argument("--render-feed", action="store_true", help="筛选的同时逐条写入RSS feed，无需再运行 generate_rss.py")
+    parser.add_argument("--deadline", type=float, metavar="MINUTES", help="筛选的时间预算（分钟），到时未完成的论文推迟到下次运行，默认使用 RUN_DEADLINE_MINUTES")
+    args = parser.parse_args()
+    asyncio.run(main(multi_interest=args.multi_interest, resume=args.resume, render_feed=args.render_feed, deadline_minutes=args.deadline))
@@ -0,0 +1,252 @@
+import asyncio
+import random
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Optional
+from logger import setup_logger
+
+logger = setup_logger(__name__)
+
+CHARS_PER_TOKEN = 3  # 粗略估算 token 数时每个 token 对应的字符数
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算文本的 token 数，用于 TPM 限流预扣"""
+    return len(text) // CHARS_PER_TOKEN + 1
+
+def is_throttle_error(error: BaseException) -> bool:
+    """判断异常是否意味着服务端过载（429/5xx 或超时），需要降低并发"""
+    status_code = getattr(error, "status_code", None)
+    if status_code is not None:
+        return status_code == 429 or status_code >= 500
+    return isinstance(error, asyncio.TimeoutError) or "Timeout" in type(error).__name__
+
+def is_transient_error(error: BaseException) -> bool:
+    """判断异常是否为可重试的临时错误（过载、超时或连接失败）"""
+    return is_throttle_error(error) or "Connection" in type(error).__name__
+
+def backoff_delay(attempt: int, base_delay: float = 1.0, max_delay: float = 60.0) -> float:
+    """指数退避加随机抖动（full jitter），attempt 从 0 开始"""
+    return random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+
+class TokenBucket:
+    """令牌桶限流器
+
+    以 rate 个/秒的速度补充令牌，最多积攒 capacity 个，
+    acquire 在令牌不足时等待，等待者按先来先得的顺序获取。
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    async def acquire(self, amount: float = 1) -> None:
+        """获取 amount 个令牌，超过桶容量的请求按桶容量计算"""
+        amount = min(amount, self.capacity)
+        async with self.lock:
+            while True:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+
+    def adjust(self, delta: float) -> None:
+        """根据实际用量修正预扣的令牌（delta 为正表示多扣，负表示少扣）"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD 自适应并发限制器
+
+    请求成功且延迟正常时加性增大并发上限，遇到 429/5xx 时乘性减小，
+    同一个冷却窗口内的多次失败只减小一次。
+    名额不足时按组排队，空出的名额在有等待者的组之间轮流分配，
+    一个任务很多的组（如订阅人数很多的 feed）不会让其他组一直等待。
+    """
+
+    def __init__(
+        self,
+        initial_limit: int,
+        min_limit: int = 1,
+        max_limit: int = 64,
+        latency_threshold: float = 30.0,
+        decrease_factor: float = 0.5,
+        cooldown: float = 5.0
+    ):
+        self.limit = float(initial_limit)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_threshold = latency_threshold
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self.last_decrease_at = 0.0
+        # 组名 -> 等待者队列，按轮转顺序排列
+        self.waiters: "OrderedDict[str, Deque[asyncio.Future]]" = OrderedDict()
+
+    async def acquire(self, group: str = "default") -> None:
+        if not self.waiters and self.in_flight < int(self.limit):
+            self.in_flight += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self.waiters.setdefault(group, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 名额已经分配给了这个等待者，转交给下一个
+                self.in_flight -= 1
+                self._wake_waiters()
+            raise
+
+    async def release(self) -> None:
+        self.in_flight -= 1
+        self._wake_waiters()
+
+    def _wake_waiters(self) -> None:
+        """在有空闲名额时按组轮转唤醒等待者"""
+        while self.waiters and self.in_flight < int(self.limit):
+            group, queue = next(iter(self.waiters.items()))
+            future = queue.popleft()
+            if queue:
+                self.waiters.move_to_end(group)
+            else:
+                del self.waiters[group]
+            if future.done():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+    def on_success(self, latency: float) -> None:
+        """请求成功：延迟正常时每轮并发大约加 1"""
+        if latency <= self.latency_threshold and self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._wake_waiters()
+
+    def on_throttle(self) -> None:
+        """服务端过载：乘性减小并发上限"""
+        now = time.monotonic()
+        if now - self.last_decrease_at < self.cooldown:
+            return
+        self.last_decrease_at = now
+        old_limit = self.limit
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        logger.warning(f"检测到限流或服务端错误，并发上限 {old_limit:.1f} -> {self.limit:.1f}")
+
+class Deadline:
+    """一次运行的截止时间，seconds 为 None 或 0 时不限时"""
+
+    def __init__(self, seconds: Optional[float] = None):
+        self.expires_at = time.monotonic() + seconds if seconds else None
+
+    def remaining(self) -> Optional[float]:
+        """剩余秒数，不限时返回 None"""
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.expires_at is not None and time.monotonic() >= self.expires_at
+
+class LatencyWindow:
+    """最近 size 次成功请求的延迟，用于计算对冲请求的触发阈值"""
+
+    def __init__(self, size: int = 200):
+        self.values: Deque[float] = deque(maxlen=size)
+
+    def observe(self, latency: float) -> None:
+        self.values.append(latency)
+
+    def quantile(self, q: float) -> float:
+        ordered = sorted(self.values)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class RequestRecord:
+    """单次请求的记录，调用方在请求完成后填入实际 token 用量"""
+
+    def __init__(self, estimated_tokens: int):
+        self.estimated_tokens = estimated_tokens
+        self.used_tokens: Optional[int] = None
+        self.wait: float = 0.0  # 等待并发名额和限流令牌的时间
+        self.latency: Optional[float] = None
+
+class RequestScheduler:
+    """请求调度器：组合自适应并发、RPS 令牌桶和 TPM 令牌桶
+
+    同时记录最近的请求延迟，开启对冲时给出发送对冲请求前等待的时间（延迟的 hedge_quantile 分位数），
+    对冲请求数不超过请求总数的 hedge_max_ratio。
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = 64,
+        initial_concurrency: int = 8,
+        requests_per_second: float = 10.0,
+        tokens_per_minute: float = 1000000.0,
+        latency_threshold: float = 30.0,
+        hedge_quantile: Optional[float] = None,
+        hedge_min_samples: int = 20,
+        hedge_max_ratio: float = 0.1,
+        latency_window: int = 200
+    ):
+        self.limiter = AdaptiveConcurrencyLimiter(
+            initial_limit=initial_concurrency,
+            max_limit=max_concurrency,
+            latency_threshold=latency_threshold
+        )
+        self.request_bucket = TokenBucket(requests_per_second, max(1.0, requests_per_second))
+        self.token_bucket = TokenBucket(tokens_per_minute / 60, tokens_per_minute)
+        self.latencies = LatencyWindow(latency_window)
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_max_ratio = hedge_max_ratio
+        self.requests = 0
+        self.hedges = 0
+
+    def hedge_delay(self) -> Optional[float]:
+        """发送对冲请求前等待的秒数，未开启对冲、延迟样本不足或对冲次数已达上限时返回 None"""
+        if self.hedge_quantile is None or len(self.latencies.values) < self.hedge_min_samples:
+            return None
+        if self.hedges >= self.hedge_max_ratio * self.requests:
+            return None
+        return self.latencies.quantile(self.hedge_quantile)
+
+    @asynccontextmanager
+    async def request(self, estimated_tokens: int, group: str = "default") -> AsyncIterator[RequestRecord]:
+        """占用一个请求名额，期间完成一次模型调用
+
+        Args:
+            estimated_tokens: 预估的 token 数，用于 TPM 限流预扣
+            group: 公平调度的分组，名额不足时在各组之间轮流分配
+        """
+        record = RequestRecord(estimated_tokens)
+        self.requests += 1
+        wait_start = time.monotonic()
+        await self.limiter.acquire(group)
+        try:
+            await self.request_bucket.acquire()
+            await self.token_bucket.acquire(estimated_tokens)
+            start = time.monotonic()
+            record.wait = start - wait_start
+            try:
+                yield record
+            except Exception as e:
+                if is_throttle_error(e):
+                    self.limiter.on_throttle()
+                raise
+            record.latency = time.monotonic() - start
+            self.limiter.on_success(record.latency)
+            self.latencies.observe(record.latency)
+            if record.used_tokens is not None:
+                self.token_bucket.adjust(record.used_tokens - estimated_tokens)
+        finally:
+            await self.limiter.release()
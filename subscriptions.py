@@ -0,0 +1,128 @@
+import json
+import os
+import re
+import sqlite3
+from typing import Dict, List, Optional
+from config import area_interest_list
+from logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# 订阅文件（JSON 或 SQLite），未设置时使用 config.area_interest_list 作为唯一用户的订阅
+SUBSCRIPTIONS_FILE = os.getenv("SUBSCRIPTIONS_FILE", "")
+DEFAULT_USER = "default"
+USER_ID_PATTERN = re.compile(r"^[A-Za-z0-9_.-]+$")  # 用户 id 会用作feed文件名
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS subscriptions (
+    user_id TEXT NOT NULL,
+    rss_url TEXT NOT NULL,
+    area_interest TEXT NOT NULL,
+    keywords TEXT  -- JSON 数组
+);
+"""
+
+class SubscriptionRegistry:
+    """订阅注册表：记录每个用户订阅的 (feed, 研究兴趣)
+
+    所有用户的订阅合并去重后，每个 feed 只获取一次，每个 (feed, 研究兴趣) 只筛选一次，
+    结果再按用户分发到各自的feed，推理成本只随不同的研究兴趣数增长，与用户数无关。
+
+    JSON 文件格式:
+        {"users": {"alice": [{"rss_url": "...", "area_interest": "...", "keywords": ["..."]}]}}
+
+    SQLite 文件中读取 subscriptions 表（user_id, rss_url, area_interest, keywords）。
+    """
+
+    def __init__(self, subscriptions: List[dict], multi_tenant: bool = True):
+        """
+        Args:
+            subscriptions: 订阅列表，每项包含 user_id、rss_url、area_interest 和可选的 keywords
+            multi_tenant: 是否为多用户订阅，为 False 时只生成默认的 feed.xml
+        """
+        for subscription in subscriptions:
+            if not USER_ID_PATTERN.match(subscription["user_id"]):
+                raise ValueError(f"用户 id 只能包含字母、数字、下划线、点和连字符: {subscription['user_id']}")
+        self.subscriptions = subscriptions
+        self.multi_tenant = multi_tenant
+
+    @classmethod
+    def from_config(cls) -> "SubscriptionRegistry":
+        """使用 config.area_interest_list 作为默认用户的订阅"""
+        return cls([{**item, "user_id": DEFAULT_USER} for item in area_interest_list], multi_tenant=False)
+
+    @classmethod
+    def from_json(cls, path: str) -> "SubscriptionRegistry":
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        subscriptions = [
+            {**item, "user_id": user_id}
+            for user_id, items in data["users"].items()
+            for item in items
+        ]
+        return cls(subscriptions)
+
+    @classmethod
+    def from_sqlite(cls, path: str) -> "SubscriptionRegistry":
+        conn = sqlite3.connect(path)
+        try:
+            conn.executescript(SQLITE_SCHEMA)
+            rows = conn.execute(
+                "SELECT user_id, rss_url, area_interest, keywords FROM subscriptions ORDER BY rowid"
+            ).fetchall()
+        finally:
+            conn.close()
+        subscriptions = [
+            {
+                "user_id": user_id,
+                "rss_url": rss_url,
+                "area_interest": area_interest,
+                "keywords": json.loads(keywords) if keywords else []
+            }
+            for user_id, rss_url, area_interest, keywords in rows
+        ]
+        return cls(subscriptions)
+
+    @classmethod
+    def load(cls, path: Optional[str] = None) -> "SubscriptionRegistry":
+        """按文件扩展名加载订阅，未指定文件时使用 config 中的默认订阅"""
+        path = path or SUBSCRIPTIONS_FILE
+        if not path:
+            return cls.from_config()
+        if path.endswith((".db", ".sqlite", ".sqlite3")):
+            registry = cls.from_sqlite(path)
+        else:
+            registry = cls.from_json(path)
+        logger.info(
+            f"已加载订阅: {len(registry.users())} 个用户，{len(registry.feed_urls())} 个feed，"
+            f"{len(registry.interest_items())} 个 (feed, 研究兴趣) 组合"
+        )
+        return registry
+
+    def feed_urls(self) -> List[str]:
+        """所有用户订阅的 feed，去重后保持首次出现的顺序"""
+        return list(dict.fromkeys(subscription["rss_url"] for subscription in self.subscriptions))
+
+    def interest_items(self) -> List[dict]:
+        """去重后的 (feed, 研究兴趣) 组合，格式与 config.area_interest_list 相同
+
+        多个用户订阅了同一组合时合并他们的预筛选关键词。
+        """
+        items: Dict[tuple, dict] = {}
+        for subscription in self.subscriptions:
+            key = (subscription["rss_url"], subscription["area_interest"].strip())
+            item = items.setdefault(key, {"rss_url": key[0], "area_interest": key[1], "keywords": []})
+            for keyword in subscription.get("keywords", []):
+                if keyword not in item["keywords"]:
+                    item["keywords"].append(keyword)
+        return list(items.values())
+
+    def users(self) -> Dict[str, List[tuple]]:
+        """用户 id -> 该用户订阅的 (rss_url, area_interest) 列表"""
+        users: Dict[str, List[tuple]] = {}
+        for subscription in self.subscriptions:
+            key = (subscription["rss_url"], subscription["area_interest"].strip())
+            subscribed = users.setdefault(subscription["user_id"], [])
+            if key not in subscribed:
+                subscribed.append(key)
+        return users
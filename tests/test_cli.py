@@ -0,0 +1,17 @@
+import os
+import subprocess
+import sys
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_check_does_not_import_model_modules():
+    code = (
+        "import sys, cli\n"
+        "try:\n"
+        "    cli.main(['check', '--help'])\n"
+        "except SystemExit:\n"
+        "    pass\n"
+        "print(sorted(name for name in ('pydantic', 'response_parser', 'volcenginesdkarkruntime') if name in sys.modules))\n"
+    )
+    completed = subprocess.run([sys.executable, "-c", code], cwd=REPO_DIR, capture_output=True, text=True, check=True)
+    assert completed.stdout.strip().splitlines()[-1] == "[]"
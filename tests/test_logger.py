@@ -0,0 +1,26 @@
+import json
+import logging
+import queue
+from logger import JsonFormatter, NonBlockingQueueHandler
+
+def test_exception_kept_separate_from_message():
+    handler = NonBlockingQueueHandler(queue.Queue())
+    logger = logging.getLogger("test_logger.exception")
+    logger.propagate = False
+    logger.addHandler(handler)
+    try:
+        try:
+            raise ValueError("bad response")
+        except ValueError:
+            logger.exception("请求失败: %s", "task 3", extra={"task": 3})
+    finally:
+        logger.removeHandler(handler)
+
+    record = handler.queue.get_nowait()
+    entry = json.loads(JsonFormatter().format(record))
+    assert entry["message"] == "请求失败: task 3"
+    assert entry["task"] == 3
+    assert entry["exception"].startswith("Traceback")
+    assert "ValueError: bad response" in entry["exception"]
+    # 文本格式的控制台输出仍然带有异常栈
+    assert "ValueError: bad response" in logging.Formatter("%(message)s").format(record)
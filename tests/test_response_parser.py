@@ -0,0 +1,57 @@
+import pytest
+from response_parser import (
+    MultiInterestDecision, PaperDecision, ResponseFormats, ResponseParseError, extract_json, parse_response, strict_schema
+)
+
+def test_plain_json_is_not_repaired():
+    assert extract_json('{"isRelated": false}') == ({"isRelated": False}, False)
+
+def test_fenced_json():
+    text = '```json\n{"isRelated": true, "chineseSummary": "提出了新方法"}\n```'
+    assert extract_json(text) == ({"isRelated": True, "chineseSummary": "提出了新方法"}, True)
+
+def test_prose_wrapped_json():
+    text = 'Here is my answer:\n{"isRelated": false, "chineseSummary": "Unrelated"}\nHope this helps.'
+    assert extract_json(text) == ({"isRelated": False, "chineseSummary": "Unrelated"}, True)
+
+def test_trailing_comma():
+    assert extract_json('{"isRelated": true, "chineseSummary": "摘要",}') == ({"isRelated": True, "chineseSummary": "摘要"}, True)
+    assert extract_json('[{"isRelated": false,},]') == ([{"isRelated": False}], True)
+
+def test_python_literals():
+    assert extract_json('{"isRelated": True, "note": None}') == ({"isRelated": True, "note": None}, True)
+
+def test_smart_quotes_inside_string_are_kept():
+    text = '{"isRelated": true, "chineseSummary": "提出了“图大师”框架",}'
+    assert extract_json(text) == ({"isRelated": True, "chineseSummary": "提出了“图大师”框架"}, True)
+
+def test_structural_smart_quotes():
+    text = '{“isRelated”: true, “chineseSummary”: “提出了“图大师”框架”}'
+    assert extract_json(text) == ({"isRelated": True, "chineseSummary": "提出了“图大师”框架"}, True)
+
+def test_unrecoverable_response():
+    with pytest.raises(ResponseParseError):
+        extract_json('{"isRelated": false, "chi')
+
+def test_parse_response_validates_fields():
+    assert parse_response('{"isRelated": "true", "chineseSummary": "摘要"}', PaperDecision) == (
+        {"isRelated": True, "chineseSummary": "摘要"}, False
+    )
+    with pytest.raises(ResponseParseError):
+        parse_response('{"isRelated": true, "chineseSummary": " "}', PaperDecision)
+
+def test_multi_interest_response():
+    result, repaired = parse_response('```\n{"1": {"isRelated": false}, "2": {"isRelated": true, "chineseSummary": "摘要"},}\n```', MultiInterestDecision)
+    assert repaired
+    assert result == {"1": {"isRelated": False, "chineseSummary": "Unrelated"}, "2": {"isRelated": True, "chineseSummary": "摘要"}}
+
+def test_strict_schema_requires_all_fields():
+    schema = strict_schema(PaperDecision)
+    assert schema["required"] == ["isRelated", "chineseSummary"]
+    assert schema["additionalProperties"] is False
+    assert "default" not in schema["properties"]["chineseSummary"]
+
+def test_json_schema_falls_back_for_dynamic_keys():
+    formats = ResponseFormats("json_schema")
+    assert formats.params("model", PaperDecision)["response_format"]["json_schema"]["strict"] is True
+    assert formats.params("model", MultiInterestDecision) == {"response_format": {"type": "json_object"}}
@@ -0,0 +1,47 @@
+import os
+import feedparser
+import pytest
+from get_rss import parse_content, parse_feed
+from rss_parser import UnsupportedFeed, parse_rss
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+def read_fixture(name: str) -> bytes:
+    with open(os.path.join(FIXTURE_DIR, name), "rb") as f:
+        return f.read()
+
+def single_item_feed(description: str) -> bytes:
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rss xmlns:dc="http://purl.org/dc/elements/1.1/" version="2.0"><channel>'
+        "<title>cs.AI updates on arXiv.org</title><link>http://rss.arxiv.org/rss/cs.AI</link>"
+        "<lastBuildDate>Tue, 15 Apr 2025 04:00:35 +0000</lastBuildDate><pubDate>Tue, 15 Apr 2025 00:00:00 -0400</pubDate>"
+        "<item><title>Title</title><link>https://arxiv.org/abs/2504.00001</link>"
+        f"<description>{description}</description>"
+        '<guid isPermaLink="false">oai:arXiv.org:2504.00001v1</guid>'
+        "<pubDate>Tue, 15 Apr 2025 00:00:00 -0400</pubDate><dc:creator>Author</dc:creator></item>"
+        "</channel></rss>"
+    ).encode("utf-8")
+
+def test_fixture_matches_feedparser():
+    data = read_fixture("cs.AI.xml")
+    url = "http://rss.arxiv.org/rss/cs.AI"
+    feed = parse_content(data, url)
+    assert feed == parse_feed(feedparser.parse(data), url)
+    assert [entry["announce_type"] for entry in feed["entries"]] == ["new", "new", "cross", "replace", "replace-cross"]
+    assert [entry["version"] for entry in feed["entries"]] == [1, 1, 1, 3, 2]
+
+@pytest.mark.parametrize("description", [
+    "Abstract: safe &lt;script&gt;alert(1)&lt;/script&gt;text",
+    "Abstract: &lt;p onclick=&quot;x()&quot;&gt;styled&lt;/p&gt;&lt;style&gt;p {}&lt;/style&gt;",
+    "Abstract: bounds hold for $n &lt; m$ &amp; $m &gt; 0$",
+])
+def test_description_sanitized_like_feedparser(description):
+    data = single_item_feed(description)
+    entries = parse_rss(data)["entries"]
+    assert entries == parse_feed(feedparser.parse(data), "test")["entries"]
+    assert "script" not in entries[0]["summary"] and "onclick" not in entries[0]["summary"]
+
+def test_atom_feed_is_unsupported():
+    with pytest.raises(UnsupportedFeed):
+        parse_rss(b'<?xml version="1.0"?><feed xmlns="http://www.w3.org/2005/Atom"><title>t</title></feed>')
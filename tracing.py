@@ -0,0 +1,192 @@
+"""运行追踪与性能分析
+
+tracer 记录获取、解析、拼接论文内容、排队、模型调用、JSON 解析和生成 feed 等步骤的时间区间，
+导出为 Chrome trace event 格式（arxiv_updates/trace_<日期>_<时间>.json），
+可以在 chrome://tracing 或 https://ui.perfetto.dev 中按时间线查看。
+默认关闭，关闭时每个区间只有一次属性判断的开销。
+
+profiled() 用 cProfile 和 tracemalloc 包裹一次运行，在 arxiv_updates 下写出
+可用 snakeviz 等工具打开的 .prof 文件和包含耗时、内存排行的文本报告。
+"""
+import asyncio
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional
+from logger import setup_logger
+
+logger = setup_logger(__name__)
+
+TRACE_DIR = "arxiv_updates"
+MAX_TRACE_EVENTS = 500000  # 事件数上限，超出后丢弃新的事件，避免长时间运行占用过多内存
+PROFILE_TOP_FUNCTIONS = 50  # 文本报告中按累计耗时列出的函数数
+PROFILE_TOP_ALLOCATIONS = 30  # 文本报告中按分配大小列出的代码行数
+TRACEMALLOC_FRAMES = 10
+
+class Span:
+    """一个时间区间，退出时记录到 tracer，期间可以用 set() 补充参数"""
+
+    def __init__(self, tracer: "Tracer", name: str, category: str, lane: Optional[str], args: dict):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.lane = lane
+        self.args = args
+        self.start = 0.0
+
+    def set(self, **args) -> None:
+        self.args.update(args)
+
+    def __enter__(self) -> "Span":
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.tracer.complete(self.name, self.category, self.start, time.monotonic(), self.lane, **self.args)
+
+class NullSpan:
+    """追踪关闭时使用的空区间"""
+
+    def set(self, **args) -> None:
+        pass
+
+    def __enter__(self) -> "NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        pass
+
+NULL_SPAN = NullSpan()
+
+class Tracer:
+    """按 Chrome trace event 格式记录时间区间
+
+    每个区间属于一条时间线（lane），默认取当前 asyncio 任务名或线程名，
+    模型调用等步骤按 "<阶段> worker <编号>" 归到各个 worker 的时间线上。
+    """
+
+    def __init__(self, max_events: int = MAX_TRACE_EVENTS):
+        self.enabled = False
+        self.max_events = max_events
+        self.events: List[dict] = []
+        self.lanes: Dict[str, int] = {}
+        self.dropped = 0
+        self.pid = os.getpid()
+        self.origin = time.monotonic()
+
+    def enable(self) -> None:
+        self.enabled = True
+        self.events = []
+        self.lanes = {}
+        self.dropped = 0
+        self.origin = time.monotonic()
+
+    def span(self, name: str, category: str, lane: Optional[str] = None, **args):
+        """返回记录一个时间区间的上下文管理器
+
+        Args:
+            name: 区间名称
+            category: 分类，如 fetch、parse、queue、llm、render
+            lane: 时间线名称，默认取当前 asyncio 任务名或线程名
+            args: 附加在事件上的参数
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, category, lane, args)
+
+    def lane_id(self, lane: Optional[str]) -> int:
+        if lane is None:
+            try:
+                task = asyncio.current_task()
+            except RuntimeError:
+                task = None
+            lane = task.get_name() if task is not None else threading.current_thread().name
+        tid = self.lanes.get(lane)
+        if tid is None:
+            tid = len(self.lanes) + 1
+            self.lanes[lane] = tid
+            self.events.append({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": tid, "args": {"name": lane}})
+        return tid
+
+    def complete(self, name: str, category: str, start: float, end: float, lane: Optional[str] = None, **args) -> None:
+        """记录一个已经结束的区间，start 和 end 为 time.monotonic() 的读数"""
+        if not self.enabled:
+            return
+        if len(self.events) >= self.max_events:
+            self.dropped += 1
+            return
+        self.events.append({
+            "name": name,
+            "cat": category,
+            "ph": "X",
+            "ts": round((start - self.origin) * 1e6, 1),
+            "dur": round((end - start) * 1e6, 1),
+            "pid": self.pid,
+            "tid": self.lane_id(lane),
+            "args": args
+        })
+
+    def save(self, trace_dir: str = TRACE_DIR) -> Optional[str]:
+        """写出 trace 文件并返回路径，未开启时不写出"""
+        if not self.enabled:
+            return None
+        os.makedirs(trace_dir, exist_ok=True)
+        trace_file = os.path.join(trace_dir, f"trace_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}.json")
+        with open(trace_file, "w", encoding="utf-8") as f:
+            json.dump({
+                "traceEvents": self.events,
+                "displayTimeUnit": "ms",
+                "otherData": {"dropped_events": self.dropped}
+            }, f, ensure_ascii=False)
+        if self.dropped:
+            logger.warning(f"trace 事件数超过上限 {self.max_events}，丢弃了 {self.dropped} 个事件")
+        logger.info(f"trace 已保存到: {trace_file}")
+        return trace_file
+
+# 全局 tracer
+tracer = Tracer()
+
+@contextmanager
+def profiled(name: str, report_dir: str = TRACE_DIR) -> Iterator[None]:
+    """用 cProfile 和 tracemalloc 包裹一段运行，结束后写出报告
+
+    Args:
+        name: 报告文件名中的运行名称，如子命令名
+        report_dir: 报告目录
+    """
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        wall_time = time.perf_counter() - start
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        os.makedirs(report_dir, exist_ok=True)
+        prefix = os.path.join(report_dir, f"profile_{name}_{datetime.now().strftime('%Y-%m-%d_%H-%M-%S')}")
+        profiler.dump_stats(prefix + ".prof")
+        report = io.StringIO()
+        report.write(f"wall time: {wall_time:.3f}s\n")
+        report.write(f"traced memory: current {current / 2**20:.1f}MB, peak {peak / 2**20:.1f}MB\n\n")
+        report.write(f"== Top {PROFILE_TOP_FUNCTIONS} functions by cumulative time ==\n")
+        pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(PROFILE_TOP_FUNCTIONS)
+        report.write(f"== Top {PROFILE_TOP_ALLOCATIONS} allocations still held at exit (by line) ==\n")
+        for stat in snapshot.statistics("lineno")[:PROFILE_TOP_ALLOCATIONS]:
+            report.write(f"{stat}\n")
+        with open(prefix + ".txt", "w", encoding="utf-8") as f:
+            f.write(report.getvalue())
+        logger.info(f"性能分析报告已保存到: {prefix}.prof, {prefix}.txt（耗时 {wall_time:.1f}s，内存峰值 {peak / 2**20:.1f}MB）")
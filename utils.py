@@ -1,5 +1,6 @@
 from typing import List, Optional
 import os
+import re
 import json
 from datetime import datetime
 
@@ -12,6 +13,25 @@ def extract_abstract(summary: str) -> str:
         return summary
     return summary[abstract_start + len("Abstract:"):].strip()
 
+def extract_arxiv_id(entry_id: str) -> str:
+    """从RSS条目id（如 oai:arXiv.org:2504.01234v1）中提取不带版本号的 arXiv id"""
+    arxiv_id = entry_id.rsplit(":", 1)[-1]
+    return re.sub(r"v\d+$", "", arxiv_id)
+
+def extract_version(entry_id: str) -> int:
+    """从RSS条目id中提取版本号，没有版本号时视为第 1 版"""
+    match = re.search(r"v(\d+)$", entry_id)
+    return int(match.group(1)) if match else 1
+
+def extract_announce_type(summary: str) -> str:
+    """从RSS摘要开头的 "Announce Type: replace" 中提取公告类型，没有时视为新论文"""
+    match = re.search(r"Announce Type:\s*([\w-]+)", summary)
+    return match.group(1) if match else "new"
+
+def is_related(result: dict) -> bool:
+    """解析成功且判断为相关的结果，兼容旧版本结果中字符串形式的 "true" """
+    return result.get("success") is True and result.get("isRelated") in (True, "true")
+
 def extract_paper_summary(entry: dict) -> str:
     title = entry["title"]
     summary = entry["summary"]